@@ -1,6 +1,6 @@
 {
     "name": "PremaFirm AI Engine",
-    "version": "18.0.2.0.0",
+    "version": "18.0.2.1.0",
     "summary": "AI Pricing + Routing Engine for PremaFirm Logistics",
     "author": "PremaFirm",
     "license": "LGPL-3",
@@ -16,6 +16,7 @@
     "data": [
         "security/ir.model.access.csv",
         "data/load_sequence.xml",
+        "data/cron.xml",
         "views/crm_view.xml",
         "views/dispatch_stop_views.xml",
         "views/sale_order_view.xml",
@@ -0,0 +1,24 @@
+from odoo import SUPERUSER_ID, api
+
+from odoo.addons.premafirm_ai_engine.services.geo_utils import pack_polyline
+
+TABLE = "premafirm_mapbox_cache"
+
+
+def migrate(cr, version):
+    # Route polylines now live compressed in premafirm.mapbox.cache.geometry.
+    cr.execute(
+        "SELECT 1 FROM information_schema.columns WHERE table_name = %s AND column_name = 'polyline'",
+        [TABLE],
+    )
+    if not cr.fetchone():
+        return
+
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    cr.execute(f"SELECT id, polyline FROM {TABLE} WHERE COALESCE(polyline, '') != ''")
+    rows = cr.fetchall()
+    if rows:
+        env["premafirm.mapbox.cache.geometry"].create(
+            [{"cache_id": cache_id, "data": pack_polyline(polyline)} for cache_id, polyline in rows]
+        )
+    cr.execute(f"ALTER TABLE {TABLE} DROP COLUMN polyline")
@@ -12,6 +12,10 @@ from . import ai_log
 from . import ai_correction
 from . import premafirm_load
 from . import premafirm_booking
+from . import cache_eviction_mixin
 from . import mapbox_cache
+from . import geocode_cache
+from . import attachment_text
+from . import llm_cache
 
 from . import res_partner_extension
@@ -0,0 +1,20 @@
+from odoo import fields, models
+
+
+class PremafirmAttachmentText(models.Model):
+    _name = "premafirm.attachment.text"
+    _description = "Premafirm Extracted Attachment Text"
+
+    checksum = fields.Char(required=True, index=True, help="ir.attachment checksum of the parsed file.")
+    file_type = fields.Char(required=True, help="Lower-case file extension that picked the parser; PDF load scans are stored as pdf:load:<max pages>:<trailing pages>.")
+    parser_version = fields.Char(required=True)
+    text = fields.Text()
+    parsed_at = fields.Datetime(default=fields.Datetime.now, required=True)
+
+    _sql_constraints = [
+        (
+            "checksum_file_type_parser_unique",
+            "unique(checksum, file_type, parser_version)",
+            "Attachment text already cached for this file and parser version.",
+        ),
+    ]
@@ -0,0 +1,98 @@
+import logging
+from datetime import datetime, timedelta
+
+from odoo import api, fields, models
+
+_logger = logging.getLogger(__name__)
+
+
+class PremafirmCacheEvictionMixin(models.AbstractModel):
+    """Hit counters and TTL / LRU / size eviction shared by the persistent caches.
+
+    Inheriting models set ``_cache_param_prefix``: eviction reads the
+    ``<prefix>_ttl_days``, ``<prefix>_max_rows`` and ``<prefix>_max_mb`` system
+    parameters, falling back to the ``_cache_*`` defaults below.
+    """
+
+    _name = "premafirm.cache.eviction.mixin"
+    _description = "Premafirm Cache Eviction Mixin"
+
+    _cache_param_prefix = None
+    _cache_ttl_days = 30
+    _cache_max_rows = 20000
+    _cache_max_mb = 64
+
+    cached_at = fields.Datetime(default=fields.Datetime.now, required=True)
+    hit_count = fields.Integer(readonly=True, help="Lookups served from this row (counted when it is read from the database).")
+    last_hit_at = fields.Datetime(readonly=True, index=True)
+
+    def _record_hits(self):
+        """Count hits after commit, in their own transaction, so lookups never lock rows."""
+        postcommit = self.env.cr.postcommit
+        key = f"{self._name}.hits"
+        hits = postcommit.data.get(key)
+        if hits is None:
+            hits = postcommit.data[key] = {}
+            postcommit.add(lambda: self._flush_hits(hits))
+        for rec_id in self.ids:
+            hits[rec_id] = hits.get(rec_id, 0) + 1
+
+    def _flush_hits(self, hits):
+        if not hits:
+            return
+        values = ", ".join(["(%s, %s)"] * len(hits))
+        params = [value for item in sorted(hits.items()) for value in item]
+        try:
+            # Rows locked by a concurrent writer just miss this batch of hits.
+            with self.env.registry.cursor() as cr:
+                cr.execute(
+                    f'UPDATE "{self._table}" AS t SET hit_count = COALESCE(t.hit_count, 0) + v.hits, last_hit_at = %s '
+                    f"FROM (VALUES {values}) AS v(id, hits) "
+                    f'WHERE t.id = v.id AND t.id IN (SELECT id FROM "{self._table}" WHERE id = ANY(%s) FOR UPDATE SKIP LOCKED)',
+                    [datetime.utcnow()] + params + [list(hits)],
+                )
+        except Exception:
+            _logger.debug("%s hit counters not updated", self._name, exc_info=True)
+
+    def _cache_param(self, name, default):
+        value = self.env["ir.config_parameter"].sudo().get_param(f"{self._cache_param_prefix}_{name}")
+        return float(value or default)
+
+    def _cache_expired_query(self, stale_before):
+        """SQL and params selecting the ids of rows past their TTL."""
+        return f'SELECT id FROM "{self._table}" WHERE cached_at < %s', [stale_before]
+
+    def _cache_size_query(self):
+        """SQL returning the row count and the bytes those rows take up."""
+        return f'SELECT COUNT(*), COALESCE(SUM(pg_column_size(c.*)), 0) FROM "{self._table}" c'
+
+    @api.model
+    def _evict_cache(self):
+        """Drop rows past their TTL, then least recently / least often used rows over the row or size budget."""
+        ttl_days = self._cache_param("ttl_days", self._cache_ttl_days)
+        max_rows = int(self._cache_param("max_rows", self._cache_max_rows))
+        max_bytes = self._cache_param("max_mb", self._cache_max_mb) * 1024 * 1024
+        self.env.flush_all()
+
+        self.env.cr.execute(*self._cache_expired_query(datetime.utcnow() - timedelta(days=ttl_days)))
+        expired = [row[0] for row in self.env.cr.fetchall()]
+
+        self.env.cr.execute(self._cache_size_query())
+        total, size = self.env.cr.fetchone()
+        rows = total - len(expired)
+        excess = max(rows - max_rows, 0)
+        if rows and rows * size / total > max_bytes:
+            # Rows are about the same size, so the average converts bytes to rows.
+            row_bytes = size / total
+            excess = max(excess, int((rows * row_bytes - max_bytes) / row_bytes) + 1)
+        if excess:
+            self.env.cr.execute(
+                f'SELECT id FROM "{self._table}" WHERE NOT (id = ANY(%s)) '
+                "ORDER BY COALESCE(last_hit_at, cached_at) ASC, COALESCE(hit_count, 0) ASC, id ASC LIMIT %s",
+                [expired, excess],
+            )
+            expired += [row[0] for row in self.env.cr.fetchall()]
+        if expired:
+            self.browse(expired).unlink()
+        _logger.info("%s eviction: %s rows removed, %s kept", self._description, len(expired), max(rows - excess, 0))
+        return len(expired)
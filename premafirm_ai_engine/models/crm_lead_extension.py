@@ -1,5 +1,6 @@
 import json
 import re
+from contextlib import contextmanager
 from datetime import datetime, time, timedelta
 
 from zoneinfo import ZoneInfo
@@ -24,6 +25,9 @@ except Exception:
     _map_spec.loader.exec_module(_map_module)
     MapboxService = _map_module.MapboxService
 
+# cr.precommit.data key of the transaction's pending schedule recomputes.
+SCHEDULE_QUEUE_KEY = "premafirm.schedule_queue"
+
 
 class CrmLead(models.Model):
     _inherit = "crm.lead"
@@ -205,7 +209,117 @@ class CrmLead(models.Model):
             end = self.strict_delivery_end or end
         return start, end
 
-    def _compute_schedule(self, manual_stop=False):
+    def _schedule_queue(self):
+        """Pending recomputes of this transaction: ``{"leads": {lead_id: entry}, "depth": n}``.
+
+        An entry is ``False`` for a full pass, a stop id for a manual ETA edit, or
+        ``{"changed": stop_ids, "rerouted": stop_ids}`` for an incremental pass.
+        """
+        data = self.env.cr.precommit.data
+        queue = data.get(SCHEDULE_QUEUE_KEY)
+        if queue is None:
+            queue = data[SCHEDULE_QUEUE_KEY] = {"leads": {}, "depth": 0}
+            env = self.env
+
+            def flush_at_precommit():
+                env["crm.lead"]._flush_schedule_queue(force=True)
+                env.flush_all()
+
+            self.env.cr.precommit.add(flush_at_precommit)
+        return queue
+
+    def _queue_schedule_recompute(self, manual_stop=False, changed_stops=False, rerouted_stops=False):
+        """Mark leads for one ``_compute_schedule`` pass, run when the queue is flushed.
+
+        ``changed_stops`` (and ``rerouted_stops``, whose address moved) queue an
+        incremental pass; they merge with other incremental edits of the same lead,
+        while any other pending entry turns the pass into a full one. A
+        ``manual_stop`` pass only re-times the stops after that stop, so it is
+        only queued on its own; on top of other pending edits it becomes a full pass.
+        """
+        pending = self._schedule_queue()["leads"]
+        for lead in self:
+            entry = pending.get(lead.id, {"changed": set(), "rerouted": set()})
+            if manual_stop:
+                # Earlier edits (a reorder, a moved address) may sit before the
+                # manual stop, where a manual pass would never look.
+                pending[lead.id] = manual_stop.id if pending.get(lead.id, manual_stop.id) == manual_stop.id else False
+            elif changed_stops and isinstance(entry, dict):
+                entry["changed"].update(changed_stops.filtered(lambda stop: stop.lead_id == lead).ids)
+                if rerouted_stops:
+                    entry["rerouted"].update(rerouted_stops.filtered(lambda stop: stop.lead_id == lead).ids)
+                pending[lead.id] = entry
+            else:
+                pending[lead.id] = False
+
+    def _flush_schedule_queue(self, force=False):
+        """Run the queued recomputes, one per lead; inside ``_batch_schedule`` only when ``force``."""
+        queue = self.env.cr.precommit.data.get(SCHEDULE_QUEUE_KEY)
+        if not queue or (queue["depth"] and not force):
+            return
+        while queue["leads"]:
+            pending, queue["leads"] = queue["leads"], {}
+            leads = self.env["crm.lead"].browse(list(pending)).exists().with_context(skip_schedule_recompute=True)
+            full = leads.filtered(lambda lead: pending[lead.id] is False)
+            if full:
+                full._compute_schedule()
+            stops = self.env["premafirm.dispatch.stop"]
+            for lead in leads - full:
+                entry = pending[lead.id]
+                if isinstance(entry, dict):
+                    lead._compute_schedule(
+                        changed_stops=stops.browse(entry["changed"]).exists(),
+                        rerouted_stops=stops.browse(entry["rerouted"]).exists(),
+                    )
+                else:
+                    lead._compute_schedule(manual_stop=stops.browse(entry).exists())
+
+    @contextmanager
+    def _batch_schedule(self):
+        """Collect the schedule recomputes triggered inside the block and run them once per lead on exit."""
+        queue = self._schedule_queue()
+        queue["depth"] += 1
+        try:
+            yield self
+        finally:
+            queue["depth"] -= 1
+        if not queue["depth"]:
+            self._flush_schedule_queue()
+
+    def read(self, fields=None, load="_classic_read"):
+        # Convenience for clients only: server code reading leave_yard_at, ETAs or
+        # schedule_conflict as attributes must call _flush_schedule_queue() itself.
+        self._flush_schedule_queue()
+        return super().read(fields=fields, load=load)
+
+    @staticmethod
+    def _schedule_unchanged(stop, vals):
+        """True when writing ``vals`` would leave ``stop``'s stored schedule as it is."""
+        for fname, value in vals.items():
+            stored = stop[fname]
+            if isinstance(value, datetime):
+                # Datetimes are stored to the second.
+                if not stored or abs((stored - value).total_seconds()) >= 1.0:
+                    return False
+            elif isinstance(value, float):
+                if abs(float(stored or 0.0) - value) > 1e-6:
+                    return False
+            elif (stored or False) != (value or False):
+                return False
+        return True
+
+    def _compute_schedule(self, manual_stop=False, changed_stops=False, rerouted_stops=False):
+        """Route and time every stop of the leads.
+
+        ``manual_stop`` re-times the stops after a manually set ETA. ``changed_stops``
+        re-times from the earliest changed stop, re-routing only the legs into and
+        out of ``rerouted_stops``, and stops once ETAs match the stored ones again.
+        """
+        queue = self.env.cr.precommit.data.get(SCHEDULE_QUEUE_KEY)
+        if queue:
+            # A direct recompute satisfies whatever was queued for these leads.
+            for lead_id in self.ids:
+                queue["leads"].pop(lead_id, None)
         mapbox = MapboxService(self.env)
         for lead in self:
             if lead.schedule_locked:
@@ -230,11 +344,27 @@ class CrmLead(models.Model):
             if pallet_limit and total_pallets > pallet_limit:
                 raise UserError(f"Vehicle capacity exceeded: pallets {total_pallets:.0f} exceeds limit {pallet_limit:.0f}.")
 
+            positions = {stop.id: idx for idx, stop in enumerate(ordered)}
+            dirty = [] if manual_stop else sorted(positions[stop.id] for stop in (changed_stops or []) if stop.id in positions)
+            incremental = bool(dirty and lead.leave_yard_at)
+            legs = range(len(ordered))
+            if manual_stop or incremental:
+                # Leg ``idx`` ends at stop ``idx``; keep the stored result unless an endpoint moved
+                # or the leg was never routed.
+                moved = {positions[stop.id] for stop in (rerouted_stops or []) if stop.id in positions}
+                legs = [
+                    idx for idx, stop in enumerate(ordered)
+                    if idx in moved or idx - 1 in moved or not (stop.distance_km or stop.drive_minutes)
+                ]
+
             segment_data = []
-            prev_loc = yard_location
-            for stop in ordered:
-                stop_location = stop.full_address or stop.address
-                travel = mapbox.get_travel_time(prev_loc, stop_location)
+            locations = [yard_location] + [stop.full_address or stop.address for stop in ordered]
+            # Legs are looked up in the traffic bucket of their departure from the last schedule.
+            departures = mapbox.leg_departures(lead.leave_yard_at or vehicle_start, ordered)
+            pairs = [(locations[idx], locations[idx + 1], departures[idx]) for idx in legs]
+            travels = dict(zip(legs, mapbox.get_travel_times(pairs))) if legs else {}
+            for idx, stop in enumerate(ordered):
+                travel = travels.get(idx, {})
                 fallback_minutes = float(stop.drive_minutes or stop.drive_hours * 60.0 or 0.0)
                 drive_minutes = float(travel.get("drive_minutes") or fallback_minutes)
                 distance_km = float(travel.get("distance_km") or stop.distance_km or 0.0)
@@ -246,16 +376,24 @@ class CrmLead(models.Model):
                     "distance_km": distance_km,
                     "base_drive_minutes": drive_minutes,
                     "drive_minutes": adjusted_minutes,
-                    "map_url": travel.get("map_url"),
+                    "map_url": travel.get("map_url") if idx in travels else stop.map_url,
                 })
-                prev_loc = stop_location
 
             updates = {}
+            first_window_idx = next((idx for idx, seg in enumerate(segment_data) if lead._stop_window(seg["stop"])[0]), 0)
+            partial_from = None
             if manual_stop:
                 manual_idx = next((idx for idx, seg in enumerate(segment_data) if seg["stop"].id == manual_stop.id), 0)
                 current_time = manual_stop.estimated_arrival or manual_stop.scheduled_datetime or (vehicle_start + timedelta(minutes=(lead.DRIVER_PREP_BUFFER + lead.INSPECTION_TIME + lead.ENGINE_WARMUP)))
                 current_time = current_time + timedelta(minutes=float(manual_stop.service_duration or 30.0))
-                for idx in range(manual_idx + 1, len(segment_data)):
+                partial_from, last_dirty = manual_idx + 1, max([manual_idx] + list(legs))
+            elif incremental and dirty[0] and ordered[dirty[0] - 1].scheduled_end_datetime and not (has_window and dirty[0] <= first_window_idx):
+                # Stops before the first change keep their times; an edit at or before the first
+                # window moves the anchor the leave-yard time is planned back from, so it re-times fully.
+                current_time = ordered[dirty[0] - 1].scheduled_end_datetime
+                partial_from, last_dirty = dirty[0], max(dirty + list(legs))
+            if partial_from is not None:
+                for idx in range(partial_from, len(segment_data)):
                     seg = segment_data[idx]
                     eta = max(current_time + timedelta(minutes=seg["drive_minutes"]), vehicle_start)
                     start, end = lead._stop_window(seg["stop"])
@@ -267,7 +405,7 @@ class CrmLead(models.Model):
                         ):
                             raise UserError("Pickup/Delivery window impossible within vehicle constraints.")
                         conflict = True
-                    updates[seg["stop"].id] = {
+                    vals = {
                         "estimated_arrival": eta,
                         "scheduled_datetime": eta,
                         "scheduled_start_datetime": eta,
@@ -277,10 +415,15 @@ class CrmLead(models.Model):
                         "map_url": seg["map_url"],
                         "auto_scheduled": True,
                     }
+                    if lead._schedule_unchanged(seg["stop"], vals):
+                        if idx > last_dirty:
+                            # Past every edit and back on the stored times: the rest of the route is unchanged.
+                            break
+                    else:
+                        updates[seg["stop"].id] = vals
                     current_time = eta + timedelta(minutes=float(seg["stop"].service_duration or 30.0))
                 lead_leave_yard = lead.leave_yard_at or vehicle_start
             elif has_window:
-                first_window_idx = next((idx for idx, seg in enumerate(segment_data) if lead._stop_window(seg["stop"])[0]), 0)
                 arrival_times = {}
                 target = lead._stop_window(segment_data[first_window_idx]["stop"])[0]
                 arrival_times[first_window_idx] = target
@@ -347,17 +490,25 @@ class CrmLead(models.Model):
                     vals["scheduled_end_datetime"] = vals.get("scheduled_end_datetime") or (
                         vehicle_start + timedelta(minutes=float(stop.service_duration or 30.0))
                     )
-                if vals:
-                    stop.with_context(skip_schedule_recompute=True).write(vals)
+                if not vals:
+                    # Kept from the previous pass; its window still counts towards the lead's conflict.
+                    window_end = lead._stop_window(stop)[1]
+                    if window_end and stop.estimated_arrival and stop.estimated_arrival > window_end:
+                        conflict = True
                 start_dt = (vals or {}).get("scheduled_start_datetime") or stop.scheduled_start_datetime
                 end_dt = (vals or {}).get("scheduled_end_datetime") or stop.scheduled_end_datetime
                 if prev_end and start_dt and start_dt < prev_end:
                     conflict = True
                 prev_end = end_dt or prev_end
+            if manual_stop or incremental:
+                # Only the re-routed legs were looked up: warnings of the kept legs still
+                # apply, so add to them. A full pass rewrites the list.
+                warnings = (lead.schedule_api_warning or "").split(" | ") + warnings
+            ordered._write_schedule_values(updates)
             lead.write({
                 "leave_yard_at": lead_leave_yard,
                 "schedule_conflict": conflict or bool(lead_leave_yard and lead_leave_yard < vehicle_start),
-                "schedule_api_warning": " | ".join(dict.fromkeys([w for w in warnings if w])) if warnings else False,
+                "schedule_api_warning": " | ".join(dict.fromkeys([w for w in warnings if w])) or False,
             })
 
 
@@ -376,7 +527,7 @@ class CrmLead(models.Model):
             "weather_checked_at",
         }
         if not self.env.context.get("skip_schedule_recompute") and any(k in vals for k in schedule_triggers):
-            self.with_context(skip_schedule_recompute=True)._compute_schedule()
+            self._queue_schedule_recompute()
         return res
 
 
@@ -617,29 +768,35 @@ class CrmLead(models.Model):
                     raise UserError("Each load must have exactly one pickup and one delivery before quoting or creating Sales Orders.")
 
     def action_rebuild_loads_from_ai(self):
+        Load = self.env["premafirm.load"]
         for lead in self:
             lead.dispatch_stop_ids.write({"load_id": False})
-            loads = self.env["premafirm.load"].search([("lead_id", "=", lead.id)])
-            loads.sudo().unlink()
-            grouped_loads = {}
-            current_load = self.env["premafirm.load"]
+            Load.search([("lead_id", "=", lead.id)]).sudo().unlink()
+            # Group the stops in memory first, then create all loads at once and write each load's stops together.
+            groups = []
+            sections = {}
+            current = None
             for stop in lead.dispatch_stop_ids.sorted("sequence"):
                 section_key = stop.load_key or (stop.extracted_load_name or "").strip().lower() or False
                 if section_key:
-                    if section_key not in grouped_loads:
-                        vals = {"lead_id": lead.id}
-                        if stop.extracted_load_name:
-                            vals["name"] = stop.extracted_load_name
-                        grouped_loads[section_key] = self.env["premafirm.load"].create(vals)
-                    stop.load_id = grouped_loads[section_key]
+                    if section_key not in sections:
+                        sections[section_key] = len(groups)
+                        groups.append([stop.extracted_load_name, []])
+                    groups[sections[section_key]][1].append(stop.id)
                     continue
-
-                if stop.stop_type == "pickup" or not current_load:
-                    vals = {"lead_id": lead.id}
-                    if stop.extracted_load_name:
-                        vals["name"] = stop.extracted_load_name
-                    current_load = self.env["premafirm.load"].create(vals)
-                stop.load_id = current_load
+                if stop.stop_type == "pickup" or current is None:
+                    current = len(groups)
+                    groups.append([stop.extracted_load_name, []])
+                groups[current][1].append(stop.id)
+            vals_list = []
+            for name, _stop_ids in groups:
+                vals = {"lead_id": lead.id}
+                if name:
+                    vals["name"] = name
+                vals_list.append(vals)
+            loads = Load.create(vals_list)
+            for load, (_name, stop_ids) in zip(loads, groups):
+                self.env["premafirm.dispatch.stop"].browse(stop_ids).write({"load_id": load.id})
         return True
 
     @api.constrains("final_rate")
@@ -868,6 +1025,7 @@ class CrmLead(models.Model):
         self.ensure_one()
         from ..services.run_planner_service import RunPlannerService
 
+        self._flush_schedule_queue()
         planner = RunPlannerService(self.env)
         suggestions = planner.optimize_insertion_for_lead(self)
         if suggestions.get("feasible"):
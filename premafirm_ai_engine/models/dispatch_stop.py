@@ -135,17 +135,23 @@ class PremafirmDispatchStop(models.Model):
 
     @api.model_create_multi
     def create(self, vals_list):
-        for vals in vals_list:
-            if vals.get("lead_id") and not vals.get("sequence"):
-                sibling = self.search([("lead_id", "=", vals["lead_id"])], order="sequence desc", limit=1)
-                vals["sequence"] = (sibling.sequence + 1) if sibling else 1
+        missing = {vals["lead_id"] for vals in vals_list if vals.get("lead_id") and not vals.get("sequence")}
+        if missing:
+            # One grouped query for every lead, then number the new stops in memory.
+            next_sequence = {
+                lead.id: (max_sequence or 0) + 1
+                for lead, max_sequence in self._read_group([("lead_id", "in", list(missing))], ["lead_id"], ["sequence:max"])
+            }
+            for vals in vals_list:
+                if vals.get("lead_id") in missing and not vals.get("sequence"):
+                    vals["sequence"] = next_sequence.get(vals["lead_id"], 1)
+                    next_sequence[vals["lead_id"]] = vals["sequence"] + 1
         records = super().create(vals_list)
-        for stop in records:
-            if stop.lead_id and not stop.load_id:
-                stop._assign_default_load()
+        if not self.env.context.get("skip_default_load"):
+            records.filtered(lambda stop: stop.lead_id and not stop.load_id)._assign_default_load()
         leads = records.mapped("lead_id")
         if leads and not self.env.context.get("skip_schedule_recompute"):
-            leads.with_context(skip_schedule_recompute=True)._compute_schedule()
+            leads._queue_schedule_recompute()
         return records
 
     def write(self, vals):
@@ -185,30 +191,99 @@ class PremafirmDispatchStop(models.Model):
         if should_recompute_schedule and not self.env.context.get("skip_schedule_recompute"):
             leads = self.mapped("lead_id")
             for lead in leads:
-                manual_stop = self.filtered(lambda s: s.lead_id == lead)[:1] if manual_eta_change else False
-                lead.with_context(skip_schedule_recompute=True)._compute_schedule(manual_stop=manual_stop)
+                lead_stops = self.filtered(lambda s: s.lead_id == lead)
+                if manual_eta_change:
+                    lead._queue_schedule_recompute(manual_stop=lead_stops[:1])
+                elif "sequence" in vals:
+                    lead._queue_schedule_recompute()
+                else:
+                    # Re-time from the edited stops on; only an address change needs new legs.
+                    lead._queue_schedule_recompute(changed_stops=lead_stops, rerouted_stops=lead_stops if "address" in vals else False)
         return result
 
     def unlink(self):
         leads = self.mapped("lead_id")
         result = super().unlink()
         if leads and not self.env.context.get("skip_schedule_recompute"):
-            leads.with_context(skip_schedule_recompute=True)._compute_schedule()
+            leads.exists()._queue_schedule_recompute()
         return result
 
-    def _assign_default_load(self):
-        for stop in self:
-            if not stop.lead_id:
-                continue
-            if stop.load_id:
+    def _write_schedule_values(self, updates):
+        """Store per-stop schedule results ``{stop_id: vals}`` with one UPDATE per column set.
+
+        ETAs differ per stop, so ``write`` would run once per stop, each time
+        re-triggering the stored computes that depend on these columns. Here all
+        rows go out in a single ``UPDATE ... FROM (VALUES ...)`` and ``modified``
+        fires once for the batch, so drive hours, lead totals and load distances
+        recompute once. Only plain stored columns take this path; anything else
+        falls back to ``write``.
+
+        Write access is checked up front and ``write_uid``/``write_date`` are set
+        by the statement. Mail tracking is skipped on purpose: these are computed
+        schedule results, re-written by every pass, not user edits worth a
+        chatter message.
+        """
+        self.browse(list(updates)).check_access("write")
+        groups = {}
+        for stop_id, vals in updates.items():
+            if vals:
+                groups.setdefault(tuple(sorted(vals)), []).append((stop_id, vals))
+        for fnames, rows in groups.items():
+            stops = self.browse([stop_id for stop_id, _vals in rows])
+            field_list = [self._fields[fname] for fname in fnames]
+            if any(not field.store or not field.column_type or field.compute or field.related or field.translate for field in field_list):
+                for stop_id, vals in rows:
+                    self.browse(stop_id).with_context(skip_schedule_recompute=True).write(vals)
                 continue
-            ordered = stop.lead_id.dispatch_stop_ids.sorted(lambda s: (s.sequence, s.id))
-            current_load = self.env["premafirm.load"]
-            for current_stop in ordered:
-                if current_stop.stop_type == "pickup" or not current_load:
-                    current_load = self.env["premafirm.load"].create({"lead_id": stop.lead_id.id})
-                if not current_stop.load_id:
-                    current_stop.load_id = current_load
+            self.flush_model(fnames)
+            stops.modified(fnames, before=True)
+            placeholders = ", ".join(
+                "(%s, " + ", ".join(f"%s::{field.column_type[1]}" for field in field_list) + ")" for _row in rows
+            )
+            # In statement order: write_uid of the SET clause, then the VALUES rows.
+            params = [self.env.uid]
+            for stop_id, vals in rows:
+                stop = self.browse(stop_id)
+                params.append(stop_id)
+                params.extend(field.convert_to_cache(vals[field.name], stop) for field in field_list)
+            assignments = ", ".join(f'"{fname}" = v."{fname}"' for fname in fnames)
+            columns = ", ".join(f'"{fname}"' for fname in fnames)
+            self.env.cr.execute(
+                f'UPDATE "{self._table}" AS t SET {assignments}, write_uid = %s, write_date = (now() at time zone \'UTC\') '
+                f"FROM (VALUES {placeholders}) AS v(id, {columns}) WHERE t.id = v.id",
+                params,
+            )
+            stops.invalidate_recordset(list(fnames) + ["write_uid", "write_date"])
+            stops.modified(fnames)
+
+    def read(self, fields=None, load="_classic_read"):
+        # Stop ETAs are only current once the queued lead schedules have run. Convenience
+        # for clients only: server code reading them as attributes must call
+        # crm.lead._flush_schedule_queue() itself.
+        self.env["crm.lead"]._flush_schedule_queue()
+        return super().read(fields=fields, load=load)
+
+    def _assign_default_load(self):
+        """Give load-less stops the load of their pickup segment, creating one where the segment has none."""
+        segments = []
+        for lead in self.filtered("lead_id").lead_id:
+            started = False
+            for stop in lead.dispatch_stop_ids.sorted(lambda s: (s.sequence, s.id)):
+                if stop.stop_type == "pickup" or not started:
+                    segments.append({"lead": lead, "load": stop.load_id, "stops": self.browse()})
+                    started = True
+                segment = segments[-1]
+                if stop.load_id:
+                    segment["load"] = segment["load"] or stop.load_id
+                else:
+                    segment["stops"] |= stop
+        segments = [segment for segment in segments if segment["stops"]]
+        missing = [segment for segment in segments if not segment["load"]]
+        if missing:
+            for segment, load in zip(missing, self.env["premafirm.load"].create([{"lead_id": segment["lead"].id} for segment in missing])):
+                segment["load"] = load
+        for segment in segments:
+            segment["stops"].write({"load_id": segment["load"].id})
 
     @api.onchange("address")
     def _onchange_address_country(self):
@@ -0,0 +1,23 @@
+from odoo import fields, models
+
+
+class PremafirmGeocodeCache(models.Model):
+    _name = "premafirm.geocode.cache"
+    _description = "Premafirm Mapbox Geocode Cache"
+
+    address_key = fields.Char(required=True, index=True)
+    address = fields.Char()
+    latitude = fields.Float(digits=(10, 7))
+    longitude = fields.Float(digits=(10, 7))
+    full_address = fields.Char()
+    short_address = fields.Char()
+    country_code = fields.Char()
+    city = fields.Char()
+    region = fields.Char()
+    postal_code = fields.Char()
+    place_categories = fields.Char()
+    fetched_at = fields.Datetime(default=fields.Datetime.now, required=True, index=True)
+
+    _sql_constraints = [
+        ("address_key_unique", "unique(address_key)", "Geocode cache entry already exists for this address."),
+    ]
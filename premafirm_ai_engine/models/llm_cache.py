@@ -0,0 +1,41 @@
+from odoo import api, fields, models
+
+from ..services.ai_extraction_service import AIExtractionService
+
+
+class PremafirmLlmCache(models.Model):
+    _name = "premafirm.llm.cache"
+    _inherit = ["premafirm.cache.eviction.mixin"]
+    _description = "Premafirm LLM Response Cache"
+
+    # Eviction settings: premafirm.llm_cache_ttl_days / _max_rows / _max_mb.
+    _cache_param_prefix = "premafirm.llm_cache"
+    _cache_ttl_days = AIExtractionService.LLM_CACHE_TTL_DAYS
+    _cache_max_rows = 20000
+    _cache_max_mb = 64
+
+    key = fields.Char(required=True, help="sha256 of the model, prompt version and rendered prompts.")
+    model_name = fields.Char(required=True)
+    prompt_version = fields.Char(required=True)
+    source_label = fields.Char()
+    response = fields.Text(help="Parsed JSON answer of the model.")
+
+    _sql_constraints = [
+        ("key_unique", "unique(key)", "LLM response already cached for this prompt."),
+    ]
+
+    @api.model
+    def get_cache_stats(self):
+        """Hit/miss/refresh counters of this worker, its hit rate and the stored row and hit totals."""
+        stats = AIExtractionService.llm_cache_stats()
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        self.flush_model(["hit_count"])
+        self.env.cr.execute(f'SELECT COUNT(*), COALESCE(SUM(hit_count), 0) FROM "{self._table}"')
+        stats["rows"], stats["stored_hits"] = self.env.cr.fetchone()
+        return stats
+
+    @api.model
+    def _cron_evict_llm_cache(self):
+        """Nightly: drop rows past their TTL, then least recently / least often used rows over the row or size budget."""
+        return self._evict_cache()
@@ -1,19 +1,127 @@
-from odoo import fields, models
+from odoo import api, fields, models
+
+from ..services.geo_utils import pack_polyline, unpack_polyline
+from ..services.mapbox_service import ESTIMATE_LEG_RESOLVER_KEY, LEG_RESOLVER_KEY, MapboxService
+from ..services.route_warmup_service import RouteWarmupService
 
 
 class PremafirmMapboxCache(models.Model):
     _name = "premafirm.mapbox.cache"
+    _inherit = ["premafirm.cache.eviction.mixin"]
     _description = "Premafirm Mapbox Route Cache"
 
+    # Eviction settings: premafirm.route_cache_ttl_days / _max_rows / _max_mb.
+    _cache_param_prefix = "premafirm.route_cache"
+    _cache_ttl_days = MapboxService.ROUTE_CACHE_TTL_DAYS
+    _cache_max_rows = 200000
+    _cache_max_mb = 256
+
     origin = fields.Char(required=True, index=True)
     destination = fields.Char(required=True, index=True)
     waypoint_hash = fields.Char(index=True)
-    departure_hour = fields.Integer(index=True)
+    departure_hour = fields.Integer(index=True, help="1 + first local hour of the week of the departure bucket; 0 for untimed legs.")
     distance_km = fields.Float()
     duration_minutes = fields.Float()
-    polyline = fields.Text()
-    cached_at = fields.Datetime(default=fields.Datetime.now, required=True)
+    polyline = fields.Text(
+        compute="_compute_polyline",
+        inverse="_inverse_polyline",
+        help="Encoded route polyline, stored compressed in premafirm.mapbox.cache.geometry.",
+    )
 
     _sql_constraints = [
         ("origin_destination_departure_idx", "unique(origin, destination, waypoint_hash, departure_hour)", "Cache entry already exists for this route."),
     ]
+
+    def init(self):
+        # Covering index: key lookups read the scalar columns without visiting the table.
+        self.env.cr.execute(
+            f"CREATE INDEX IF NOT EXISTS {self._table}_lookup_idx ON {self._table} "
+            "(origin, destination, waypoint_hash, departure_hour) INCLUDE (distance_km, duration_minutes, cached_at)"
+        )
+
+    def _compute_polyline(self):
+        geometries = self.env["premafirm.mapbox.cache.geometry"].search([("cache_id", "in", self.ids)])
+        polylines = {geometry.cache_id.id: unpack_polyline(geometry.data) for geometry in geometries}
+        for rec in self:
+            rec.polyline = polylines.get(rec.id, False)
+
+    def _inverse_polyline(self):
+        Geometry = self.env["premafirm.mapbox.cache.geometry"]
+        geometries = {geometry.cache_id.id: geometry for geometry in Geometry.search([("cache_id", "in", self.ids)])}
+        for rec in self:
+            geometry = geometries.get(rec.id)
+            if rec.polyline and geometry:
+                geometry.data = pack_polyline(rec.polyline)
+            elif rec.polyline:
+                Geometry.create({"cache_id": rec.id, "data": pack_polyline(rec.polyline)})
+            elif geometry:
+                geometry.unlink()
+
+    def _route_cache_keys(self):
+        return [(rec.origin, rec.destination, rec.waypoint_hash or "", rec.departure_hour or 0) for rec in self]
+
+    def _invalidate_route_memory_cache(self, keys=None):
+        MapboxService.invalidate_route_cache(self.env.cr.dbname, keys if keys is not None else self._route_cache_keys())
+        # Legs this transaction already resolved may come from the rows that changed.
+        self.env.cr.precommit.data.pop(LEG_RESOLVER_KEY, None)
+        self.env.cr.precommit.data.pop(ESTIMATE_LEG_RESOLVER_KEY, None)
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        records._invalidate_route_memory_cache()
+        return records
+
+    def write(self, vals):
+        old_keys = self._route_cache_keys()
+        res = super().write(vals)
+        self._invalidate_route_memory_cache(old_keys + self._route_cache_keys())
+        return res
+
+    def unlink(self):
+        keys = self._route_cache_keys()
+        res = super().unlink()
+        self._invalidate_route_memory_cache(keys)
+        return res
+
+    @api.model
+    def get_memory_cache_stats(self):
+        """Hit/miss counters of this worker's in-process route LRU."""
+        return MapboxService.route_cache_stats()
+
+    @api.model
+    def _cron_warm_route_cache(self):
+        """Nightly: pre-fetch geocodes and routes of the busiest lanes (see ``RouteWarmupService``)."""
+        return RouteWarmupService(self.env).run()
+
+    def _cache_expired_query(self, stale_before):
+        # Stale rows are still served and refreshed while in use; only drop those
+        # nobody looked up since they went stale.
+        return (
+            f'SELECT id FROM "{self._table}" WHERE cached_at < %s AND COALESCE(last_hit_at, cached_at) < %s',
+            [stale_before, stale_before],
+        )
+
+    def _cache_size_query(self):
+        geometry_table = self.env["premafirm.mapbox.cache.geometry"]._table
+        return (
+            f'SELECT COUNT(*), COALESCE(SUM(pg_column_size(c.*) + COALESCE(octet_length(g.data), 0)), 0) '
+            f'FROM "{self._table}" c LEFT JOIN "{geometry_table}" g ON g.cache_id = c.id'
+        )
+
+    @api.model
+    def _cron_evict_route_cache(self):
+        """Nightly: drop stale unused rows, then least recently / least often used rows over the row or size budget."""
+        return self._evict_cache()
+
+
+class PremafirmMapboxCacheGeometry(models.Model):
+    _name = "premafirm.mapbox.cache.geometry"
+    _description = "Premafirm Mapbox Route Geometry"
+
+    cache_id = fields.Many2one("premafirm.mapbox.cache", required=True, ondelete="cascade", index=True)
+    data = fields.Binary(attachment=False, help="zlib-compressed encoded polyline.")
+
+    _sql_constraints = [
+        ("cache_unique", "unique(cache_id)", "Route geometry already exists for this cache entry."),
+    ]
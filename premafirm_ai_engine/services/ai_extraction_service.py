@@ -1,26 +1,48 @@
 import base64
-import io
+import hashlib
 import json
 import logging
 import re
+import threading
 import time
-from datetime import datetime
+from datetime import datetime, timedelta
 
 import requests
-import pdfplumber
-from docx import Document
-from pypdf import PdfReader
+from psycopg2 import IntegrityError
+
+from . import document_text_extractor, load_grammar, process_pool
 
 _logger = logging.getLogger(__name__)
 
+# Process-pool settings for attachment parsing (see premafirm.extraction_pool_* params).
+EXTRACTION_POOL_WORKERS = 4
+EXTRACTION_POOL_START_METHOD = process_pool.DEFAULT_START_METHOD
+
+# Context key forcing a fresh OpenAI call whose answer replaces the cached one.
+LLM_CACHE_REFRESH_KEY = "llm_cache_refresh"
+_LLM_CACHE_STATS = {"hits": 0, "misses": 0, "refreshes": 0}
+_LLM_CACHE_LOCK = threading.Lock()
+
 
 class AIExtractionService:
     """Extraction layer that converts broker data into structured freight data."""
 
     OPENAI_URL = "https://api.openai.com/v1/responses"
+    OPENAI_MODEL = "gpt-4.1-mini"
+    # Bump whenever the meaning of the extraction prompts changes: cached answers are keyed by it.
+    OPENAI_PROMPT_VERSION = "1"
+    LLM_CACHE_TTL_DAYS = 30
+    # Bump whenever attachment parsing changes: cached attachment texts are keyed by it.
+    ATTACHMENT_PARSER_VERSION = "1"
+    CACHED_ATTACHMENT_TYPES = ("pdf", "docx", "xlsx", "xls")
 
     def __init__(self, env):
         self.env = env
+        # (checksum, file type) -> text parsed or loaded by this service.
+        self._attachment_texts = {}
+        # checksum -> (text, pages read) of PDFs load-scanned by this service, so a
+        # later full-text read only extracts the pages after the scan.
+        self._scanned_pages = {}
 
     def _record_runtime_warning(self, warning):
         if not hasattr(self, "_runtime_warnings"):
@@ -30,6 +52,52 @@ class AIExtractionService:
     def _get_openai_key(self):
         return self.env["ir.config_parameter"].sudo().get_param("openai.api_key")
 
+    @staticmethod
+    def llm_cache_stats():
+        """Hit/miss/refresh counters of this worker's LLM response cache lookups."""
+        with _LLM_CACHE_LOCK:
+            return dict(_LLM_CACHE_STATS)
+
+    def _count_llm_cache(self, counter):
+        with _LLM_CACHE_LOCK:
+            _LLM_CACHE_STATS[counter] += 1
+
+    def _llm_cache_key(self, system_prompt, user_prompt):
+        payload = json.dumps([self.OPENAI_MODEL, self.OPENAI_PROMPT_VERSION, system_prompt, user_prompt], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _llm_cache_lookup(self, cache_model, key):
+        """Parsed answer cached under ``key`` within ``premafirm.llm_cache_ttl_days``, else None."""
+        ttl_days = float(self.env["ir.config_parameter"].sudo().get_param("premafirm.llm_cache_ttl_days") or self.LLM_CACHE_TTL_DAYS)
+        cached = cache_model.search([("key", "=", key), ("cached_at", ">=", datetime.utcnow() - timedelta(days=ttl_days))], limit=1)
+        if not cached:
+            return None
+        try:
+            result = json.loads(cached.response or "")
+        except ValueError:
+            return None
+        cached._record_hits()
+        return result
+
+    def _llm_cache_store(self, cache_model, key, source_label, result):
+        vals = {
+            "model_name": self.OPENAI_MODEL,
+            "prompt_version": self.OPENAI_PROMPT_VERSION,
+            "source_label": source_label,
+            "response": json.dumps(result),
+            "cached_at": datetime.utcnow(),
+        }
+        existing = cache_model.search([("key", "=", key)], limit=1)
+        if existing:
+            existing.write(vals)
+            return
+        try:
+            with self.env.cr.savepoint():
+                cache_model.create(dict(vals, key=key))
+        except IntegrityError:
+            # Another worker asked the same question first.
+            _logger.debug("LLM answer for %s stored concurrently", key)
+
     def _extract_json_from_text(self, content):
         if not content:
             return {}
@@ -57,43 +125,7 @@ class AIExtractionService:
         return f"LOAD #{fallback_index}"
 
     def _extract_load_markers(self, text):
-        pattern = re.compile(r"(?im)^\s*(LOAD\s*#\s*\d+|LOAD\s*\d+|LOAD\s*NO\.?\s*\d+)\b")
-        return list(pattern.finditer(text or ""))
-
-    def _load_sections(self, text):
-        raw = text or ""
-        markers = self._extract_load_markers(raw)
-        if not markers:
-            return []
-
-        sections = []
-        for idx, marker in enumerate(markers, 1):
-            start = marker.start()
-            end = markers[idx].start() if idx < len(markers) else len(raw)
-            block = raw[start:end].strip()
-            sections.append(
-                {
-                    "label": self._normalize_load_label(marker.group(1), idx),
-                    "key": f"section_{idx}",
-                    "text": block,
-                }
-            )
-        return sections
-
-    def _extract_value(self, text, patterns):
-        for pattern in patterns:
-            match = re.search(pattern, text, re.I)
-            if match:
-                return (match.group(1) or "").strip()
-        return None
-
-    def _extract_labeled_value(self, text, labels):
-        escaped = "|".join(labels)
-        patterns = [
-            rf"(?:{escaped})\s*(?:\([^)]*\))?\s*(?::|\-)?\s*\n\s*([^\n]+)",
-            rf"(?:{escaped})\s*(?:\([^)]*\))?\s*(?::|\-)\s*([^\n]+)",
-        ]
-        return self._extract_value(text, patterns)
+        return load_grammar.load_markers(text)
 
     def _coerce_number(self, value):
         if value is None:
@@ -110,43 +142,17 @@ class AIExtractionService:
         warnings = []
         errors = []
         stops = []
-        pickup_labels = [
-            r"Pickup\s*(?:Information|Info|Details)",
-            r"Pickup\s*Address",
-            r"Pickup\s*Location",
-            r"Pickup",
-            r"Origin",
-            r"Ship\s*From",
-            r"Shipper",
-        ]
-        delivery_labels = [
-            r"Delivery\s*(?:Information|Info|Details)",
-            r"Delivery\s*Address",
-            r"Delivery\s*Location",
-            r"Delivery",
-            r"Destination",
-            r"Ship\s*To",
-            r"Receiver",
-            r"Consignee",
-            r"Drop",
-        ]
-        delivery_date_labels = [r"Delivery\s*Date", r"Due\s*Date", r"Drop\s*Date"]
-        pallet_labels = [r"#\s*of\s*Pallets", r"Pallets"]
-        weight_labels = [r"Total\s*Weight", r"Weight"]
-
-        sections = self._load_sections(raw_text)
-        if not sections and raw_text.strip():
-            sections = [{"label": None, "key": "section_1", "text": raw_text.strip()}]
+        sections = load_grammar.load_sections(raw_text)
 
         for idx, section in enumerate(sections, 1):
-            label = section.get("label")
-            section_text = section.get("text") or ""
-            pallets_raw = self._extract_labeled_value(section_text, pallet_labels)
-            size_raw = self._extract_labeled_value(section_text, [r"Pallet\s*Size"])
-            weight_raw = self._extract_labeled_value(section_text, weight_labels)
-            pickup = self._extract_labeled_value(section_text, pickup_labels)
-            delivery = self._extract_labeled_value(section_text, delivery_labels)
-            delivery_date = self._extract_labeled_value(section_text, delivery_date_labels)
+            label = self._normalize_load_label(section["label"], idx) if section["label"] else None
+            fields = section["fields"]
+            pallets_raw = fields["pallets"]
+            size_raw = fields["pallet_size"]
+            weight_raw = fields["weight"]
+            pickup = fields["pickup"]
+            delivery = fields["delivery"]
+            delivery_date = fields["delivery_date"]
 
             pallets_val = self._coerce_number(pallets_raw)
             weight_val = self._coerce_number(weight_raw)
@@ -203,54 +209,139 @@ class AIExtractionService:
         return {"stops": stops, "warnings": warnings, "errors": errors}
 
     def _extract_attachment_text(self, attachment):
-        name = (attachment.name or "").lower()
-        file_data = base64.b64decode(attachment.datas) if attachment.datas else b""
-        if not file_data:
-            return ""
-
-        if name.endswith(".pdf"):
-            try:
-                with pdfplumber.open(io.BytesIO(file_data)) as pdf:
-                    return "\n".join(page.extract_text() or "" for page in pdf.pages)
-            except Exception:
-                pass
-
-            try:
-                reader = PdfReader(io.BytesIO(file_data))
-                return "\n".join((page.extract_text() or "") for page in reader.pages)
-            except Exception:
-                _logger.exception("PDF extraction failed")
-                return ""
-
-        if name.endswith(".docx"):
-            try:
-                doc = Document(io.BytesIO(file_data))
-                return "\n".join(p.text for p in doc.paragraphs if p.text)
-            except Exception:
-                _logger.exception("DOCX extraction failed")
-                return ""
-
-        if name.endswith(".doc"):
-            _logger.warning("DOC extraction is not supported for attachment %s", attachment.name)
-            return ""
-
-        if name.endswith(".xlsx") or name.endswith(".xls"):
+        """Text of ``attachment``; see ``_extract_attachment_texts``."""
+        return self._extract_attachment_texts([attachment])[0]
+
+    def _extract_attachment_texts(self, attachments, scan=False):
+        """Texts of ``attachments`` in order, each parsed once per content checksum and parser version.
+
+        Results live in ``premafirm.attachment.text`` and in a per-service memo, so
+        re-processing a lead whose attachments did not change parses nothing. The
+        files that do need parsing are parsed together on a process pool. With
+        ``scan`` PDFs are only read up to the end of their loads (see
+        ``_load_scan``), cached apart from their full text and per page cap and
+        trailing-page count, so changing those settings re-scans. A PDF whose full
+        text is already known is not scanned: its full text stands in for the scan.
+        """
+        attachments = list(attachments)
+        if not attachments:
+            return []
+        load_scan = self._load_scan() if scan else None
+        keys, full_keys = [], {}
+        for attachment in attachments:
+            checksum = getattr(attachment, "checksum", None)
+            file_type = document_text_extractor.file_type(attachment.name)
+            if not checksum or file_type not in self.CACHED_ATTACHMENT_TYPES:
+                keys.append(None)
+                continue
+            if load_scan and file_type == "pdf":
+                scan_type = "pdf:load:{}:{}".format(*load_scan[2:])
+                full_keys[(checksum, scan_type)] = (checksum, file_type)
+                file_type = scan_type
+            keys.append((checksum, file_type))
+
+        cache_model = self.env["premafirm.attachment.text"].sudo()
+        wanted = {key for key in keys if key and key not in self._attachment_texts}
+        wanted |= {full_keys[key] for key in wanted if key in full_keys}
+        if wanted:
+            for cached in cache_model.search(
+                [("checksum", "in", sorted({checksum for checksum, _file_type in wanted})), ("parser_version", "=", self.ATTACHMENT_PARSER_VERSION)]
+            ):
+                if (cached.checksum, cached.file_type) in wanted:
+                    self._attachment_texts[(cached.checksum, cached.file_type)] = cached.text or ""
+        for key, full_key in full_keys.items():
+            if key not in self._attachment_texts and full_key in self._attachment_texts:
+                self._attachment_texts[key] = self._attachment_texts[full_key]
+
+        to_parse, pending = [], {}
+        for idx, key in enumerate(keys):
+            if key is None:
+                to_parse.append(idx)
+            elif key not in self._attachment_texts and key not in pending:
+                pending[key] = idx
+                to_parse.append(idx)
+        parsed = dict(zip(to_parse, self._parse_attachment_texts([attachments[idx] for idx in to_parse], scan=load_scan)))
+
+        for key, idx in pending.items():
+            if parsed[idx] is None:
+                # Timed out: leave it uncached so the next run tries again.
+                continue
+            checksum, file_type = key
             try:
-                import openpyxl
-
-                workbook = openpyxl.load_workbook(io.BytesIO(file_data), read_only=True, data_only=True)
-                rows = []
-                for sheet in workbook.worksheets:
-                    for row in sheet.iter_rows(values_only=True):
-                        vals = [str(cell).strip() for cell in row if cell is not None and str(cell).strip()]
-                        if vals:
-                            rows.append(" | ".join(vals))
-                return "\n".join(rows)
-            except Exception:
-                _logger.exception("Excel parsing failed for attachment %s", attachment.name)
-                return ""
-
-        return ""
+                with self.env.cr.savepoint():
+                    cache_model.create(
+                        {"checksum": checksum, "file_type": file_type, "parser_version": self.ATTACHMENT_PARSER_VERSION, "text": parsed[idx]}
+                    )
+            except IntegrityError:
+                # Another worker parsed the same file first; its text is identical.
+                _logger.debug("Attachment text for %s stored concurrently", checksum)
+            self._attachment_texts[key] = parsed[idx]
+        return [self._attachment_texts.get(key, "") if key else parsed[idx] or "" for idx, key in enumerate(keys)]
+
+    def _extraction_pool_settings(self):
+        params = self.env["ir.config_parameter"].sudo()
+        try:
+            workers = int(params.get_param("premafirm.extraction_pool_workers", EXTRACTION_POOL_WORKERS))
+            timeout = float(params.get_param("premafirm.extraction_timeout_seconds", document_text_extractor.DOCUMENT_TIMEOUT_SECONDS))
+            pages_per_task = int(params.get_param("premafirm.extraction_pages_per_task", document_text_extractor.PAGES_PER_TASK))
+        except (TypeError, ValueError):
+            workers, timeout, pages_per_task = EXTRACTION_POOL_WORKERS, document_text_extractor.DOCUMENT_TIMEOUT_SECONDS, document_text_extractor.PAGES_PER_TASK
+        start_method = params.get_param("premafirm.extraction_pool_start_method", EXTRACTION_POOL_START_METHOD)
+        return workers, start_method, timeout, max(pages_per_task, 1)
+
+    def _load_scan(self):
+        """Load-scan settings of ``document_text_extractor.scan_text``: a PDF is read page by
+        page until every load section has a pickup and a delivery label and the last
+        ``premafirm.extraction_scan_trailing_pages`` pages had no load marker, or
+        ``premafirm.extraction_scan_max_pages`` pages were read.
+        """
+        params = self.env["ir.config_parameter"].sudo()
+        try:
+            max_pages = int(params.get_param("premafirm.extraction_scan_max_pages", document_text_extractor.SCAN_MAX_PAGES))
+            trailing_pages = int(params.get_param("premafirm.extraction_scan_trailing_pages", document_text_extractor.SCAN_TRAILING_PAGES))
+        except (TypeError, ValueError):
+            max_pages, trailing_pages = document_text_extractor.SCAN_MAX_PAGES, document_text_extractor.SCAN_TRAILING_PAGES
+        required = [
+            load_grammar.labeled_value_patterns(load_grammar.PICKUP_LABELS),
+            load_grammar.labeled_value_patterns(load_grammar.DELIVERY_LABELS),
+        ]
+        return load_grammar.LOAD_MARKER_PATTERN, required, max(max_pages, 1), max(trailing_pages, 0)
+
+    def _parse_attachment_texts(self, attachments, scan=None):
+        """Parse ``attachments`` (decoded once each) on this worker's long-lived extraction pool.
+
+        ``scan`` holds the ``_load_scan`` settings when PDFs are to be load-scanned;
+        a full read of a PDF this service scanned resumes after the scanned pages.
+        """
+        documents, resume = [], []
+        for attachment in attachments:
+            file_type = document_text_extractor.file_type(attachment.name)
+            if file_type == "doc":
+                _logger.warning("DOC extraction is not supported for attachment %s", attachment.name)
+            file_data = base64.b64decode(attachment.datas) if attachment.datas else b""
+            documents.append((file_type, file_data))
+            checksum = getattr(attachment, "checksum", None)
+            resume.append(self._scanned_pages.get(checksum) if checksum and file_type == "pdf" and not scan else None)
+        if not documents:
+            return []
+        workers, start_method, timeout, pages_per_task = self._extraction_pool_settings()
+        results = document_text_extractor.extract_documents(
+            documents,
+            executor=process_pool.shared_pool("extraction", workers, start_method) if workers > 1 else None,
+            timeout=timeout,
+            pages_per_task=pages_per_task,
+            scan=scan or None,
+            resume=resume,
+        )
+        if not scan:
+            return results
+        texts = []
+        for attachment, (file_type, _data), result in zip(attachments, documents, results):
+            checksum = getattr(attachment, "checksum", None)
+            if result is not None and checksum and file_type == "pdf":
+                self._scanned_pages[checksum] = result
+            texts.append(None if result is None else result[0])
+        return texts
 
     def _fallback_parse(self, email_text):
         pickup = None
@@ -307,9 +398,20 @@ Extract freight details from this {source_label} and return valid JSON:
 CONTENT:
 {source_text}
 """
+        # Identical prompts get identical answers from the cache, unless a refresh is forced.
+        cache_model = self.env["premafirm.llm.cache"].sudo()
+        cache_key = self._llm_cache_key(system_prompt, user_prompt)
+        if (getattr(self.env, "context", None) or {}).get(LLM_CACHE_REFRESH_KEY):
+            self._count_llm_cache("refreshes")
+        else:
+            cached = self._llm_cache_lookup(cache_model, cache_key)
+            if cached is not None:
+                self._count_llm_cache("hits")
+                return cached
+            self._count_llm_cache("misses")
         try:
             payload = {
-                "model": "gpt-4.1-mini",
+                "model": self.OPENAI_MODEL,
                 "input": [
                     {
                         "role": "system",
@@ -342,10 +444,13 @@ CONTENT:
                     if item.get("type") == "output_text":
                         content += item.get("text", "")
 
-            return self._extract_json_from_text(content)
+            result = self._extract_json_from_text(content)
         except Exception:
             _logger.exception("OpenAI extraction failed")
             return {}
+        if result:
+            self._llm_cache_store(cache_model, cache_key, source_label, result)
+        return result
 
     def extract_load(self, email_text, attachments=None):
 
@@ -353,7 +458,7 @@ CONTENT:
         attachments = attachments or self.env["ir.attachment"]
         parsable = attachments.filtered(lambda a: (a.name or "").lower().endswith((".pdf", ".docx", ".doc", ".xlsx", ".xls")))
         if parsable:
-            raw_text = "\n".join(filter(None, [self._extract_attachment_text(att) for att in parsable]))
+            raw_text = "\n".join(filter(None, self._extract_attachment_texts(parsable, scan=True)))
             parsed = self._parse_load_sections(raw_text)
 
 
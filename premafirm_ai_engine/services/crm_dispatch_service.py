@@ -7,6 +7,7 @@ from datetime import datetime, time as datetime_time, timedelta
 import pytz
 from odoo import fields
 
+from . import load_grammar
 from .ai_extraction_service import AIExtractionService
 from .dispatch_rules_engine import DispatchRulesEngine
 from .mapbox_service import MapboxService
@@ -154,8 +155,8 @@ class CRMDispatchService:
 
     def _enrich_stop_geodata(self, stop_vals):
         warnings = []
-        for stop in stop_vals:
-            geo = self.mapbox_service.geocode_address(stop["address"])
+        geocodes = self.mapbox_service.geocode_many([stop["address"] for stop in stop_vals])
+        for stop, geo in zip(stop_vals, geocodes):
             if geo.get("warning") or not geo.get("latitude") or not geo.get("longitude"):
                 stop["full_address"] = stop["address"]
                 stop["needs_manual_review"] = True
@@ -183,12 +184,14 @@ class CRMDispatchService:
         buffer_minutes = int(float(self.env["ir.config_parameter"].sudo().get_param("premafirm.schedule_buffer_minutes", "15")))
         pickup_service_minutes = int(float(self.env["ir.config_parameter"].sudo().get_param("premafirm.pickup_service_minutes", "45")))
         delivery_service_minutes = int(float(self.env["ir.config_parameter"].sudo().get_param("premafirm.delivery_service_minutes", "45")))
-        if first_pickup and not first_pickup.scheduled_datetime:
-            first_pickup.scheduled_datetime = datetime.combine(self._now_company_tz().date(), datetime_time(start_hour_hh, start_hour_mm))
+        # Results are collected per stop and stored with one batched update at the end.
+        scheduled = {stop.id: stop.scheduled_datetime for stop in ordered_stops}
+        if first_pickup and not scheduled[first_pickup.id]:
+            scheduled[first_pickup.id] = datetime.combine(self._now_company_tz().date(), datetime_time(start_hour_hh, start_hour_mm))
 
-        if first_pickup and first_pickup.scheduled_datetime:
+        if first_pickup and scheduled[first_pickup.id]:
             first_leg_hours = float(segments[0].get("drive_hours") or 0.0) if segments else 0.0
-            leave_yard_at = first_pickup.scheduled_datetime - timedelta(hours=first_leg_hours, minutes=buffer_minutes)
+            leave_yard_at = scheduled[first_pickup.id] - timedelta(hours=first_leg_hours, minutes=buffer_minutes)
         else:
             leave_yard_at = fields.Datetime.now()
 
@@ -196,6 +199,7 @@ class CRMDispatchService:
         break_state = {"since_major": 0.0}
         total_distance = 0.0
         total_hours = 0.0
+        updates = {}
         for idx, stop in enumerate(ordered_stops):
             segment = segments[idx] if idx < len(segments) else {}
             base_drive_hours = float(segment.get("drive_hours") or 0.0)
@@ -203,27 +207,32 @@ class CRMDispatchService:
             effective_drive_hours = base_drive_hours + break_hours
             total_distance += float(segment.get("distance_km") or 0.0)
             total_hours += effective_drive_hours
-            if not stop.scheduled_datetime:
-                stop.scheduled_datetime = running_dt + timedelta(hours=effective_drive_hours)
             estimated_arrival = running_dt + timedelta(hours=effective_drive_hours)
+            if not scheduled[stop.id]:
+                scheduled[stop.id] = estimated_arrival
             service_minutes = pickup_service_minutes if stop.stop_type == "pickup" else delivery_service_minutes
-            scheduled_start = stop.scheduled_datetime or estimated_arrival
+            scheduled_start = scheduled[stop.id]
             scheduled_end = scheduled_start + timedelta(minutes=service_minutes)
-            stop.write(
-                {
-                    "distance_km": float(segment.get("distance_km") or 0.0),
-                    "drive_hours": effective_drive_hours,
-                    "scheduled_datetime": stop.scheduled_datetime,
-                    "estimated_arrival": estimated_arrival,
-                    "scheduled_start_datetime": scheduled_start,
-                    "scheduled_end_datetime": scheduled_end,
-                    "map_url": segment.get("map_url"),
-                }
-            )
+            # drive_hours is computed from drive_minutes; storing minutes keeps the write on plain columns.
+            updates[stop.id] = {
+                "distance_km": float(segment.get("distance_km") or 0.0),
+                "drive_minutes": effective_drive_hours * 60.0,
+                "scheduled_datetime": scheduled_start,
+                "estimated_arrival": estimated_arrival,
+                "scheduled_start_datetime": scheduled_start,
+                "scheduled_end_datetime": scheduled_end,
+                "map_url": segment.get("map_url"),
+            }
             running_dt = scheduled_end
+        ordered_stops._write_schedule_values(updates)
+        if updates and not self.env.context.get("skip_schedule_recompute"):
+            # Same follow-up the per-stop ETA writes used to queue: re-anchor on the last stop written.
+            for stop_lead in ordered_stops.mapped("lead_id"):
+                stop_lead._queue_schedule_recompute(manual_stop=ordered_stops.filtered(lambda s: s.lead_id == stop_lead)[-1:])
         return leave_yard_at, total_distance, total_hours
 
     def _create_calendar_booking(self, lead):
+        self.env["crm.lead"]._flush_schedule_queue()
         if not (lead.assigned_vehicle_id and lead.departure_time):
             return
         planner = RunPlannerService(self.env)
@@ -238,47 +247,75 @@ class CRMDispatchService:
         last_eta = max(lead.dispatch_stop_ids.mapped("estimated_arrival") or [lead.departure_time])
         lead.schedule_conflict = bool(run.calendar_event_id and run.calendar_event_id.start and run.calendar_event_id.stop and (run.calendar_event_id.start < last_eta and run.calendar_event_id.stop > lead.departure_time))
 
+    def _create_stops_bulk(self, lead, stop_vals):
+        """Create all extracted stops of ``lead`` in one ``create`` call.
+
+        Sequences are numbered in memory and neither default loads nor schedule
+        recomputes run per stop; ``process_lead`` rebuilds loads, schedules and
+        prices once on the complete set.
+        """
+        vals_list = []
+        for seq, vals in enumerate(stop_vals, 1):
+            vals["lead_id"] = lead.id
+            vals["sequence"] = vals.get("sequence") or seq
+            vals["scheduled_datetime"] = _normalize_odoo_datetime(vals.get("scheduled_datetime"))
+            vals_list.append(vals)
+        return self.env["premafirm.dispatch.stop"].with_context(skip_schedule_recompute=True, skip_default_load=True).create(vals_list)
+
+    def _route_leg_pairs(self, lead):
+        """Legs that scheduling ``lead`` and then simulating its vehicle run will ask for."""
+        mapbox = self.mapbox_service
+        ordered = lead.dispatch_stop_ids.sorted("sequence")
+        if not ordered:
+            return []
+        vehicle = lead.assigned_vehicle_id
+        yard = (vehicle.home_location if vehicle else False) or ordered[0].home_location or False
+        locations = [yard] + [stop.full_address or stop.address for stop in ordered]
+        # Best-guess departures: new stops have no schedule yet, so their legs land in the
+        # leave-yard bucket; the transaction's resolver answers the schedule's later
+        # buckets for the same pairs from these, within the departure fallback hours.
+        leave_yard = lead.leave_yard_at or lead._vehicle_start_datetime()
+        pairs = list(zip(locations[:-1], locations[1:], mapbox.leg_departures(leave_yard, ordered)))
+        if vehicle:
+            # The run date follows the leave-yard time the schedule is about to set; the
+            # previous one (or the vehicle start) is the best guess before it runs.
+            run_date = fields.Date.to_date((lead.departure_time or leave_yard).date())
+            run = self.env["premafirm.dispatch.run"].search([("vehicle_id", "=", vehicle.id), ("run_date", "=", run_date)], limit=1)
+            run_stops = list(run.stop_ids.sorted("run_sequence")) if run else []
+            if not run or not any(stop.run_id == run for stop in ordered):
+                run_stops += list(ordered)
+            home = mapbox._trip_origin(vehicle.home_location, run_stops)
+            addresses = [home] + [mapbox._stop_address(stop) for stop in run_stops] + [home]
+            departures = mapbox.leg_departures(RunPlannerService(self.env)._run_start(run), run_stops, return_home=True)
+            pairs += list(zip(addresses[:-1], addresses[1:], departures))
+        return pairs
+
     def _apply_routes(self, lead):
+        # Pending edits of this transaction first, so the pass below is the last word.
+        self.env["crm.lead"]._flush_schedule_queue()
+        # One batch for both passes below; they then read every leg from the transaction's resolver.
+        self.mapbox_service.resolve_legs(self._route_leg_pairs(lead))
         lead.with_context(skip_schedule_recompute=True)._compute_schedule()
         self._create_calendar_booking(lead)
         return [lead.schedule_api_warning] if lead.schedule_api_warning else []
 
 
-    def _extract_last_numeric(self, text, patterns):
-        matches = []
-        for pattern in patterns:
-            matches.extend(re.finditer(pattern, text or "", re.I))
-        if not matches:
+    def _to_number(self, raw):
+        if raw is None:
             return None
-        raw = matches[-1].group(1)
         try:
             return float(str(raw).replace(",", ""))
         except Exception:
             return None
 
-    def _extract_last_token(self, text, patterns):
-        matches = []
-        for pattern in patterns:
-            matches.extend(re.finditer(pattern, text or "", re.I))
-        return matches[-1].group(1).strip() if matches else None
-
     def _extract_commercial_terms(self, thread_text, attachments=None):
-        attachment_text = ""
-        for att in (attachments or self.env["ir.attachment"]):
-            if (att.name or "").lower().endswith(".pdf"):
-                attachment_text += "\n" + (self.ai_service._extract_attachment_text(att) or "")
+        pdfs = [att for att in (attachments or self.env["ir.attachment"]) if (att.name or "").lower().endswith(".pdf")]
+        attachment_text = "".join("\n" + (text or "") for text in self.ai_service._extract_attachment_texts(pdfs))
         full_text = f"{thread_text or ''}\n{attachment_text}"
-        return {
-            "rate": self._extract_last_numeric(full_text, [r"(?:rate|line\s*haul|all\s*in)\s*[:$]?\s*(\d+(?:,\d{3})*(?:\.\d+)?)", r"\$(\d+(?:,\d{3})*(?:\.\d+)?)"]),
-            "tonu": bool(re.search(r"\btonu\b", full_text or "", re.I)),
-            "detention": bool(re.search(r"\bdetention\b", full_text or "", re.I)),
-            "pump_truck": bool(re.search(r"pump\s*truck|pallet\s*jack", full_text or "", re.I)),
-            "reefer_temp": self._extract_last_token(full_text, [r"(?:reefer|temp(?:erature)?)\s*[:=-]?\s*([-+]?\d+(?:\.\d+)?)"]),
-            "pallets": self._extract_last_numeric(full_text, [r"(?:#\s*of\s*pallets|pallets?)\s*[:=-]?\s*(\d+(?:\.\d+)?)"]),
-            "weight": self._extract_last_numeric(full_text, [r"(?:weight|lbs?)\s*[:=-]?\s*(\d+(?:,\d{3})*(?:\.\d+)?)"]),
-            "load_number": self._extract_last_token(full_text, [r"load\s*(?:#|number|no\.?)\s*[:=-]?\s*([A-Za-z0-9-]+)"]),
-            "customer_po": self._extract_last_token(full_text, [r"(?:customer\s*)?po\s*(?:#|number|no\.?)\s*[:=-]?\s*([A-Za-z0-9-]+)"]),
-        }
+        terms = load_grammar.commercial_terms(full_text)
+        for key in ("rate", "pallets", "weight"):
+            terms[key] = self._to_number(terms[key])
+        return terms
 
     def _extract_po_details(self, email_text):
         text = email_text or ""
@@ -320,6 +357,8 @@ class CRMDispatchService:
 
 
     def _compute_weather_risk(self, lead):
+        # A queued schedule pass would otherwise overwrite the conflict flag set below.
+        self.env["crm.lead"]._flush_schedule_queue()
         now = fields.Datetime.now()
         if lead.weather_checked_at and (now - lead.weather_checked_at) < timedelta(hours=6):
             return lead.weather_risk or "low", [lead.weather_alert_text] if lead.weather_alert_text else []
@@ -394,44 +433,46 @@ class CRMDispatchService:
         }
         has_manual_corrections = bool(self.env["premafirm.ai.correction"].search_count([("lead_id", "=", lead.id)]))
 
-        lead.dispatch_stop_ids.sudo().unlink()
-        created_stops = self.env["premafirm.dispatch.stop"]
-        for vals in stop_vals:
-            vals["lead_id"] = lead.id
-            vals["scheduled_datetime"] = _normalize_odoo_datetime(vals.get("scheduled_datetime"))
-            created_stops |= self.env["premafirm.dispatch.stop"].create(vals)
-
-        if has_manual_corrections and manual_load_map:
-            for stop in created_stops:
-                map_key = (stop.sequence, stop.stop_type, (stop.address or "").strip().lower())
-                load_id = manual_load_map.get(map_key)
-                if load_id:
-                    stop.load_id = load_id
-        else:
-            lead.action_rebuild_loads_from_ai()
-
-        updates = {
-            "inside_delivery": bool(extraction.get("inside_delivery")),
-            "liftgate": bool(extraction.get("liftgate")),
-            "detention_requested": bool(extraction.get("detention_requested") or extracted_terms.get("detention")),
-            "pump_truck_required": bool(extracted_terms.get("pump_truck")),
-        }
-        if extracted_terms.get("customer_po"):
-            updates["po_number"] = extracted_terms["customer_po"]
-        elif po_data.get("po_number"):
-            updates["po_number"] = po_data["po_number"]
-        if extraction.get("source") == "attachment" and email_text:
-            lead.message_post(body="Attachment and email body both contained data; attachment was prioritized.")
-        lead.write(updates)
-
-        reefer_required = self._determine_freight_service(lead, extraction)
-        if reefer_required:
-            lead.message_post(body="Reefer indicators found; reefer_required flagged for confirmation.")
-        if lead.dispatch_stop_ids.filtered(lambda s: s.liftgate_needed):
-            lead.message_post(body="Liftgate may be required based on address type; please confirm with broker.")
-
-        t_route = time.perf_counter()
-        warnings.extend(self._apply_routes(lead))
+        # Stop edits below queue schedule recomputes; _apply_routes runs the single route pass.
+        with lead._batch_schedule():
+            lead.dispatch_stop_ids.sudo().unlink()
+            created_stops = self._create_stops_bulk(lead, stop_vals)
+
+            if has_manual_corrections and manual_load_map:
+                manual_stops = {}
+                for stop in created_stops:
+                    map_key = (stop.sequence, stop.stop_type, (stop.address or "").strip().lower())
+                    load_id = manual_load_map.get(map_key)
+                    if load_id:
+                        manual_stops[load_id] = manual_stops.get(load_id, stop.browse()) | stop
+                for load_id, stops in manual_stops.items():
+                    stops.write({"load_id": load_id})
+                created_stops.filtered(lambda stop: not stop.load_id)._assign_default_load()
+            else:
+                lead.action_rebuild_loads_from_ai()
+
+            updates = {
+                "inside_delivery": bool(extraction.get("inside_delivery")),
+                "liftgate": bool(extraction.get("liftgate")),
+                "detention_requested": bool(extraction.get("detention_requested") or extracted_terms.get("detention")),
+                "pump_truck_required": bool(extracted_terms.get("pump_truck")),
+            }
+            if extracted_terms.get("customer_po"):
+                updates["po_number"] = extracted_terms["customer_po"]
+            elif po_data.get("po_number"):
+                updates["po_number"] = po_data["po_number"]
+            if extraction.get("source") == "attachment" and email_text:
+                lead.message_post(body="Attachment and email body both contained data; attachment was prioritized.")
+            lead.write(updates)
+
+            reefer_required = self._determine_freight_service(lead, extraction)
+            if reefer_required:
+                lead.message_post(body="Reefer indicators found; reefer_required flagged for confirmation.")
+            if lead.dispatch_stop_ids.filtered(lambda s: s.liftgate_needed):
+                lead.message_post(body="Liftgate may be required based on address type; please confirm with broker.")
+
+            t_route = time.perf_counter()
+            warnings.extend(self._apply_routes(lead))
         _logger.info("Route calculation + scheduling took %.3fs", time.perf_counter() - t_route)
 
         if validation_errors:
@@ -0,0 +1,246 @@
+import io
+import logging
+import re
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import pdfplumber
+from docx import Document
+from pypdf import PdfReader
+
+from .process_pool import terminate_pool
+
+_logger = logging.getLogger(__name__)
+
+# PDFs longer than this are split into page ranges extracted in parallel.
+PAGES_PER_TASK = 8
+# Wall-clock limit for one document, from the moment the batch starts.
+DOCUMENT_TIMEOUT_SECONDS = 60.0
+# Load scans read at most this many PDF pages, and stop once the loads are complete
+# and this many pages in a row carried no load marker.
+SCAN_MAX_PAGES = 40
+SCAN_TRAILING_PAGES = 2
+# pypdf text at least this long is trusted; sparser pages are re-read with pdfplumber.
+DENSE_PAGE_CHARS = 200
+
+
+def file_type(name):
+    """Lower-case extension of ``name``, which picks the parser."""
+    return (name or "").lower().rsplit(".", 1)[-1] if "." in (name or "") else ""
+
+
+def extract_text(task):
+    """Text of one extraction task: ``(file_type, data, first_page, last_page)``.
+
+    Pages are a 0-based half-open range and only apply to PDFs (``None`` = to the
+    end). Plain data in and out, so tasks can run on a process pool.
+    """
+    kind, data, first_page, last_page = task
+    if not data:
+        return ""
+    if kind == "pdf":
+        try:
+            pages = None if last_page is None else list(range(first_page + 1, last_page + 1))
+            with pdfplumber.open(io.BytesIO(data), pages=pages) as pdf:
+                return "\n".join(page.extract_text() or "" for page in pdf.pages)
+        except Exception:
+            pass
+        try:
+            reader = PdfReader(io.BytesIO(data))
+            return "\n".join((page.extract_text() or "") for page in reader.pages[first_page:last_page])
+        except Exception:
+            _logger.exception("PDF extraction failed")
+            return ""
+
+    if kind == "docx":
+        try:
+            doc = Document(io.BytesIO(data))
+            return "\n".join(p.text for p in doc.paragraphs if p.text)
+        except Exception:
+            _logger.exception("DOCX extraction failed")
+            return ""
+
+    if kind in ("xlsx", "xls"):
+        try:
+            import openpyxl
+
+            workbook = openpyxl.load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+            rows = []
+            for sheet in workbook.worksheets:
+                for row in sheet.iter_rows(values_only=True):
+                    vals = [str(cell).strip() for cell in row if cell is not None and str(cell).strip()]
+                    if vals:
+                        rows.append(" | ".join(vals))
+            return "\n".join(rows)
+        except Exception:
+            _logger.exception("Excel parsing failed")
+            return ""
+
+    return ""
+
+
+def iter_pdf_pages(data, max_pages=None):
+    """Yield the text of each PDF page lazily, at most ``max_pages`` pages.
+
+    pypdf answers first; pages where it finds little text (scans, odd layouts) are
+    re-read with pdfplumber, opened only once a page needs it.
+    """
+    try:
+        pages = PdfReader(io.BytesIO(data)).pages
+    except Exception:
+        pages = None
+    plumber = None
+    try:
+        count = len(pages) if pages is not None else None
+        if count is None:
+            plumber = pdfplumber.open(io.BytesIO(data))
+            count = len(plumber.pages)
+        for number in range(min(count, max_pages) if max_pages else count):
+            text = ""
+            if pages is not None:
+                try:
+                    text = pages[number].extract_text() or ""
+                except Exception:
+                    text = ""
+            if len(text.strip()) < DENSE_PAGE_CHARS:
+                try:
+                    plumber = plumber or pdfplumber.open(io.BytesIO(data))
+                    page = plumber.pages[number]
+                    text = page.extract_text() or text
+                    page.close()
+                except Exception:
+                    pass
+            yield text
+    except Exception:
+        _logger.exception("PDF extraction failed")
+    finally:
+        if plumber is not None:
+            plumber.close()
+
+
+def load_text_complete(text, marker, required_patterns):
+    """Whether every load section of ``text`` matches one pattern of each required field.
+
+    Sections start at ``marker`` matches; text without markers is one section.
+    """
+    starts = [match.start() for match in marker.finditer(text)] or [0]
+    sections = [text[start:end] for start, end in zip(starts, starts[1:] + [len(text)])]
+    return all(
+        any(re.search(pattern, section, re.I) for pattern in field_patterns)
+        for section in sections
+        for field_patterns in required_patterns
+    )
+
+
+def scan_text(task):
+    """Text of one load-scan task: ``(file_type, data, scan)``; see ``scan_pages``."""
+    return scan_pages(task)[0]
+
+
+def scan_pages(task):
+    """Text of one load-scan task: ``(file_type, data, scan)``, and the number of PDF pages read.
+
+    PDFs are read page by page and abandoned once every load section found so
+    far has its required fields and ``trailing_pages`` more pages brought no new
+    load marker (broker terms and conditions), or after ``max_pages`` pages. ``scan`` is
+    ``(marker_pattern, required_patterns, max_pages, trailing_pages)``, where
+    ``required_patterns`` holds one list of alternative regexes per field. Other
+    file types are extracted whole (and count no pages).
+    """
+    kind, data, (marker_pattern, required_patterns, max_pages, trailing_pages) = task
+    if kind != "pdf" or not data:
+        return extract_text((kind, data, 0, None)), 0
+    marker = re.compile(marker_pattern)
+    pages, quiet, complete = [], 0, False
+    for text in iter_pdf_pages(data, max_pages):
+        pages.append(text)
+        if marker.search(text):
+            complete = False
+        if complete:
+            quiet += 1
+        else:
+            complete, quiet = load_text_complete("\n".join(pages), marker, required_patterns), 0
+        if complete and quiet >= trailing_pages:
+            break
+    return "\n".join(pages), len(pages)
+
+
+def _pdf_page_count(data):
+    try:
+        return len(PdfReader(io.BytesIO(data)).pages)
+    except Exception:
+        return 0
+
+
+def split_tasks(kind, data, pages_per_task=PAGES_PER_TASK, first_page=0):
+    """Extraction tasks of one document: page ranges for long PDFs, else the whole file.
+
+    PDFs whose page count is known start at ``first_page``.
+    """
+    page_count = _pdf_page_count(data) if kind == "pdf" and data else 0
+    if first_page and page_count:
+        return [(kind, data, first, min(first + pages_per_task, page_count)) for first in range(first_page, page_count, pages_per_task)]
+    if page_count <= pages_per_task:
+        return [(kind, data, 0, None)]
+    return [(kind, data, first, min(first + pages_per_task, page_count)) for first in range(0, page_count, pages_per_task)]
+
+
+def extract_documents(documents, executor=None, timeout=DOCUMENT_TIMEOUT_SECONDS, pages_per_task=PAGES_PER_TASK, scan=None, resume=None):
+    """Text of every ``(file_type, data)`` document, in input order.
+
+    All documents and PDF page ranges run at the same time on ``executor`` (a
+    process pool, see ``process_pool.shared_pool``), so a batch takes about as
+    long as its largest document; page order is kept. With ``scan`` (see
+    ``scan_pages``) PDFs are instead read page by page up to the end of their
+    loads, one task per document, and each result is ``(text, pages_read)``.
+    ``resume`` holds such a scan result (or ``None``) per document: only the
+    pages after the scanned ones are extracted and appended to the scanned
+    text. A document not done within ``timeout`` seconds
+    yields ``None``. Falls back to extracting in-process (without timeouts)
+    without an executor, when there is nothing to parallelise or when the pool
+    fails.
+    """
+    documents = list(documents)
+    resume = list(resume or [None] * len(documents))
+    if scan:
+        # One task per document, so its only part is the result.
+        function, combine = scan_pages, lambda parts: parts[0]
+        tasks = [[(kind, data, scan)] for kind, data in documents]
+    else:
+        function, combine = extract_text, "\n".join
+        tasks = [split_tasks(kind, data, pages_per_task, scanned[1] if scanned else 0) for (kind, data), scanned in zip(documents, resume)]
+    texts = None
+    if executor is not None and sum(len(document_tasks) for document_tasks in tasks) > 1:
+        try:
+            texts = _extract_on_pool(executor, function, combine, tasks, timeout)
+        except Exception as exc:
+            _logger.warning("Extraction process pool unavailable (%s); extracting attachments in-process.", exc)
+    if texts is None:
+        texts = [combine([function(task) for task in document_tasks]) for document_tasks in tasks]
+    for idx, scanned in enumerate(resume):
+        # Resumed from the page after the scan (or nothing left to read): prepend the scanned pages.
+        if scanned and texts[idx] is not None and not (tasks[idx] and tasks[idx][0][2] == 0):
+            texts[idx] = "\n".join([scanned[0]] + ([texts[idx]] if tasks[idx] else []))
+    return texts
+
+
+def _extract_on_pool(executor, function, combine, tasks, timeout):
+    # Largest documents first so they are never queued behind small ones.
+    order = sorted(range(len(tasks)), key=lambda idx: -sum(len(task[1] or b"") for task in tasks[idx]))
+    futures = {idx: [executor.submit(function, task) for task in tasks[idx]] for idx in order}
+    deadline = time.monotonic() + timeout if timeout else None
+    texts = []
+    timed_out = False
+    for idx in range(len(tasks)):
+        try:
+            parts = [future.result(timeout=None if deadline is None else max(deadline - time.monotonic(), 0.0)) for future in futures[idx]]
+            texts.append(combine(parts))
+        except FutureTimeoutError:
+            timed_out = True
+            _logger.warning("Attachment text extraction timed out after %ss", timeout)
+            texts.append(None)
+    if timed_out:
+        # A parser stuck on a pathological file would otherwise hold its worker
+        # process; shared_pool starts a fresh pool on the next call.
+        terminate_pool(executor)
+    return texts
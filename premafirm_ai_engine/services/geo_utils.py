@@ -0,0 +1,135 @@
+import base64
+import math
+import re
+import unicodedata
+import zlib
+
+_GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+# Spelled-out forms folded to the abbreviation postal addresses usually carry.
+_MULTIWORD_ABBREVIATIONS = {
+    "british columbia": "bc",
+    "new brunswick": "nb",
+    "newfoundland and labrador": "nl",
+    "northwest territories": "nt",
+    "nova scotia": "ns",
+    "prince edward island": "pe",
+    "united states of america": "usa",
+    "united states": "usa",
+}
+_WORD_ABBREVIATIONS = {
+    "road": "rd",
+    "street": "st",
+    "avenue": "ave",
+    "av": "ave",
+    "boulevard": "blvd",
+    "drive": "dr",
+    "highway": "hwy",
+    "court": "ct",
+    "crescent": "cres",
+    "place": "pl",
+    "lane": "ln",
+    "parkway": "pkwy",
+    "circle": "cir",
+    "square": "sq",
+    "terrace": "terr",
+    "trail": "trl",
+    "suite": "ste",
+    "north": "n",
+    "south": "s",
+    "east": "e",
+    "west": "w",
+    "ontario": "on",
+    "quebec": "qc",
+    "alberta": "ab",
+    "manitoba": "mb",
+    "saskatchewan": "sk",
+    "yukon": "yt",
+    "nunavut": "nu",
+}
+# Country names add nothing once an address is scoped to the US/Canada.
+_TRAILING_COUNTRIES = {"canada", "usa"}
+
+
+def canonical_address(address):
+    """Canonical spelling of ``address`` for cache keys.
+
+    Accents, case and punctuation are dropped and common street, direction and
+    province words are abbreviated, so "5585 McAdam Road Mississauga Ontario"
+    and "5585 McAdam Rd, Mississauga, ON" share one key. A trailing country name
+    is removed.
+    """
+    text = unicodedata.normalize("NFKD", address or "")
+    text = "".join(char for char in text if not unicodedata.combining(char)).lower()
+    text = re.sub(r"[^\w\s-]", " ", text).replace("_", " ")
+    text = " ".join(text.split())
+    for phrase, abbreviation in _MULTIWORD_ABBREVIATIONS.items():
+        text = re.sub(rf"\b{phrase}\b", abbreviation, text)
+    words = [_WORD_ABBREVIATIONS.get(word, word) for word in text.split()]
+    while len(words) > 1 and words[-1] in _TRAILING_COUNTRIES:
+        words.pop()
+    return " ".join(words)
+
+
+def geohash_encode(latitude, longitude, precision=7):
+    """Standard base-32 geohash of a point; precision 7 cells are roughly 150 m across."""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        bounds, value = (lon_range, longitude) if even else (lat_range, latitude)
+        mid = (bounds[0] + bounds[1]) / 2.0
+        if value >= mid:
+            bits = bits * 2 + 1
+            bounds[0] = mid
+        else:
+            bits *= 2
+            bounds[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_GEOHASH_BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(chars)
+
+
+def geohash_decode(geohash):
+    """Centre ``(latitude, longitude)`` of a geohash cell."""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        bits = _GEOHASH_BASE32.index(char)
+        for shift in range(4, -1, -1):
+            bounds = lon_range if even else lat_range
+            mid = (bounds[0] + bounds[1]) / 2.0
+            if (bits >> shift) & 1:
+                bounds[0] = mid
+            else:
+                bounds[1] = mid
+            even = not even
+    return (lat_range[0] + lat_range[1]) / 2.0, (lon_range[0] + lon_range[1]) / 2.0
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in kilometres."""
+    r = 6371.0
+    p1 = math.radians(lat1)
+    p2 = math.radians(lat2)
+    d1 = math.radians(lat2 - lat1)
+    d2 = math.radians(lon2 - lon1)
+    a = math.sin(d1 / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(d2 / 2) ** 2
+    return r * (2 * math.atan2(math.sqrt(a), math.sqrt(1 - a)))
+
+
+def pack_polyline(polyline):
+    """Compressed, base64-encoded (Odoo binary field) form of an encoded polyline."""
+    return base64.b64encode(zlib.compress(polyline.encode(), 9))
+
+
+def unpack_polyline(data):
+    return zlib.decompress(base64.b64decode(data)).decode() if data else ""
@@ -0,0 +1,154 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+
+_logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Blocking token bucket refilled continuously at ``rate_per_minute``."""
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self._lock = threading.Lock()
+        self.configure(rate_per_minute, capacity)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def configure(self, rate_per_minute, capacity=None):
+        self.rate_per_minute = max(float(rate_per_minute or 0.0), 0.0)
+        self.capacity = float(capacity or max(min(self.rate_per_minute / 6.0, 10.0), 1.0))
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate_per_minute / 60.0)
+        self._updated = now
+
+    def acquire(self, timeout=None):
+        """Take one token, waiting up to ``timeout`` seconds; returns False on timeout."""
+        if not self.rate_per_minute:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return True
+                wait = (1.0 - self._tokens) * 60.0 / self.rate_per_minute
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+
+
+class HttpClient:
+    """Shared JSON-over-HTTP client for Mapbox calls.
+
+    Keeps one pooled keep-alive ``requests.Session``, throttles requests through an
+    optional ``TokenBucket`` and collapses identical concurrent GETs into a single
+    request (single-flight). ``fetch_many`` runs independent calls on a bounded
+    thread pool.
+    """
+
+    def __init__(self, pool_size=16, max_workers=8, rate_limiter=None, retries=3, backoff=0.5, rate_limit_timeout=30.0):
+        self.pool_size = pool_size
+        self.max_workers = max_workers
+        self.rate_limiter = rate_limiter
+        self.retries = retries
+        self.backoff = backoff
+        self.rate_limit_timeout = rate_limit_timeout
+        self._session = None
+        self._session_lock = threading.Lock()
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+
+    def _get_session(self):
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    session_cls = getattr(requests, "Session", None)
+                    if session_cls is None:
+                        return requests
+                    session = session_cls()
+                    adapter = requests.adapters.HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+                    session.mount("https://", adapter)
+                    self._session = session
+        return self._session
+
+    def get_json(self, url, timeout=20):
+        """GET ``url`` and return the decoded JSON body, or None when every attempt failed."""
+        with self._inflight_lock:
+            future = self._inflight.get(url)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[url] = future
+        if not leader:
+            return future.result()
+        try:
+            result = self._get_with_retries(url, timeout)
+            future.set_result(result)
+            return result
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(url, None)
+
+    def _get_with_retries(self, url, timeout):
+        """Retry connection errors, 429 and 5xx with backoff; other 4xx answers fail at once."""
+        wait = self.backoff
+        for attempt in range(self.retries):
+            if self.rate_limiter and not self.rate_limiter.acquire(timeout=self.rate_limit_timeout):
+                _logger.warning("Mapbox rate limit wait exceeded; skipping request: %s", url)
+                return None
+            try:
+                response = self._get_session().get(url, timeout=timeout)
+            except Exception as exc:
+                failure = f"{type(exc).__name__}: {exc}"
+            else:
+                status = getattr(response, "status_code", None) or 200
+                if status >= 400 and status != 429 and status < 500:
+                    _logger.warning("Geocoding/routing request rejected with HTTP %s: %s", status, url)
+                    return None
+                if status < 400:
+                    try:
+                        return response.json()
+                    except Exception:
+                        _logger.exception("Geocoding/routing response is not JSON: %s", url)
+                        return None
+                retry_after = (getattr(response, "headers", None) or {}).get("Retry-After") if status == 429 else None
+                try:
+                    wait = max(wait, min(float(retry_after), 60.0))
+                except (TypeError, ValueError):
+                    pass
+                failure = f"HTTP {status}"
+            if attempt == self.retries - 1:
+                _logger.warning("Geocoding/routing request failed after %s attempts (%s): %s", self.retries, failure, url)
+                return None
+            time.sleep(wait)
+            wait *= 2
+        return None
+
+    def fetch_many(self, urls, timeout=20, fetch=None):
+        """Fetch ``urls`` concurrently; results are returned in input order.
+
+        ``fetch`` defaults to ``get_json`` and is called as ``fetch(url, timeout=...)``.
+        Duplicate URLs are requested once.
+        """
+        fetch = fetch or self.get_json
+        urls = list(urls or [])
+        unique = list(dict.fromkeys(urls))
+        workers = min(self.max_workers, len(unique))
+        if workers <= 1:
+            results = {url: fetch(url, timeout=timeout) for url in unique}
+        else:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="premafirm-http") as executor:
+                results = dict(zip(unique, executor.map(lambda url: fetch(url, timeout=timeout), unique)))
+        return [results[url] for url in urls]
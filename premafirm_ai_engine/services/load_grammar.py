@@ -0,0 +1,238 @@
+"""Compiled extraction grammar for broker load texts.
+
+Every label and commercial term starts with one of a few keywords (``Pickup``,
+``Weight``, ``$``, ``PO``...). ``scan`` locates all keywords of a text once; the
+compiled field patterns below are then only tried at the positions of their own
+keywords, instead of each pattern searching the whole text. Results are
+the same as running the patterns with ``re.search`` / ``re.finditer``:
+
+* section fields take the first match of the value-on-the-next-line pattern,
+  else the first match of the same-line pattern, within their ``LOAD #`` section;
+* commercial terms take the last match of their last pattern that matches,
+  over the whole text.
+"""
+
+import re
+
+LOAD_MARKER_PATTERN = r"(?im)^\s*(LOAD\s*#\s*\d+|LOAD\s*\d+|LOAD\s*NO\.?\s*\d+)\b"
+LOAD_MARKER = re.compile(LOAD_MARKER_PATTERN)
+
+PICKUP_LABELS = [
+    r"Pickup\s*(?:Information|Info|Details)",
+    r"Pickup\s*Address",
+    r"Pickup\s*Location",
+    r"Pickup",
+    r"Origin",
+    r"Ship\s*From",
+    r"Shipper",
+]
+DELIVERY_LABELS = [
+    r"Delivery\s*(?:Information|Info|Details)",
+    r"Delivery\s*Address",
+    r"Delivery\s*Location",
+    r"Delivery",
+    r"Destination",
+    r"Ship\s*To",
+    r"Receiver",
+    r"Consignee",
+    r"Drop",
+]
+DELIVERY_DATE_LABELS = [r"Delivery\s*Date", r"Due\s*Date", r"Drop\s*Date"]
+PALLET_LABELS = [r"#\s*of\s*Pallets", r"Pallets"]
+PALLET_SIZE_LABELS = [r"Pallet\s*Size"]
+WEIGHT_LABELS = [r"Total\s*Weight", r"Weight"]
+
+
+def labeled_value_patterns(labels):
+    """Value-on-the-next-line and same-line patterns of a label field."""
+    escaped = "|".join(labels)
+    return [
+        rf"(?:{escaped})\s*(?:\([^)]*\))?\s*(?::|\-)?\s*\n\s*([^\n]+)",
+        rf"(?:{escaped})\s*(?:\([^)]*\))?\s*(?::|\-)\s*([^\n]+)",
+    ]
+
+
+SECTION_FIELDS = {
+    name: [re.compile(pattern, re.I) for pattern in labeled_value_patterns(labels)]
+    for name, labels in (
+        ("pickup", PICKUP_LABELS),
+        ("delivery", DELIVERY_LABELS),
+        ("delivery_date", DELIVERY_DATE_LABELS),
+        ("pallets", PALLET_LABELS),
+        ("pallet_size", PALLET_SIZE_LABELS),
+        ("weight", WEIGHT_LABELS),
+    )
+}
+
+_AMOUNT = r"(\d+(?:,\d{3})*(?:\.\d+)?)"
+TERM_PATTERNS = {
+    name: [re.compile(pattern, re.I) for pattern in patterns]
+    for name, patterns in (
+        ("rate", [rf"(?:rate|line\s*haul|all\s*in)\s*[:$]?\s*{_AMOUNT}", rf"\${_AMOUNT}"]),
+        ("tonu", [r"\btonu\b"]),
+        ("detention", [r"\bdetention\b"]),
+        ("pump_truck", [r"pump\s*truck|pallet\s*jack"]),
+        ("reefer_temp", [r"(?:reefer|temp(?:erature)?)\s*[:=-]?\s*([-+]?\d+(?:\.\d+)?)"]),
+        ("pallets", [r"(?:#\s*of\s*pallets|pallets?)\s*[:=-]?\s*(\d+(?:\.\d+)?)"]),
+        ("weight", [rf"(?:weight|lbs?)\s*[:=-]?\s*{_AMOUNT}"]),
+        ("load_number", [r"load\s*(?:#|number|no\.?)\s*[:=-]?\s*([A-Za-z0-9-]+)"]),
+        ("customer_po", [r"(?:customer\s*)?po\s*(?:#|number|no\.?)\s*[:=-]?\s*([A-Za-z0-9-]+)"]),
+    )
+}
+# Terms reported as found / not found rather than by value.
+FLAG_TERMS = ("tonu", "detention", "pump_truck")
+
+# Keyword (lower case) -> grammar entries that can start at it: "marker", a section
+# field or a ``term:`` commercial term. No keyword is a prefix of another.
+KEYWORDS = {
+    "load": ("marker", "term:load_number"),
+    "pickup": ("pickup",),
+    "origin": ("pickup",),
+    "ship": ("pickup", "delivery"),
+    "delivery": ("delivery", "delivery_date"),
+    "destination": ("delivery",),
+    "receiver": ("delivery",),
+    "consignee": ("delivery",),
+    "drop": ("delivery", "delivery_date"),
+    "due": ("delivery_date",),
+    "#": ("pallets", "term:pallets"),
+    "pallet": ("pallets", "pallet_size", "term:pallets", "term:pump_truck"),
+    "total": ("weight",),
+    "weight": ("weight", "term:weight"),
+    "lb": ("term:weight",),
+    "rate": ("term:rate",),
+    "line": ("term:rate",),
+    "all": ("term:rate",),
+    "$": ("term:rate",),
+    "tonu": ("term:tonu",),
+    "detention": ("term:detention",),
+    "pump": ("term:pump_truck",),
+    "reefer": ("term:reefer_temp",),
+    "temp": ("term:reefer_temp",),
+    "customer": ("term:customer_po",),
+    "po": ("term:customer_po",),
+}
+_KEYWORD_ENTRIES = list(KEYWORDS.values())
+# Consumes only the first character of a keyword, so overlapping keywords ("all"
+# inside "pallet") are all reported, and lets the engine skip to candidate letters.
+_KEYWORD_STARTS = {}
+for _idx, _keyword in enumerate(KEYWORDS):
+    _KEYWORD_STARTS.setdefault(_keyword[0], []).append(f"(?P<k{_idx}>{re.escape(_keyword[1:])})")
+_KEYWORD_SCAN = re.compile(
+    "|".join(f"{re.escape(first)}(?=" + "|".join(rests) + ")" for first, rests in _KEYWORD_STARTS.items()), re.I
+)
+
+
+def scan(text):
+    """Positions of each grammar entry's keywords in ``text``, in ascending order."""
+    text = text or ""
+    positions = {}
+    if text.isascii():
+        # Plain ASCII lower-cases without shifting offsets, and str.find beats any
+        # regex pass over the text.
+        lowered = text.lower()
+        for keyword, entries in KEYWORDS.items():
+            found, position = [], lowered.find(keyword)
+            while position >= 0:
+                found.append(position)
+                position = lowered.find(keyword, position + 1)
+            for entry in entries if found else ():
+                positions.setdefault(entry, []).extend(found)
+        for found in positions.values():
+            found.sort()
+        return positions
+    for match in _KEYWORD_SCAN.finditer(text):
+        for entry in _KEYWORD_ENTRIES[int(match.lastgroup[1:])]:
+            positions.setdefault(entry, []).append(match.start())
+    return positions
+
+
+def load_markers(text, positions=None):
+    """``LOAD #`` marker matches of ``text`` (as ``LOAD_MARKER.finditer`` returns them)."""
+    text = text or ""
+    positions = scan(text) if positions is None else positions
+    markers, floor = [], 0
+    for position in positions.get("marker", ()):
+        if position < floor:
+            continue
+        # The marker match starts at the line start before any leading blank lines.
+        start = position
+        while start > floor and text[start - 1].isspace():
+            start -= 1
+        if start > 0 and text[start - 1] != "\n":
+            newline = text.find("\n", start, position)
+            if newline < 0:
+                continue
+            start = newline + 1
+        match = LOAD_MARKER.match(text, start)
+        if match:
+            markers.append(match)
+            floor = match.end()
+    return markers
+
+
+def _first_value(text, patterns, positions, start, end):
+    for pattern in patterns:
+        for position in positions:
+            if start <= position < end:
+                match = pattern.match(text, position, end)
+                if match:
+                    return (match.group(1) or "").strip()
+    return None
+
+
+def load_sections(text, positions=None):
+    """Sections of ``text`` with their label fields.
+
+    One ``{"label", "key", "text", "fields"}`` dict per ``LOAD #`` marker (``label``
+    is the marker as written), or a single unlabelled section for text without
+    markers; ``fields`` maps each ``SECTION_FIELDS`` name to its stripped value or
+    ``None``.
+    """
+    text = text or ""
+    positions = scan(text) if positions is None else positions
+    markers = load_markers(text, positions)
+    bounds = [(marker.start(), markers[idx + 1].start() if idx + 1 < len(markers) else len(text)) for idx, marker in enumerate(markers)]
+    if not markers:
+        if not text.strip():
+            return []
+        bounds = [(0, len(text))]
+    sections = []
+    for idx, (start, end) in enumerate(bounds, 1):
+        block = text[start:end]
+        start, end = start + len(block) - len(block.lstrip()), start + len(block.rstrip())
+        sections.append(
+            {
+                "label": markers[idx - 1].group(1) if markers else None,
+                "key": f"section_{idx}",
+                "text": text[start:end],
+                "fields": {
+                    name: _first_value(text, patterns, positions.get(name, ()), start, end)
+                    for name, patterns in SECTION_FIELDS.items()
+                },
+            }
+        )
+    return sections
+
+
+def commercial_terms(text, positions=None):
+    """Raw commercial terms of ``text``: matched strings, or booleans for ``FLAG_TERMS``."""
+    text = text or ""
+    positions = scan(text) if positions is None else positions
+    terms = {}
+    for name, patterns in TERM_PATTERNS.items():
+        found = None
+        for pattern in patterns:
+            last, floor = None, 0
+            # Non-overlapping, like re.finditer.
+            for position in positions.get(f"term:{name}", ()):
+                if position >= floor:
+                    match = pattern.match(text, position)
+                    if match:
+                        last, floor = match, match.end()
+            found = last or found
+        if name in FLAG_TERMS:
+            terms[name] = bool(found)
+        else:
+            terms[name] = found.group(1).strip() if found else None
+    return terms
@@ -0,0 +1,76 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Thread-safe bounded LRU mapping with an optional per-entry TTL.
+
+    Instances are meant to live at module level so they are shared by every
+    service object created inside the same Odoo worker process.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.maxsize = max(int(maxsize or 0), 0)
+        self.ttl = float(ttl) if ttl else None
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self, maxsize=None, ttl=None):
+        with self._lock:
+            if maxsize is not None:
+                self.maxsize = max(int(maxsize), 0)
+            if ttl is not None:
+                self.ttl = float(ttl) if ttl else None
+            self._trim()
+
+    def _trim(self):
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, stored_at = entry
+                if self.ttl is None or (time.monotonic() - stored_at) <= self.ttl:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        with self._lock:
+            if not self.maxsize:
+                return
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            self._trim()
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+            return entry[0] if entry is not None else default
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+            }
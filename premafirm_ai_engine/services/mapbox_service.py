@@ -1,15 +1,116 @@
-import hashlib
 import logging
 import math
-import time
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from urllib.parse import quote
+from zoneinfo import ZoneInfo
 
-import requests
 from psycopg2 import IntegrityError
 
+from .geo_utils import canonical_address, geohash_decode, geohash_encode, haversine_km, pack_polyline
+from .http_client import HttpClient, TokenBucket
+from .lru_cache import LRUCache
+from .route_estimator import RouteEstimator
+
 _logger = logging.getLogger(__name__)
 
+# Process-wide, shared by every MapboxService instance of this worker.
+_GEOCODE_MEMORY_CACHE = LRUCache(maxsize=2048, ttl=6 * 3600)
+_ROUTE_MEMORY_CACHE = LRUCache(maxsize=4096, ttl=3600)
+_HTTP_CLIENT = HttpClient(rate_limiter=TokenBucket(300))
+# One fitted RouteEstimator per database, refitted from the route cache hourly.
+_ROUTE_ESTIMATORS = LRUCache(maxsize=16, ttl=3600)
+
+# cr.precommit.data keys of the transaction's LegResolvers (estimate-mode legs are kept apart).
+LEG_RESOLVER_KEY = "premafirm.leg_resolver"
+ESTIMATE_LEG_RESOLVER_KEY = "premafirm.leg_resolver.estimate"
+# Context key: answer every route from the offline RouteEstimator, with no Mapbox calls.
+ROUTE_ESTIMATE_MODE_KEY = "route_estimate_mode"
+
+
+class LegResolver:
+    """Legs resolved during one transaction, keyed by normalized ``(origin, destination)``.
+
+    Every ``MapboxService`` of a transaction shares one resolver, so a lead's
+    schedule and the run simulation that follows it read each leg once, and
+    ``resolve`` answers a whole list of pairs with one cache pass and one batch
+    of Directions requests for the rest. A timed leg is answered by any
+    departure bucket already resolved for the same pair within
+    ``premafirm.route_departure_fallback_hours``, the nearest one first, the
+    same tolerance the route cache applies: departures guessed before
+    scheduling (new stops have none) differ from the ones the schedule then
+    sets by a few hours, which is not worth another request within one
+    transaction, while a leg further off is routed in its own traffic.
+    """
+
+    def __init__(self):
+        self.legs = {}
+        # (origin, destination) -> departure buckets resolved for it.
+        self.buckets = {}
+
+    def held(self, key, tolerance=0):
+        """Key of the resolved leg answering ``key``, or None when no bucket within ``tolerance`` hours is held."""
+        if key in self.legs:
+            return key
+        hours = self.buckets.get(key[:2])
+        if not hours or not key[2] or tolerance <= 0:
+            return None
+        week = MapboxService.HOURS_PER_WEEK
+
+        def gap(hour):
+            if not hour or not key[2]:
+                return week
+            distance = abs(hour - key[2]) % week
+            return min(distance, week - distance)
+
+        nearest = min(hours, key=gap)
+        return key[:2] + (nearest,) if gap(nearest) <= tolerance else None
+
+    def store(self, key, travel):
+        self.legs[key] = dict(travel)
+        self.buckets.setdefault(key[:2], set()).add(key[2])
+
+    @staticmethod
+    def _chains(keys):
+        """Group leg keys into chains wherever one leg ends where the next starts."""
+        chains = []
+        for key in keys:
+            if chains and chains[-1][-1][1] == key[0]:
+                chains[-1].append(key)
+            else:
+                chains.append([key])
+        return chains
+
+    def resolve(self, map_service, pairs, chain=True):
+        """Travel dicts for ``pairs`` in order; unknown legs are routed together.
+
+        A pair is ``(origin, destination)`` or ``(origin, destination, departure)``;
+        timed legs are keyed by their route-cache departure bucket. With ``chain``
+        consecutive legs share multi-waypoint Directions requests, otherwise each
+        leg is its own (concurrent) request.
+        """
+        keys = []
+        departures = {}
+        for pair in pairs:
+            departure = pair[2] if len(pair) > 2 else None
+            key = (map_service._normalize_address(pair[0]), map_service._normalize_address(pair[1]), map_service.departure_hour(departure))
+            departures.setdefault(key, departure)
+            keys.append(key)
+        tolerance = map_service._departure_fallback_hours()
+        missing = [key for key in keys if self.held(key, tolerance) is None]
+        if missing and chain:
+            # Repeated legs stay in place so a route revisiting a stop is still one chain.
+            chains = self._chains(missing)
+            addresses = [[key[0] for key in chain_keys] + [chain_keys[-1][1]] for chain_keys in chains]
+            chain_departures = [[departures[key] for key in chain_keys] for chain_keys in chains]
+            for chain_keys, legs in zip(chains, map_service._route_chains(addresses, chain_departures)):
+                for key, travel in zip(chain_keys, legs):
+                    self.store(key, travel)
+        elif missing:
+            missing = list(dict.fromkeys(missing))
+            for key, travel in zip(missing, map_service._lookup_travel_times(missing, [departures[key] for key in missing])):
+                self.store(key, travel)
+        return [dict(self.legs[self.held(key, tolerance)]) for key in keys]
+
 
 class MapboxService:
     ORIGIN_YARD = False
@@ -18,23 +119,406 @@ class MapboxService:
     MAX_LATITUDE = 83.0
     MIN_LONGITUDE = -170.0
     MAX_LONGITUDE = -50.0
+    # Mapbox Directions accepts at most 25 coordinates per request.
+    MAX_DIRECTIONS_WAYPOINTS = 25
+
+    GEOCODE_CACHE_TTL_DAYS = 90
+    ROUTE_CACHE_LRU_SIZE = 4096
+    ROUTE_CACHE_LRU_TTL_SECONDS = 3600
+    # Account-wide Mapbox quota, shared by every Odoo worker process.
+    MAPBOX_REQUESTS_PER_MINUTE = 300
+    HTTP_MAX_WORKERS = 8
+    # Timed route-cache rows are bucketed by local hour of the week; 0 turns bucketing off.
+    ROUTE_DEPARTURE_BUCKET_HOURS = 1
+    # A populated bucket at most this many hours away counts as a hit; 0 means exact buckets only.
+    # Traffic a few hours apart differs far less than an extra Directions call costs.
+    ROUTE_DEPARTURE_FALLBACK_HOURS = 3
+    HOURS_PER_WEEK = 168
+    # Route-cache endpoints are geohash cells of this precision (7 ~ 150 m); 0 keys by canonical address.
+    ROUTE_CACHE_GEOHASH_PRECISION = 7
+    # Most recent route-cache legs the offline estimator is fitted on.
+    ROUTE_ESTIMATOR_SAMPLE_LIMIT = 20000
+    # Route-cache rows older than this are still served, and refreshed by the warm-up cron while in use.
+    ROUTE_CACHE_TTL_DAYS = 30
+    # Scalar columns a lookup reads (covered by the cache's lookup index).
+    CACHE_LOOKUP_FIELDS = ["distance_km", "duration_minutes", "cached_at"]
+    DEFAULT_TZ = "America/Toronto"
 
     def __init__(self, env):
         self.env = env
-        self._memory_cache = {}
+        self._memory_cache = _ROUTE_MEMORY_CACHE
+        self._memory_cache_configured = False
+        self._http_client_configured = False
+        self._leg_resolver = None
+        self._departure_bucket_hours = None
+
+    def _get_param(self, key, default=None):
+        try:
+            value = self.env["ir.config_parameter"].sudo().get_param(key)
+        except Exception:
+            return default
+        return default if value in (None, False, "") else value
+
+    def _get_float_param(self, key, default):
+        try:
+            return float(self._get_param(key, default))
+        except (TypeError, ValueError):
+            return float(default)
 
+    def _cache_namespace(self):
+        cr = getattr(self.env, "cr", None)
+        return getattr(cr, "dbname", "") or ""
+
+    def _get_model(self, model_name):
+        try:
+            return self.env[model_name]
+        except Exception:
+            return None
 
     def _get_cache_model(self):
+        return self._get_model("premafirm.mapbox.cache")
+
+    @staticmethod
+    def _geocode_cache_key(address):
+        return canonical_address(address)
+
+    @staticmethod
+    def _geocode_from_cache_record(rec):
+        country_code = (rec.country_code or "").upper()
+        return {
+            "latitude": rec.latitude,
+            "longitude": rec.longitude,
+            "full_address": rec.full_address,
+            "postal_code": rec.postal_code or None,
+            "country": country_code,
+            "country_code": country_code,
+            "city": rec.city or None,
+            "region": rec.region or None,
+            "short_address": rec.short_address,
+            "place_categories": [c for c in (rec.place_categories or "").split(",") if c],
+        }
+
+    def _geocode_cache_lookup(self, address_key):
+        """Return ``(geocode, fresh)`` from the in-process LRU or the persistent cache."""
+        memory_key = (self._cache_namespace(), address_key)
+        cached = _GEOCODE_MEMORY_CACHE.get(memory_key)
+        if cached is not None:
+            return dict(cached), True
+        cache_model = self._get_model("premafirm.geocode.cache")
+        if not cache_model:
+            return None, False
+        rec = cache_model.search([("address_key", "=", address_key)], limit=1)
+        if not rec:
+            return None, False
+        geo = self._geocode_from_cache_record(rec)
+        ttl_days = self._get_float_param("premafirm.geocode_cache_ttl_days", self.GEOCODE_CACHE_TTL_DAYS)
+        fresh = not rec.fetched_at or rec.fetched_at >= datetime.utcnow() - timedelta(days=ttl_days)
+        if fresh:
+            _GEOCODE_MEMORY_CACHE.set(memory_key, geo)
+        return dict(geo), fresh
+
+    def _geocode_cache_store(self, address_key, address, geo):
+        _GEOCODE_MEMORY_CACHE.set((self._cache_namespace(), address_key), dict(geo))
+        cache_model = self._get_model("premafirm.geocode.cache")
+        if not cache_model:
+            return
+        vals = {
+            "address_key": address_key,
+            "address": address,
+            "latitude": geo.get("latitude") or 0.0,
+            "longitude": geo.get("longitude") or 0.0,
+            "full_address": geo.get("full_address"),
+            "short_address": geo.get("short_address"),
+            "country_code": geo.get("country_code") or "",
+            "city": geo.get("city"),
+            "region": geo.get("region"),
+            "postal_code": geo.get("postal_code"),
+            "place_categories": ",".join(geo.get("place_categories") or []),
+            "fetched_at": datetime.utcnow(),
+        }
+        try:
+            with self.env.cr.savepoint():
+                rec = cache_model.search([("address_key", "=", address_key)], limit=1)
+                if rec:
+                    rec.write(vals)
+                else:
+                    cache_model.create(vals)
+        except IntegrityError:
+            # A concurrent worker stored the same address first; its row is as good as ours.
+            _logger.debug("Geocode cache entry for %s stored concurrently", address_key)
+
+    def _configure_memory_cache(self):
+        if self._memory_cache_configured:
+            return
+        self._memory_cache_configured = True
+        size = self._get_float_param("premafirm.route_cache_lru_size", self.ROUTE_CACHE_LRU_SIZE)
+        ttl = self._get_float_param("premafirm.route_cache_lru_ttl_seconds", self.ROUTE_CACHE_LRU_TTL_SECONDS)
+        if size != self._memory_cache.maxsize or (ttl or None) != self._memory_cache.ttl:
+            self._memory_cache.configure(maxsize=int(size), ttl=ttl)
+
+    @staticmethod
+    def _route_cache_key(dbname, origin, destination, waypoint_hash="", departure_hour=0):
+        return (dbname or "", origin, destination, waypoint_hash or "", int(departure_hour or 0))
+
+    @classmethod
+    def invalidate_route_cache(cls, dbname, keys=None):
+        """Drop route LRU entries of ``dbname``.
+
+        ``keys`` are ``(origin, destination, waypoint_hash, departure_hour)`` tuples;
+        without keys the whole process-wide cache is cleared.
+        """
+        if keys is None:
+            _ROUTE_MEMORY_CACHE.clear()
+            return
+        for origin, destination, waypoint_hash, departure_hour in keys:
+            _ROUTE_MEMORY_CACHE.pop(cls._route_cache_key(dbname, origin, destination, waypoint_hash, departure_hour))
+
+    @staticmethod
+    def route_cache_stats():
+        return _ROUTE_MEMORY_CACHE.stats()
+
+    def _departure_tz(self):
+        try:
+            tz_name = self.env.company.partner_id.tz
+        except Exception:
+            tz_name = None
+        try:
+            return ZoneInfo(tz_name or self.DEFAULT_TZ)
+        except Exception:
+            return ZoneInfo(self.DEFAULT_TZ)
+
+    def departure_hour(self, departure):
+        """Route-cache ``departure_hour`` of a (naive UTC) departure.
+
+        Local hours of the week are grouped into buckets of
+        ``premafirm.route_departure_bucket_hours``; the key is 1 + the first hour of
+        the bucket, and 0 means untimed (no departure, or bucketing turned off).
+        """
+        if self._departure_bucket_hours is None:
+            self._departure_bucket_hours = int(self._get_float_param("premafirm.route_departure_bucket_hours", self.ROUTE_DEPARTURE_BUCKET_HOURS))
+        size = self._departure_bucket_hours
+        if not departure or size <= 0:
+            return 0
+        if departure.tzinfo is None:
+            departure = departure.replace(tzinfo=timezone.utc)
+        local = departure.astimezone(self._departure_tz())
+        hour_of_week = local.weekday() * 24 + local.hour
+        return hour_of_week - hour_of_week % size + 1
+
+    @staticmethod
+    def _depart_at(departure):
+        """Mapbox ``depart_at`` for ``departure``, moved forward by whole weeks so it is never in the past."""
+        if departure.tzinfo is None:
+            departure = departure.replace(tzinfo=timezone.utc)
+        now = datetime.now(timezone.utc)
+        if departure < now:
+            departure += timedelta(weeks=math.ceil((now - departure) / timedelta(weeks=1)))
+        return departure.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    def bucket_departure(self, departure_hour, now=None):
+        """Next naive UTC datetime inside the departure bucket ``departure_hour`` (None when untimed)."""
+        if not departure_hour:
+            return None
+        local_now = (now or datetime.now(timezone.utc)).astimezone(self._departure_tz())
+        week_start = local_now.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=local_now.weekday())
+        local = week_start + timedelta(hours=departure_hour - 1)
+        if local < local_now:
+            local += timedelta(weeks=1)
+        return local.astimezone(timezone.utc).replace(tzinfo=None)
+
+    def refresh_cache_rows(self, rows):
+        """Re-route geohash-keyed route-cache ``rows`` (origin, destination, departure_hour) in one batch.
+
+        Endpoints are the centres of their geohash cells, so no geocoding is needed.
+        Returns the number of rows refreshed.
+        """
+        legs = []
+        for row in rows:
+            if not (row.origin.startswith("gh:") and row.destination.startswith("gh:")):
+                continue
+            points = [geohash_decode(row.origin[3:]), geohash_decode(row.destination[3:])]
+            url = self._directions_url(
+                [(longitude, latitude) for latitude, longitude in points],
+                overview="false",
+                depart_at=self.bucket_departure(row.departure_hour),
+            )
+            if url:
+                legs.append((row, url))
+        pending = []
+        for (row, _url), data in zip(legs, self._fetch_many([url for _row, url in legs])):
+            route_legs = (((data or {}).get("routes") or [{}])[0].get("legs") or [])[:1]
+            for route_leg in route_legs:
+                distance_km = float(route_leg.get("distance") or 0.0) / 1000.0
+                drive_minutes = float(route_leg.get("duration") or 0.0) / 60.0
+                if distance_km or drive_minutes:
+                    pending.append(self._cache_entry(row.origin, row.destination, distance_km, drive_minutes, "", row.departure_hour))
+        self.cache_store_many(pending)
+        return len(pending)
+
+    @staticmethod
+    def leg_departures(start, stops, return_home=False):
+        """Departure estimate of every leg of a trip from the origin through ``stops``.
+
+        The first leg leaves at ``start``, each later one when the stop before it
+        ended the last time it was scheduled.
+        """
+        stops = list(stops)
+        departures = [start]
+        for stop in stops if return_home else stops[:-1]:
+            departures.append(getattr(stop, "scheduled_end_datetime", False) or getattr(stop, "estimated_arrival", False) or departures[-1])
+        return departures
+
+    def _route_keys(self, geocoded):
+        """Route-cache endpoint key of every address in ``geocoded`` (address -> geocode).
+
+        Coordinates come first: a geocoded address is keyed by its
+        ``premafirm.route_cache_geohash_precision`` geohash cell (``gh:...``), so
+        spelling variants and docks in the same cell share cached legs. Addresses
+        without coordinates fall back to their canonical spelling.
+        """
+        precision = int(self._get_float_param("premafirm.route_cache_geohash_precision", self.ROUTE_CACHE_GEOHASH_PRECISION))
+        keys = {}
+        for address, geo in geocoded.items():
+            if precision > 0 and geo and not self._point_warning(geo):
+                keys[address] = "gh:" + geohash_encode(geo["latitude"], geo["longitude"], precision)
+            else:
+                keys[address] = canonical_address(address)
+        return keys
+
+    def _geocode_addresses(self, addresses):
+        unique = list(dict.fromkeys(addresses))
+        return dict(zip(unique, self.geocode_many(unique))) if unique else {}
+
+    def estimate_mode(self):
+        """True when the context asks for offline estimates (``route_estimate_mode``): Mapbox is never called."""
+        return bool((getattr(self.env, "context", None) or {}).get(ROUTE_ESTIMATE_MODE_KEY))
+
+    def route_estimator(self):
+        """This database's ``RouteEstimator``, fitted on the route cache at most once an hour per worker."""
+        namespace = self._cache_namespace()
+        estimator = _ROUTE_ESTIMATORS.get(namespace)
+        if estimator is None:
+            estimator = RouteEstimator(self._route_estimator_samples())
+            _ROUTE_ESTIMATORS.set(namespace, estimator)
+        return estimator
+
+    def _route_estimator_samples(self):
+        """``RouteEstimator`` samples from the most recent geohash-keyed route-cache rows."""
+        cache_model = self._get_cache_model()
+        if not cache_model:
+            return []
+        limit = int(self._get_float_param("premafirm.route_estimator_sample_limit", self.ROUTE_ESTIMATOR_SAMPLE_LIMIT))
+        query = (
+            f'SELECT origin, destination, distance_km, duration_minutes FROM "{cache_model._table}" '
+            "WHERE origin LIKE %s AND destination LIKE %s AND COALESCE(waypoint_hash, '') = '' "
+            "AND distance_km > 0 AND duration_minutes > 0 ORDER BY cached_at DESC LIMIT %s"
+        )
+        cache_model.flush_model()
         try:
-            return self.env["premafirm.mapbox.cache"]
+            with self.env.cr.savepoint():
+                self.env.cr.execute(query, ["gh:%", "gh:%", limit])
+                rows = self.env.cr.fetchall()
         except Exception:
+            _logger.warning("Route estimator could not read the route cache", exc_info=True)
+            return []
+        samples = []
+        for origin, destination, distance_km, duration_minutes in rows:
+            try:
+                origin_point, destination_point = geohash_decode(origin[3:]), geohash_decode(destination[3:])
+            except ValueError:
+                continue
+            samples.append((origin[3:], destination[3:], self._haversine_km(*origin_point, *destination_point), distance_km, duration_minutes))
+        return samples
+
+    def estimate_route(self, origin, destination, map_url=None, reason=None):
+        """Offline ``get_route``-shaped estimate between two routable geocodes.
+
+        ``reason`` names why Mapbox was not used and always ends up in the warning;
+        without one (estimate mode) only low-confidence estimates carry a warning.
+        """
+        estimator = self.route_estimator()
+        estimate = estimator.estimate(
+            geohash_encode(origin["latitude"], origin["longitude"], estimator.REGION_PRECISION),
+            geohash_encode(destination["latitude"], destination["longitude"], estimator.REGION_PRECISION),
+            self._haversine_km(origin["latitude"], origin["longitude"], destination["latitude"], destination["longitude"]),
+        )
+        if reason:
+            warning = f"{reason}; used offline estimate ({estimate['confidence']} confidence)."
+        else:
+            warning = "Low-confidence offline route estimate." if estimate["confidence"] == "low" else False
+        return {
+            "distance_km": estimate["distance_km"],
+            "drive_hours": estimate["drive_hours"],
+            "geometry": None,
+            "map_url": map_url,
+            "warning": warning,
+            "estimated": True,
+            "confidence": estimate["confidence"],
+        }
+
+    def _departure_fallback_hours(self):
+        return self._get_float_param("premafirm.route_departure_fallback_hours", self.ROUTE_DEPARTURE_FALLBACK_HOURS)
+
+    def _cache_lookup_leg(self, origin, destination, departure_hour=0):
+        """Exact bucket, then a populated one within ``premafirm.route_departure_fallback_hours``."""
+        cached = self._cache_lookup(origin, destination, "", departure_hour)
+        if cached or not departure_hour:
+            return cached
+        tolerance = self._departure_fallback_hours()
+        return self._cache_lookup_nearest(origin, destination, departure_hour, tolerance) if tolerance > 0 else None
+
+    def _cache_lookup_nearest(self, origin, destination, departure_hour, max_hours=None):
+        """Cached leg of the populated bucket closest (around the week) to ``departure_hour``.
+
+        Untimed rows only qualify without ``max_hours``, as the last resort.
+        """
+        cache_model = self._get_cache_model()
+        if not cache_model:
             return None
+        best = None
+        domain = [("origin", "=", origin), ("destination", "=", destination), ("waypoint_hash", "=", "")]
+        for rec in self._cache_search(cache_model, domain, ["departure_hour"]):
+            gap = self.HOURS_PER_WEEK
+            if rec.departure_hour:
+                gap = abs(rec.departure_hour - departure_hour) % self.HOURS_PER_WEEK
+                gap = min(gap, self.HOURS_PER_WEEK - gap)
+            if max_hours is not None and gap > max_hours:
+                continue
+            if best is None or gap < best[0]:
+                best = (gap, rec)
+        if best is None:
+            return None
+        rec = best[1]
+        self._record_cache_hits(rec)
+        return {"distance_km": rec.distance_km, "drive_minutes": rec.duration_minutes, "warning": False}
+
+    def _cache_search(self, cache_model, domain, extra_fields=(), limit=None):
+        """Route-cache rows with only the lookup columns fetched, in one query where the ORM allows it."""
+        search_fetch = getattr(cache_model, "search_fetch", None)
+        if search_fetch is None:
+            return cache_model.search(domain, limit=limit)
+        return search_fetch(domain, self.CACHE_LOOKUP_FIELDS + list(extra_fields), limit=limit)
+
+    def _record_cache_hits(self, records):
+        """Count lookups served by cache rows (see ``premafirm.cache.eviction.mixin``).
+
+        Only database reads count (lookups answered by the in-process LRU are not
+        seen), which is enough to order rows for eviction and stale refreshes.
+        """
+        record_hits = getattr(records, "_record_hits", None)
+        if records and record_hits is not None:
+            record_hits()
 
     def _cache_lookup(self, origin, destination, waypoint_hash="", departure_hour=0):
+        self._configure_memory_cache()
+        memory_key = self._route_cache_key(self._cache_namespace(), origin, destination, waypoint_hash, departure_hour)
+        cached = self._memory_cache.get(memory_key)
+        if cached is not None:
+            return dict(cached)
         cache_model = self._get_cache_model()
         if not cache_model:
             return None
-        rec = cache_model.search([
+        rec = self._cache_search(cache_model, [
             ("origin", "=", origin),
             ("destination", "=", destination),
             ("waypoint_hash", "=", waypoint_hash),
@@ -42,18 +526,18 @@ class MapboxService:
         ], limit=1)
         if not rec:
             return None
-        return {
+        self._record_cache_hits(rec)
+        result = {
             "distance_km": rec.distance_km,
             "drive_minutes": rec.duration_minutes,
-            "polyline": rec.polyline,
             "warning": False,
         }
+        self._memory_cache.set(memory_key, result)
+        return dict(result)
 
-    def _cache_store(self, origin, destination, waypoint_hash, departure_hour, distance_km, duration_minutes, polyline):
-        cache_model = self._get_cache_model()
-        if not cache_model:
-            return
-        vals = {
+    @staticmethod
+    def _cache_entry(origin, destination, distance_km, duration_minutes, waypoint_hash="", departure_hour=0, polyline=""):
+        return {
             "origin": origin,
             "destination": destination,
             "waypoint_hash": waypoint_hash or "",
@@ -62,23 +546,100 @@ class MapboxService:
             "duration_minutes": float(duration_minutes or 0.0),
             "polyline": polyline or "",
         }
-        domain = [
-            ("origin", "=", origin),
-            ("destination", "=", destination),
-            ("waypoint_hash", "=", vals["waypoint_hash"]),
-            ("departure_hour", "=", vals["departure_hour"]),
-        ]
-        rec = cache_model.search(domain, limit=1)
-        if rec:
-            rec.write(vals)
-        else:
+
+    def _cache_store(self, origin, destination, waypoint_hash, departure_hour, distance_km, duration_minutes, polyline):
+        self.cache_store_many([
+            self._cache_entry(origin, destination, distance_km, duration_minutes, waypoint_hash, departure_hour, polyline)
+        ])
+
+    def cache_store_many(self, entries):
+        """Upsert route cache rows in a single ``INSERT ... ON CONFLICT`` statement.
+
+        ``entries`` are dicts shaped like ``_cache_entry``; duplicates within the batch
+        collapse to the last one. Polylines go to ``premafirm.mapbox.cache.geometry``
+        in a second statement, only when an entry carries one. The statements run
+        inside a savepoint so a failed cache write never aborts the caller's
+        transaction.
+        """
+        self._configure_memory_cache()
+        unique = {}
+        for entry in entries or []:
+            entry = self._cache_entry(
+                entry["origin"],
+                entry["destination"],
+                entry.get("distance_km"),
+                entry.get("duration_minutes"),
+                entry.get("waypoint_hash"),
+                entry.get("departure_hour"),
+                entry.get("polyline"),
+            )
+            unique[(entry["origin"], entry["destination"], entry["waypoint_hash"], entry["departure_hour"])] = entry
+        if not unique:
+            return
+
+        cache_model = self._get_cache_model()
+        if cache_model:
+            rows = list(unique.values())
+            placeholders = ", ".join(["(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"] * len(rows))
+            now = datetime.utcnow()
+            params = []
+            for row in rows:
+                params.extend([
+                    row["origin"], row["destination"], row["waypoint_hash"], row["departure_hour"],
+                    row["distance_km"], row["duration_minutes"],
+                    now, now, self.env.uid, now, self.env.uid, now,
+                ])
+            # A new row counts as just used, so eviction does not pick it before it had a chance.
+            query = (
+                f'INSERT INTO "{cache_model._table}" '
+                "(origin, destination, waypoint_hash, departure_hour, distance_km, duration_minutes, "
+                "cached_at, last_hit_at, create_uid, create_date, write_uid, write_date) "
+                f"VALUES {placeholders} "
+                "ON CONFLICT (origin, destination, waypoint_hash, departure_hour) DO UPDATE SET "
+                "distance_km = EXCLUDED.distance_km, duration_minutes = EXCLUDED.duration_minutes, "
+                "cached_at = EXCLUDED.cached_at, "
+                "write_uid = EXCLUDED.write_uid, write_date = EXCLUDED.write_date"
+            )
+            geometries = [row for row in rows if row["polyline"]]
+            cache_model.flush_model()
             try:
-                cache_model.create(vals)
-            except IntegrityError:
-                self.env.cr.rollback()
-                rec = cache_model.search(domain, limit=1)
-                if rec:
-                    rec.write(vals)
+                with self.env.cr.savepoint():
+                    self.env.cr.execute(query, params)
+                    if geometries:
+                        self._store_geometries(cache_model, geometries, now)
+            except Exception:
+                _logger.warning("Route cache upsert of %s legs failed", len(rows), exc_info=True)
+            cache_model.invalidate_model()
+
+        namespace = self._cache_namespace()
+        for key, entry in unique.items():
+            self._memory_cache.set(
+                self._route_cache_key(namespace, *key),
+                {
+                    "distance_km": entry["distance_km"],
+                    "drive_minutes": entry["duration_minutes"],
+                    "warning": False,
+                },
+            )
+
+    def _store_geometries(self, cache_model, rows, now):
+        """Upsert the compressed polylines of freshly upserted cache ``rows``."""
+        geometry_model = self.env["premafirm.mapbox.cache.geometry"]
+        geometry_model.flush_model()
+        values = ", ".join(["(%s, %s, %s, %s::int, %s::bytea)"] * len(rows))
+        params = [self.env.uid, now, self.env.uid, now]
+        for row in rows:
+            params.extend([row["origin"], row["destination"], row["waypoint_hash"], row["departure_hour"], pack_polyline(row["polyline"])])
+        self.env.cr.execute(
+            f'INSERT INTO "{geometry_model._table}" (cache_id, data, create_uid, create_date, write_uid, write_date) '
+            "SELECT c.id, v.data, %s, %s, %s, %s "
+            f"FROM (VALUES {values}) AS v(origin, destination, waypoint_hash, departure_hour, data) "
+            f'JOIN "{cache_model._table}" c ON c.origin = v.origin AND c.destination = v.destination '
+            "AND c.waypoint_hash = v.waypoint_hash AND c.departure_hour = v.departure_hour "
+            "ON CONFLICT (cache_id) DO UPDATE SET data = EXCLUDED.data, write_uid = EXCLUDED.write_uid, write_date = EXCLUDED.write_date",
+            params,
+        )
+        geometry_model.invalidate_model()
 
     def _get_api_key(self):
         params = self.env["ir.config_parameter"].sudo()
@@ -88,20 +649,41 @@ class MapboxService:
             or params.get_param("google_maps_api_key")
         )
 
-    def _safe_get(self, url, timeout=20):
-        wait = 0.5
-        for attempt in range(3):
+    def _odoo_worker_count(self):
+        workers = self._get_float_param("premafirm.mapbox_rate_limit_workers", 0)
+        if workers < 1:
             try:
-                response = requests.get(url, timeout=timeout)
-                response.raise_for_status()
-                return response.json()
-            except Exception:
-                if attempt == 2:
-                    _logger.exception("Geocoding/routing request failed: %s", url)
-                    return {}
-                time.sleep(wait)
-                wait *= 2
-        return {}
+                from odoo.tools import config
+
+                workers = float(config.get("workers") or 1)
+            except ImportError:
+                workers = 1.0
+        return max(workers, 1.0)
+
+    def _http_client(self):
+        """Return the process-wide HTTP client, tuned from system parameters.
+
+        Parameters are read once per service instance, on the calling thread, so
+        pool threads running ``_safe_get`` never touch the environment.
+        """
+        if self._http_client_configured:
+            return _HTTP_CLIENT
+        self._http_client_configured = True
+        per_minute = self._get_float_param("premafirm.mapbox_requests_per_minute", self.MAPBOX_REQUESTS_PER_MINUTE)
+        # Each worker process owns its bucket, so it only gets its share of the quota.
+        share = per_minute / self._odoo_worker_count()
+        if _HTTP_CLIENT.rate_limiter.rate_per_minute != share:
+            _HTTP_CLIENT.rate_limiter.configure(share)
+        _HTTP_CLIENT.max_workers = max(int(self._get_float_param("premafirm.mapbox_http_max_workers", self.HTTP_MAX_WORKERS)), 1)
+        return _HTTP_CLIENT
+
+    def _safe_get(self, url, timeout=20):
+        data = self._http_client().get_json(url, timeout=timeout)
+        return data if isinstance(data, dict) else {}
+
+    def _fetch_many(self, urls, timeout=20):
+        """Run ``_safe_get`` for independent URLs concurrently, keeping input order."""
+        return self._http_client().fetch_many(urls, timeout=timeout, fetch=self._safe_get)
 
     def _normalize_address(self, address):
         return (address or "").strip()
@@ -130,21 +712,54 @@ class MapboxService:
         )
 
     def geocode_address(self, address):
-        api_key = self._get_api_key()
-        normalized = self._normalize_address(address)
-        if not api_key or not normalized:
-            return {"warning": "Mapbox access token missing." if not api_key else "Missing address."}
+        return self.geocode_many([address])[0]
 
-        url = (
-            "https://api.mapbox.com/geocoding/v5/mapbox.places/"
-            f"{quote(normalized)}.json?access_token={api_key}&autocomplete=true&limit=1&country=us,ca"
-        )
-        data = self._safe_get(url)
-        features = data.get("features", [])
-        if not features:
-            return {"warning": "Could not geocode address."}
+    def geocode_many(self, addresses):
+        """Geocode ``addresses`` (in order), fetching every uncached address concurrently.
+
+        Cache reads and writes stay on the calling thread; only the HTTP calls run
+        on the shared client's pool.
+        """
+        normalized_list = [self._normalize_address(address) for address in addresses]
+        results = {}
+        pending = {}
+        api_key = None
+        for normalized in normalized_list:
+            if normalized in results or normalized in pending:
+                continue
+            address_key = self._geocode_cache_key(normalized)
+            cached, fresh = self._geocode_cache_lookup(address_key) if address_key else (None, False)
+            if cached and fresh:
+                results[normalized] = cached
+                continue
+            if self.estimate_mode():
+                # Estimate mode never calls Mapbox; a stale geocode is still a usable point.
+                results[normalized] = cached or {"warning": "Address not geocoded yet (route estimate mode)."}
+                continue
+            api_key = api_key or self._get_api_key()
+            if not api_key or not normalized:
+                results[normalized] = cached or {"warning": "Mapbox access token missing." if not api_key else "Missing address."}
+                continue
+            url = (
+                "https://api.mapbox.com/geocoding/v5/mapbox.places/"
+                f"{quote(normalized)}.json?access_token={api_key}&autocomplete=true&limit=1&country=us,ca"
+            )
+            pending[normalized] = (address_key, cached, url)
+
+        responses = self._fetch_many([url for _key, _cached, url in pending.values()])
+        for (normalized, (address_key, cached, _url)), data in zip(pending.items(), responses):
+            features = data.get("features", [])
+            if not features:
+                # Serve a stale cached geocode rather than failing the stop outright.
+                results[normalized] = cached or {"warning": "Could not geocode address."}
+                continue
+            geo = self._parse_geocode_feature(features[0], normalized)
+            if geo.get("latitude") is not None and geo.get("longitude") is not None:
+                self._geocode_cache_store(address_key, normalized, geo)
+            results[normalized] = geo
+        return [dict(results[normalized]) for normalized in normalized_list]
 
-        first = features[0]
+    def _parse_geocode_feature(self, first, normalized):
         center = first.get("center") or [None, None]
         context = first.get("context") or []
         city = None
@@ -179,18 +794,18 @@ class MapboxService:
         }
 
 
-    def _directions_for_coordinates(self, coordinates):
+    def _directions_url(self, coordinates, overview="full", depart_at=None):
         api_key = self._get_api_key()
-        if not api_key:
-            return {}
+        if not api_key or self.estimate_mode():
+            return None
         joined = ";".join(f"{lon},{lat}" for lon, lat in coordinates if lat is not None and lon is not None)
         if ";" not in joined:
-            return {}
+            return None
         url = (
             "https://api.mapbox.com/directions/v5/mapbox/driving-traffic/"
-            f"{joined}?access_token={api_key}&overview=full&steps=false&annotations=duration,distance&geometries=geojson"
+            f"{joined}?access_token={api_key}&overview={overview}&steps=false&annotations=duration,distance&geometries=geojson"
         )
-        return self._safe_get(url)
+        return url + f"&depart_at={self._depart_at(depart_at)}" if depart_at else url
 
     def _google_maps_url(self, origin, destination):
         return (
@@ -202,25 +817,45 @@ class MapboxService:
 
     @staticmethod
     def _haversine_km(lat1, lon1, lat2, lon2):
-        r = 6371.0
-        p1 = math.radians(lat1)
-        p2 = math.radians(lat2)
-        d1 = math.radians(lat2 - lat1)
-        d2 = math.radians(lon2 - lon1)
-        a = math.sin(d1 / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(d2 / 2) ** 2
-        return r * (2 * math.atan2(math.sqrt(a), math.sqrt(1 - a)))
+        return haversine_km(lat1, lon1, lat2, lon2)
 
     def get_route(self, origin_address, destination_address):
-        api_key = self._get_api_key()
         origin = self.geocode_address(origin_address)
         destination = self.geocode_address(destination_address)
+        url, map_url, result = self._prepare_route(origin, destination)
+        if not url:
+            return result
+        return self._route_from_response(self._safe_get(url), origin, destination, map_url)
+
+    def get_routes_many(self, pairs, departures=None, geocoded=None):
+        """Route ``(origin_address, destination_address)`` pairs with concurrent Directions calls.
+
+        ``departures`` optionally gives each pair's departure datetime (``depart_at``);
+        ``geocoded`` maps addresses the caller already geocoded.
+        """
+        pairs = list(pairs or [])
+        departures = list(departures or [None] * len(pairs))
+        geocoded = dict(geocoded or {})
+        geocoded.update(self._geocode_addresses([address for pair in pairs for address in pair if address not in geocoded]))
+        prepared = [
+            self._prepare_route(geocoded[origin], geocoded[destination], depart_at=departure)
+            for (origin, destination), departure in zip(pairs, departures)
+        ]
+        responses = iter(self._fetch_many([url for url, _map_url, _result in prepared if url]))
+        routes = []
+        for (origin, destination), (url, map_url, result) in zip(pairs, prepared):
+            if url:
+                result = self._route_from_response(next(responses), geocoded[origin], geocoded[destination], map_url)
+            routes.append(result)
+        return routes
+
+    def _prepare_route(self, origin, destination, depart_at=None):
+        """Validate two geocodes; returns ``(url, map_url, result)`` where ``result`` is set when no request is needed."""
+        api_key = self._get_api_key()
         if origin.get("warning") or destination.get("warning"):
-            return {"distance_km": 0.0, "drive_hours": 0.0, "geometry": None, "warning": "Could not geocode one or more stops."}
+            return None, None, {"distance_km": 0.0, "drive_hours": 0.0, "geometry": None, "warning": "Could not geocode one or more stops."}
 
         map_url = self._google_maps_url(origin, destination)
-        if not api_key:
-            return {"distance_km": 0.0, "drive_hours": 0.0, "geometry": None, "map_url": map_url, "warning": "Routing API key missing."}
-
         origin_country = (origin.get("country_code") or "").lower()
         destination_country = (destination.get("country_code") or "").lower()
         if not self._is_allowed_country(origin_country) or not self._is_allowed_country(destination_country):
@@ -229,7 +864,7 @@ class MapboxService:
                 origin_country or "unknown",
                 destination_country or "unknown",
             )
-            return {
+            return None, map_url, {
                 "distance_km": 0.0,
                 "drive_hours": 0.0,
                 "geometry": None,
@@ -249,7 +884,7 @@ class MapboxService:
                 destination_lat,
                 destination_lon,
             )
-            return {
+            return None, map_url, {
                 "distance_km": 0.0,
                 "drive_hours": 0.0,
                 "geometry": None,
@@ -257,45 +892,25 @@ class MapboxService:
                 "warning": "Routing skipped due to invalid coordinates.",
             }
 
+        if self.estimate_mode():
+            return None, map_url, self.estimate_route(origin, destination, map_url)
+        if not api_key:
+            return None, map_url, self.estimate_route(origin, destination, map_url, "Routing API key missing")
+
         coords = f"{origin_lon},{origin_lat};{destination_lon},{destination_lat}"
         url = (
             "https://api.mapbox.com/directions/v5/mapbox/driving-traffic/"
             f"{coords}?access_token={api_key}&overview=full&steps=false&annotations=duration,distance&geometries=geojson"
         )
-        try:
-            response = requests.get(url, timeout=20)
-            response.raise_for_status()
-            data = response.json()
-        except requests.exceptions.HTTPError:
-            _logger.error("Mapbox directions HTTP error for %s", url, exc_info=True)
-            return {
-                "distance_km": 0.0,
-                "drive_hours": 0.0,
-                "geometry": None,
-                "map_url": map_url,
-                "warning": "Routing unavailable; used safe fallback.",
-            }
-        except Exception:
-            _logger.error("Mapbox directions request failed for %s", url, exc_info=True)
-            return {
-                "distance_km": 0.0,
-                "drive_hours": 0.0,
-                "geometry": None,
-                "map_url": map_url,
-                "warning": "Routing unavailable; used safe fallback.",
-            }
+        if depart_at:
+            url += f"&depart_at={self._depart_at(depart_at)}"
+        return url, map_url, None
 
-        routes = data.get("routes") or []
+    def _route_from_response(self, data, origin, destination, map_url):
+        routes = (data or {}).get("routes") or []
         if not routes:
             try:
-                distance_km = self._haversine_km(origin["latitude"], origin["longitude"], destination["latitude"], destination["longitude"])
-                return {
-                    "distance_km": distance_km,
-                    "drive_hours": max(distance_km / 60.0, 0.0),
-                    "geometry": None,
-                    "map_url": map_url,
-                    "warning": "Mapbox route unavailable; used fallback estimate.",
-                }
+                return self.estimate_route(origin, destination, map_url, "Mapbox route unavailable" if data else "Routing unavailable")
             except Exception:
                 return {"distance_km": 0.0, "drive_hours": 0.0, "geometry": None, "map_url": map_url, "warning": "No route found."}
 
@@ -308,52 +923,261 @@ class MapboxService:
         drive_hours = float(sum(float(leg.get("duration") or 0.0) for leg in legs)) / 3600.0
         return {"distance_km": distance_km, "drive_hours": drive_hours, "geometry": route.get("geometry"), "map_url": map_url}
 
+    def leg_resolver(self):
+        """The transaction's shared ``LegResolver`` (one per service when there is no cursor)."""
+        data = getattr(getattr(getattr(self.env, "cr", None), "precommit", None), "data", None)
+        if data is None:
+            if self._leg_resolver is None:
+                self._leg_resolver = LegResolver()
+            return self._leg_resolver
+        key = ESTIMATE_LEG_RESOLVER_KEY if self.estimate_mode() else LEG_RESOLVER_KEY
+        resolver = data.get(key)
+        if resolver is None:
+            resolver = data[key] = LegResolver()
+        return resolver
+
+    def resolve_legs(self, pairs):
+        """Resolve every ``(origin, destination)`` pair a transaction is about to need in one batch."""
+        return self.leg_resolver().resolve(self, pairs)
 
     def get_travel_time(self, origin, destination):
-        origin_n = self._normalize_address(origin)
-        destination_n = self._normalize_address(destination)
-        cached = self._cache_lookup(origin_n, destination_n)
-        if cached:
-            return {
-                "distance_km": float(cached.get("distance_km") or 0.0),
-                "drive_minutes": float(cached.get("drive_minutes") or 0.0),
-                "map_url": None,
-                "warning": False,
-            }
-        route = self.get_route(origin_n, destination_n)
+        resolver = self.leg_resolver()
+        key = (self._normalize_address(origin), self._normalize_address(destination), 0)
+        if resolver.held(key) is None:
+            geocoded = self._geocode_addresses(key[:2])
+            route_keys = self._route_keys(geocoded)
+            cache_key = (route_keys[key[0]], route_keys[key[1]])
+            cached = self._cache_lookup(*cache_key)
+            if cached:
+                resolver.store(key, self._travel_from_cache(cached))
+            else:
+                pending = []
+                route = self.get_routes_many([key[:2]], geocoded=geocoded)[0]
+                resolver.store(key, self._travel_from_route(*cache_key, route, pending))
+                self.cache_store_many(pending)
+        return dict(resolver.legs[resolver.held(key)])
+
+    def get_travel_times(self, pairs):
+        """``get_travel_time`` for many ``(origin, destination[, departure])`` pairs.
+
+        Legs this transaction already resolved are reused; the others are answered
+        from the route cache (by departure bucket when a departure is given) or
+        routed concurrently and written back with a single cache upsert.
+        """
+        return self.leg_resolver().resolve(self, pairs, chain=False)
+
+    def _lookup_travel_times(self, keys, departures=None):
+        """Cache lookup, then concurrent routing, for normalized ``(origin, destination, departure_hour)`` keys."""
+        departures = list(departures or [None] * len(keys))
+        geocoded = self._geocode_addresses([address for key in keys for address in key[:2]])
+        route_keys = self._route_keys(geocoded)
+        travels = []
+        missing = []
+        for idx, (origin, destination, departure_hour) in enumerate(keys):
+            cached = self._cache_lookup_leg(route_keys[origin], route_keys[destination], departure_hour)
+            travels.append(self._travel_from_cache(cached) if cached else None)
+            if not cached:
+                missing.append(idx)
+        pending = []
+        first_departure = {}
+        for idx in missing:
+            first_departure.setdefault(keys[idx], departures[idx])
+        unique_missing = list(first_departure)
+        fetched = dict(zip(unique_missing, self._fetch_travel_times(unique_missing, pending, list(first_departure.values()), geocoded)))
+        for idx in missing:
+            travels[idx] = dict(fetched[keys[idx]])
+        self.cache_store_many(pending)
+        return travels
+
+    @staticmethod
+    def _travel_from_cache(cached):
+        return {
+            "distance_km": float(cached.get("distance_km") or 0.0),
+            "drive_minutes": float(cached.get("drive_minutes") or 0.0),
+            "map_url": None,
+            "warning": False,
+        }
+
+    def _fetch_travel_times(self, pairs, pending, departures=None, geocoded=None):
+        """Route uncached legs concurrently, queueing their cache entries on ``pending``.
+
+        ``pairs`` are ``(origin, destination)`` or ``(origin, destination, departure_hour)``;
+        ``geocoded`` holds geocodes the caller already has.
+        """
+        geocoded = dict(geocoded or {})
+        geocoded.update(self._geocode_addresses([address for pair in pairs for address in pair[:2] if address not in geocoded]))
+        route_keys = self._route_keys(geocoded)
+        routes = self.get_routes_many([pair[:2] for pair in pairs], departures, geocoded=geocoded)
+        return [
+            self._travel_from_route(route_keys[pair[0]], route_keys[pair[1]], route, pending, *pair[2:])
+            for pair, route in zip(pairs, routes)
+        ]
+
+    def _travel_from_route(self, origin_key, destination_key, route, pending, departure_hour=0):
+        """Travel dict of a routed leg; ``origin_key``/``destination_key`` are its route-cache keys."""
         distance_km = float(route.get("distance_km") or 0.0)
         drive_minutes = float(route.get("drive_hours") or 0.0) * 60.0
-        if distance_km or drive_minutes:
-            self._cache_store(origin_n, destination_n, "", 0, distance_km, drive_minutes, "")
-        return {
+        if (distance_km or drive_minutes) and not route.get("estimated"):
+            pending.append(self._cache_entry(origin_key, destination_key, distance_km, drive_minutes, "", departure_hour))
+        elif departure_hour:
+            # No route for this bucket: any bucket we already hold beats an estimate.
+            cached = self._cache_lookup_nearest(origin_key, destination_key, departure_hour)
+            if cached:
+                return self._travel_from_cache(cached)
+        travel = {
             "distance_km": distance_km,
             "drive_minutes": drive_minutes,
             "map_url": route.get("map_url"),
             "warning": route.get("warning"),
         }
+        if route.get("estimated"):
+            travel["confidence"] = route.get("confidence")
+        return travel
 
-    def calculate_trip_segments(self, origin, stops, return_home=True):
-        stop_list = list(stops or [])
+    def _point_warning(self, geo):
+        if not geo or geo.get("warning"):
+            return "Could not geocode one or more stops."
+        if not self._is_allowed_country(geo.get("country_code")):
+            return "Routing supports USA/Canada only."
+        if not self._coordinates_within_us_ca_bounds(geo.get("latitude"), geo.get("longitude")):
+            return "Routing skipped due to invalid coordinates."
+        return False
+
+    def _route_chains(self, chains, departures=None):
+        """Route the consecutive address pairs of every chain with as few Directions requests as possible.
+
+        Every address is geocoded once and each run of routable stops is sent as a
+        single multi-waypoint request (chunked at ``MAX_DIRECTIONS_WAYPOINTS``); the
+        requests of all chains go out in one concurrent batch. ``departures`` gives
+        each leg's departure (or None) per chain: legs are cached under its bucket
+        and a request departs at its first leg's time. Returns, per chain, one
+        travel dict per leg, shaped like ``get_travel_time``.
+        """
+        chains = [list(addresses) for addresses in chains]
+        chain_legs = [[None] * max(len(addresses) - 1, 0) for addresses in chains]
+        departures = [list(chain_departures) for chain_departures in departures] if departures else [[None] * len(legs) for legs in chain_legs]
+        hours = [[self.departure_hour(departure) for departure in chain_departures] for chain_departures in departures]
+        # Addresses resolve to coordinates first; cached legs are probed by geohash cell.
+        geocoded = self._geocode_addresses([address for addresses in chains for address in addresses])
+        route_keys = self._route_keys(geocoded)
+        for addresses, legs, leg_hours in zip(chains, chain_legs, hours):
+            for idx in range(len(legs)):
+                cached = self._cache_lookup_leg(route_keys[addresses[idx]], route_keys[addresses[idx + 1]], leg_hours[idx])
+                if cached:
+                    legs[idx] = self._travel_from_cache(cached)
+        if all(all(legs) for legs in chain_legs):
+            return chain_legs
+        pending = []
+
+        chain_points = [[geocoded[address] for address in addresses] for addresses in chains]
+
+        # Chunks overlap by one point so every leg belongs to exactly one request.
+        step = self.MAX_DIRECTIONS_WAYPOINTS - 1
+        windows = []
+        for chain_idx, (points, legs) in enumerate(zip(chain_points, chain_legs)):
+            leg_count = len(legs)
+            point_warnings = [self._point_warning(geo) for geo in points]
+            for idx in range(leg_count):
+                if legs[idx]:
+                    continue
+                warning = point_warnings[idx] or point_warnings[idx + 1]
+                if warning:
+                    geocoded_pair = not points[idx].get("warning") and not points[idx + 1].get("warning")
+                    map_url = self._google_maps_url(points[idx], points[idx + 1]) if geocoded_pair else None
+                    legs[idx] = {"distance_km": 0.0, "drive_minutes": 0.0, "map_url": map_url, "warning": warning}
+
+            start = 0
+            while start < leg_count:
+                if legs[start]:
+                    start += 1
+                    continue
+                end = start
+                while end < leg_count and not point_warnings[end + 1] and end - start < step:
+                    end += 1
+                if any(legs[idx] is None for idx in range(start, end)):
+                    windows.append((chain_idx, start, end))
+                start = end
+
+        urls = [
+            self._directions_url(
+                [(chain_points[chain_idx][idx]["longitude"], chain_points[chain_idx][idx]["latitude"]) for idx in range(start, end + 1)],
+                overview="false",
+                depart_at=departures[chain_idx][start],
+            )
+            for chain_idx, start, end in windows
+        ]
+        responses = iter(self._fetch_many([url for url in urls if url]))
+        for (chain_idx, start, end), url in zip(windows, urls):
+            data = next(responses) if url else {}
+            routes = data.get("routes") or []
+            route_legs = (routes[0].get("legs") or []) if routes else []
+            if len(route_legs) != end - start:
+                continue
+            addresses, points, legs = chains[chain_idx], chain_points[chain_idx], chain_legs[chain_idx]
+            for offset, idx in enumerate(range(start, end)):
+                if legs[idx]:
+                    continue
+                route_leg = route_legs[offset]
+                distance_km = float(route_leg.get("distance") or 0.0) / 1000.0
+                drive_minutes = float(route_leg.get("duration") or 0.0) / 60.0
+                legs[idx] = {
+                    "distance_km": distance_km,
+                    "drive_minutes": drive_minutes,
+                    "map_url": self._google_maps_url(points[idx], points[idx + 1]),
+                    "warning": False,
+                }
+                if distance_km or drive_minutes:
+                    pending.append(
+                        self._cache_entry(route_keys[addresses[idx]], route_keys[addresses[idx + 1]], distance_km, drive_minutes, "", hours[chain_idx][idx])
+                    )
+
+        # Chain requests that failed keep the per-leg fallback estimate behaviour.
+        missing = [(chain_idx, idx) for chain_idx, legs in enumerate(chain_legs) for idx in range(len(legs)) if not legs[idx]]
+        fallback = self._fetch_travel_times(
+            [(chains[chain_idx][idx], chains[chain_idx][idx + 1], hours[chain_idx][idx]) for chain_idx, idx in missing],
+            pending,
+            [departures[chain_idx][idx] for chain_idx, idx in missing],
+            geocoded,
+        )
+        for (chain_idx, idx), travel in zip(missing, fallback):
+            chain_legs[chain_idx][idx] = travel
+        self.cache_store_many(pending)
+        return chain_legs
+
+    def _stop_address(self, stop):
+        return self._normalize_address(getattr(stop, "full_address", False) or getattr(stop, "address", stop))
+
+    def _trip_origin(self, origin, stop_list):
         dynamic_home = self._normalize_address(getattr(stop_list[0], "home_location", False)) if stop_list else ""
-        origin_address = self._normalize_address(origin) or dynamic_home or self._normalize_address(self.ORIGIN_YARD)
+        return self._normalize_address(origin) or dynamic_home or self._normalize_address(self.ORIGIN_YARD)
+
+    def calculate_trip_segments(self, origin, stops, return_home=True, chain=True, depart_at=None):
+        """Leg-by-leg segments from ``origin`` through ``stops``.
+
+        With ``depart_at`` every leg is looked up in the departure bucket given by
+        ``leg_departures``; without it legs are untimed.
+        """
+        stop_list = list(stops or [])
+        origin_address = self._trip_origin(origin, stop_list)
         addresses = [origin_address]
-        addresses.extend(self._normalize_address(getattr(stop, "full_address", False) or getattr(stop, "address", stop)) for stop in stop_list)
+        addresses.extend(self._stop_address(stop) for stop in stop_list)
         if return_home:
             addresses.append(origin_address)
 
+        departures = self.leg_departures(depart_at, stop_list, return_home) if depart_at else []
+        pairs = [
+            (addresses[idx], addresses[idx + 1], departures[idx] if idx < len(departures) else None)
+            for idx in range(len(addresses) - 1)
+        ]
+        travels = self.leg_resolver().resolve(self, pairs, chain=chain)
+
         segments = []
-        for idx in range(len(addresses) - 1):
-            from_addr = addresses[idx]
-            to_addr = addresses[idx + 1]
-            travel = self.get_travel_time(from_addr, to_addr)
-            waypoint_hash = hashlib.sha1(f"{from_addr}|{to_addr}".encode("utf-8")).hexdigest()
-            if travel.get("distance_km") or travel.get("drive_minutes"):
-                self._cache_store(from_addr, to_addr, waypoint_hash, 0, travel.get("distance_km"), travel.get("drive_minutes"), "")
+        for idx, travel in enumerate(travels):
             segments.append(
                 {
                     "sequence": idx + 1,
-                    "from": from_addr,
-                    "to": to_addr,
+                    "from": addresses[idx],
+                    "to": addresses[idx + 1],
                     "distance_km": float(travel.get("distance_km") or 0.0),
                     "duration_minutes": float(travel.get("drive_minutes") or 0.0),
                     "drive_hours": float(travel.get("drive_minutes") or 0.0) / 60.0,
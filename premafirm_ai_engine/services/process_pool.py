@@ -0,0 +1,102 @@
+"""Long-lived process pools for the CPU-bound, Odoo-free service modules.
+
+One pool per name and Odoo worker process, created on first use and kept until
+the process exits; it is re-created after a fork, a settings change or a broken
+worker. Workers start with ``forkserver`` (``spawn`` where unavailable): a
+``fork`` child would inherit the worker's database connection, registry locks
+and HTTP client threads.
+
+Fresh workers do not know the server's addons path, so each one first registers
+the packages of this module as bare packages (``__path__`` only, no
+``__init__``). Tasks then import just their own pure module, never Odoo or the
+addon's models.
+"""
+import atexit
+import functools
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_START_METHOD = "forkserver"
+
+# Run through exec() as the pool initializer: a function of this addon could not
+# be unpickled by a worker that cannot import the addon yet.
+_WORKER_BOOTSTRAP = """
+import sys
+from types import ModuleType
+
+for name, path in packages:
+    if name not in sys.modules:
+        sys.modules[name] = ModuleType(name)
+    sys.modules[name].__path__ = list(path)
+"""
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def start_methods():
+    """Start methods a pool may use here; ``fork`` is left out on purpose."""
+    return [method for method in ("forkserver", "spawn") if method in multiprocessing.get_all_start_methods()]
+
+
+def _package_paths():
+    names = __name__.split(".")[:-1]
+    packages = []
+    for end in range(1, len(names) + 1):
+        package = sys.modules.get(".".join(names[:end]))
+        if package is not None and hasattr(package, "__path__"):
+            packages.append((package.__name__, list(package.__path__)))
+    return packages
+
+
+def _usable(pool):
+    # Set by concurrent.futures once a worker died or shutdown() was called.
+    return not getattr(pool, "_broken", False) and not getattr(pool, "_shutdown_thread", False)
+
+
+def shared_pool(name, workers, start_method=None):
+    """The ``name`` pool of this process with ``workers`` workers."""
+    if start_method not in start_methods():
+        start_method = DEFAULT_START_METHOD if DEFAULT_START_METHOD in start_methods() else start_methods()[0]
+    settings = (os.getpid(), workers, start_method)
+    with _pools_lock:
+        pool, pool_settings = _pools.get(name, (None, None))
+        if pool is not None and pool_settings == settings and _usable(pool):
+            return pool
+        if pool is not None and pool_settings[0] == os.getpid():
+            pool.shutdown(wait=False, cancel_futures=True)
+        pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context(start_method),
+            initializer=functools.partial(exec, _WORKER_BOOTSTRAP),
+            initargs=({"packages": _package_paths()},),
+        )
+        _pools[name] = (pool, settings)
+        _logger.info("Started %s process pool: %s %s workers", name, workers, start_method)
+        return pool
+
+
+def terminate_pool(pool):
+    """Shut ``pool`` down and kill its workers, e.g. ones stuck past a timeout.
+
+    ``shared_pool`` replaces it on the next call.
+    """
+    processes = list((getattr(pool, "_processes", None) or {}).values())
+    pool.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        process.terminate()
+
+
+@atexit.register
+def shutdown_pools():
+    with _pools_lock:
+        pools = [pool for pool, settings in _pools.values() if settings[0] == os.getpid()]
+        _pools.clear()
+    for pool in pools:
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,69 @@
+class RouteEstimator:
+    """Offline road distance/ETA model fitted on cached Mapbox legs.
+
+    Every cached leg contributes its circuity (road km over great-circle km) and
+    average speed to the geohash regions of its endpoints. ``estimate`` then
+    scales a straight-line distance by the most specific region pair with enough
+    samples, so it answers in microseconds with no network or database access.
+    The confidence flag says which level answered: ``high`` for the origin and
+    destination regions, ``medium`` for coarser regions or the origin region alone,
+    ``low`` for the global fit or the built-in defaults.
+    """
+
+    # Geohash prefix lengths of the fitted regions (~156 km and ~1250 km cells).
+    REGION_PRECISION = 3
+    COARSE_PRECISION = 2
+    MIN_SAMPLES = 5
+    # Legs shorter than this are dominated by geohash snapping and yard access roads.
+    MIN_FIT_KM = 2.0
+    MAX_CIRCUITY = 4.0
+    DEFAULT_CIRCUITY = 1.3
+    DEFAULT_SPEED_KMH = 60.0
+
+    def __init__(self, samples):
+        """``samples`` are ``(origin_cell, destination_cell, crow_km, road_km, minutes)`` tuples."""
+        totals = {}
+        self.sample_count = 0
+        for origin_cell, destination_cell, crow_km, road_km, minutes in samples:
+            crow_km, road_km, minutes = float(crow_km or 0.0), float(road_km or 0.0), float(minutes or 0.0)
+            if crow_km < self.MIN_FIT_KM or road_km <= 0.0 or minutes <= 0.0:
+                continue
+            if not 0.9 <= road_km / crow_km <= self.MAX_CIRCUITY:
+                continue
+            self.sample_count += 1
+            for key in self._levels(origin_cell, destination_cell):
+                total = totals.setdefault(key[1], [0.0, 0.0, 0.0, 0])
+                total[0] += crow_km
+                total[1] += road_km
+                total[2] += minutes
+                total[3] += 1
+        self.factors = {}
+        for key, (crow_km, road_km, minutes, count) in totals.items():
+            if count >= self.MIN_SAMPLES or (key == ("all",) and count):
+                self.factors[key] = (road_km / crow_km, road_km / (minutes / 60.0), count)
+
+    def _levels(self, origin_cell, destination_cell):
+        """``(confidence, key)`` of every region level, most specific first."""
+        region, coarse = self.REGION_PRECISION, self.COARSE_PRECISION
+        return (
+            ("high", ("pair", origin_cell[:region], destination_cell[:region])),
+            ("medium", ("pair", origin_cell[:coarse], destination_cell[:coarse])),
+            ("medium", ("origin", origin_cell[:region])),
+            ("low", ("all",)),
+        )
+
+    def estimate(self, origin_cell, destination_cell, crow_km):
+        """Estimated ``{"distance_km", "drive_hours", "confidence", "samples"}`` of one leg."""
+        crow_km = float(crow_km or 0.0)
+        confidence, (circuity, speed_kmh, count) = "low", (self.DEFAULT_CIRCUITY, self.DEFAULT_SPEED_KMH, 0)
+        for level_confidence, key in self._levels(origin_cell or "", destination_cell or ""):
+            if key in self.factors:
+                confidence, (circuity, speed_kmh, count) = level_confidence, self.factors[key]
+                break
+        distance_km = crow_km * circuity
+        return {
+            "distance_km": distance_km,
+            "drive_hours": distance_km / speed_kmh if speed_kmh else 0.0,
+            "confidence": confidence,
+            "samples": count,
+        }
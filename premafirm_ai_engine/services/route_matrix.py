@@ -0,0 +1,144 @@
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+class RouteMatrix:
+    """In-memory N×N drive distance/duration table built from the Mapbox Matrix API.
+
+    The matrix is fetched once for a fixed set of addresses (home base, run stops,
+    candidate stops); afterwards ``leg`` and ``trip_segments`` are pure lookups, so
+    insertion search can simulate any stop order without network or cache I/O.
+    Pairs Mapbox cannot route fall back to the offline ``RouteEstimator``, mirroring
+    ``MapboxService.get_route``.
+    """
+
+    # Same traffic-aware profile as the Directions calls of ``MapboxService``, so
+    # insertion search ranks runs on the durations they are later scheduled with.
+    PROFILE = "driving-traffic"
+    # Mapbox Matrix accepts at most 10 coordinates per driving-traffic request
+    # (sources + destinations); the other profiles allow 25.
+    MAX_COORDINATES = 10
+
+    def __init__(self, map_service, addresses):
+        self.map_service = map_service
+        self.addresses = list(dict.fromkeys(map_service._normalize_address(address) for address in addresses))
+        self.index = {address: idx for idx, address in enumerate(self.addresses)}
+        size = len(self.addresses)
+        self.distances_km = [[0.0] * size for _ in range(size)]
+        self.durations_hours = [[0.0] * size for _ in range(size)]
+        self.warnings = [[False] * size for _ in range(size)]
+        self.request_count = 0
+        self._build()
+
+    @classmethod
+    def for_stops(cls, map_service, home, stops):
+        stops = list(stops)
+        return cls(map_service, [map_service._trip_origin(home, stops)] + [map_service._stop_address(stop) for stop in stops])
+
+    def _matrix_url(self, coordinates, sources=None, destinations=None):
+        api_key = self.map_service._get_api_key()
+        if not api_key or self.map_service.estimate_mode():
+            return None
+        joined = ";".join(f"{lon},{lat}" for lon, lat in coordinates)
+        url = f"https://api.mapbox.com/directions-matrix/v1/mapbox/{self.PROFILE}/{joined}?annotations=distance,duration&access_token={api_key}"
+        if sources is not None:
+            url += "&sources=" + ";".join(str(idx) for idx in sources)
+            url += "&destinations=" + ";".join(str(idx) for idx in destinations)
+        return url
+
+    def _requests(self, routable):
+        """Yield ``(url, source_indices, destination_indices)`` blocks covering ``routable`` × ``routable``."""
+        points = [(self.geocodes[idx]["longitude"], self.geocodes[idx]["latitude"]) for idx in routable]
+        if len(routable) <= self.MAX_COORDINATES:
+            yield self._matrix_url(points), routable, routable
+            return
+        block = self.MAX_COORDINATES // 2
+        for src_start in range(0, len(routable), block):
+            for dst_start in range(0, len(routable), block):
+                src = list(range(src_start, min(src_start + block, len(routable))))
+                dst = list(range(dst_start, min(dst_start + block, len(routable))))
+                coordinates = [points[idx] for idx in src] + [points[idx] for idx in dst]
+                url = self._matrix_url(coordinates, range(len(src)), range(len(src), len(src) + len(dst)))
+                yield url, [routable[idx] for idx in src], [routable[idx] for idx in dst]
+
+    def _build(self):
+        self.geocodes = self.map_service.geocode_many(self.addresses) if self.addresses else []
+        point_warnings = [self.map_service._point_warning(geo) for geo in self.geocodes]
+        routable = [idx for idx, warning in enumerate(point_warnings) if not warning]
+        resolved = set()
+        reason = None if self.map_service.estimate_mode() else "Mapbox route unavailable"
+        if len(routable) > 1:
+            blocks = [block for block in self._requests(routable) if block[0]]
+            self.request_count = len(blocks)
+            responses = self.map_service._fetch_many([url for url, _src, _dst in blocks])
+            for (_url, sources, destinations), data in zip(blocks, responses):
+                durations = data.get("durations") or []
+                distances = data.get("distances") or []
+                for row, src in enumerate(sources):
+                    for col, dst in enumerate(destinations):
+                        try:
+                            duration = durations[row][col]
+                            distance = distances[row][col]
+                        except (IndexError, TypeError):
+                            continue
+                        if duration is None or distance is None:
+                            continue
+                        self.distances_km[src][dst] = float(distance) / 1000.0
+                        self.durations_hours[src][dst] = float(duration) / 3600.0
+                        resolved.add((src, dst))
+
+        for src in range(len(self.addresses)):
+            for dst in range(len(self.addresses)):
+                if src == dst or (src, dst) in resolved:
+                    continue
+                warning = point_warnings[src] or point_warnings[dst]
+                if warning:
+                    self.warnings[src][dst] = warning
+                    continue
+                estimate = self.map_service.estimate_route(self.geocodes[src], self.geocodes[dst], reason=reason)
+                self.distances_km[src][dst] = estimate["distance_km"]
+                self.durations_hours[src][dst] = estimate["drive_hours"]
+                self.warnings[src][dst] = estimate["warning"]
+        if len(resolved) < len(routable) * (len(routable) - 1):
+            _logger.info("Route matrix resolved %s of %s routable pairs", len(resolved), len(routable) * (len(routable) - 1))
+
+    def node(self, stop):
+        """Matrix index of a stop record (or plain address)."""
+        return self.index[self.map_service._stop_address(stop)]
+
+    def origin_node(self, home, stops):
+        return self.index[self.map_service._trip_origin(home, list(stops))]
+
+    def leg(self, origin, destination):
+        """Return ``(distance_km, drive_hours, warning)`` for two matrix addresses."""
+        src = self.index.get(origin)
+        dst = self.index.get(destination)
+        if src is None or dst is None:
+            return 0.0, 0.0, "Stop missing from route matrix."
+        return self.distances_km[src][dst], self.durations_hours[src][dst], self.warnings[src][dst]
+
+    def trip_segments(self, origin, stops, return_home=True):
+        """Same shape as ``MapboxService.calculate_trip_segments``, read from memory."""
+        stops = list(stops)
+        origin_address = self.map_service._trip_origin(origin, stops)
+        addresses = [origin_address] + [self.map_service._stop_address(stop) for stop in stops]
+        if return_home:
+            addresses.append(origin_address)
+        segments = []
+        for idx in range(len(addresses) - 1):
+            distance_km, drive_hours, warning = self.leg(addresses[idx], addresses[idx + 1])
+            segments.append(
+                {
+                    "sequence": idx + 1,
+                    "from": addresses[idx],
+                    "to": addresses[idx + 1],
+                    "distance_km": distance_km,
+                    "duration_minutes": drive_hours * 60.0,
+                    "drive_hours": drive_hours,
+                    "polyline": "",
+                    "warning": warning,
+                    "map_url": None,
+                }
+            )
+        return segments
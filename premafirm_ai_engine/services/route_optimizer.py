@@ -0,0 +1,747 @@
+import logging
+import time
+
+_logger = logging.getLogger(__name__)
+
+
+EPSILON = 1e-6
+
+
+def simulate_route(distances, durations, vehicle, stops, drive_hours=None, stop_on_violation=True):
+    """Pure counterpart of ``RunPlannerService.simulate_run`` over matrix nodes.
+
+    ``vehicle`` carries ``home``, ``start`` (hours), ``capacity``, ``drive_hours`` and
+    ``on_duty_hours``; each stop ``node``, ``service_hours``, ``window_start``/
+    ``window_end`` (hours, same clock as ``start``), ``load`` and ``cargo_delta``.
+    ``drive_hours`` overrides the vehicle's drive limit (e.g. for cross-border runs).
+    """
+    drive_limit = (vehicle.get("drive_hours") if drive_hours is None else drive_hours) or 0.0
+    capacity = tuple(vehicle.get("capacity") or ())
+    on_duty_limit = vehicle.get("on_duty_hours") or 0.0
+    start = vehicle.get("start") or 0.0
+    now = start
+    previous = vehicle["home"]
+    cargo = 0
+    load = [0.0] * len(capacity)
+    total_km = total_hours = empty_km = 0.0
+    feasible = True
+    for stop in stops:
+        node = stop["node"]
+        km = distances[previous][node]
+        total_km += km
+        total_hours += durations[previous][node]
+        if cargo <= 0:
+            empty_km += km
+        arrival = now + durations[previous][node]
+        window_start, window_end = stop.get("window_start"), stop.get("window_end")
+        if window_start is not None and arrival < window_start:
+            arrival = window_start
+        now = arrival + (stop.get("service_hours") or 0.0)
+        cargo += stop.get("cargo_delta") or 0
+        for idx, value in enumerate((stop.get("load") or ())[: len(load)]):
+            load[idx] += value
+        if feasible and (
+            (window_end is not None and arrival > window_end + EPSILON)
+            or any(limit and value > limit + EPSILON for value, limit in zip(load, capacity))
+            or (drive_limit and total_hours > drive_limit + EPSILON)
+            or (on_duty_limit and now - start > on_duty_limit + EPSILON)
+        ):
+            feasible = False
+            if stop_on_violation:
+                break
+        previous = node
+    return {
+        "feasible": feasible,
+        "total_distance_km": total_km,
+        "total_drive_hours": total_hours,
+        "empty_distance_km": empty_km,
+        "loaded_distance_km": total_km - empty_km,
+    }
+
+
+def score_insertion(base_totals, option_totals, revenue, cost_per_km, deadhead_weight):
+    """``(score, incremental_profit, deadhead_reduction)`` of adding a load worth ``revenue`` to a run."""
+    deadhead_reduction = float(base_totals.get("empty_distance_km") or 0.0) - float(option_totals.get("empty_distance_km") or 0.0)
+    incremental_cost = max((option_totals.get("total_distance_km", 0.0) - base_totals.get("total_distance_km", 0.0)) * cost_per_km, 0.0)
+    incremental_profit = revenue - incremental_cost
+    return incremental_profit + deadhead_reduction * deadhead_weight, incremental_profit, deadhead_reduction
+
+
+class InsertionEvaluator:
+    """Delta-cost evaluation of inserting one pickup/delivery pair into a fixed run.
+
+    ``route`` is ``[home, stop_1, ..., stop_n]`` as matrix node indices and
+    ``cargo_deltas`` the ``cargo_delta`` of each run stop. Totals follow
+    ``RunPlannerService.simulate_run``: leg ``k`` drives into ``stop_k``, the
+    return-home leg is not counted, and a leg is empty when no cargo is on board.
+
+    Prefix sums over the base run let ``evaluate`` price any ``(i, j)`` candidate
+    from the handful of edges it removes and inserts, in O(1) for the usual
+    pickup (+1) / delivery (-1) pair. It never touches the ORM or the network.
+    """
+
+    def __init__(self, distances, durations, route, cargo_deltas):
+        self.distances = distances
+        self.durations = durations
+        self.route = list(route)
+        self.size = len(self.route) - 1
+        # cargo[k]: load on board after visiting route[k]; leg k is driven with cargo[k - 1].
+        self.cargo = [0] * (self.size + 1)
+        for k in range(1, self.size + 1):
+            self.cargo[k] = self.cargo[k - 1] + int(cargo_deltas[k - 1] or 0)
+        self.leg_km = [0.0] * (self.size + 1)
+        self.leg_hours = [0.0] * (self.size + 1)
+        self.prefix_km = [0.0] * (self.size + 1)
+        self.prefix_hours = [0.0] * (self.size + 1)
+        self.prefix_empty_km = [0.0] * (self.size + 1)
+        # km of legs driven with exactly zero cargo: the ones a +1 shift turns loaded.
+        self.prefix_zero_cargo_km = [0.0] * (self.size + 1)
+        for k in range(1, self.size + 1):
+            km = self.distances[self.route[k - 1]][self.route[k]]
+            hours = self.durations[self.route[k - 1]][self.route[k]]
+            self.leg_km[k] = km
+            self.leg_hours[k] = hours
+            self.prefix_km[k] = self.prefix_km[k - 1] + km
+            self.prefix_hours[k] = self.prefix_hours[k - 1] + hours
+            self.prefix_empty_km[k] = self.prefix_empty_km[k - 1] + (km if self.cargo[k - 1] <= 0 else 0.0)
+            self.prefix_zero_cargo_km[k] = self.prefix_zero_cargo_km[k - 1] + (km if self.cargo[k - 1] == 0 else 0.0)
+
+    def base_totals(self):
+        return self._totals(0.0, 0.0, 0.0)
+
+    def _totals(self, delta_km, delta_hours, delta_empty):
+        total_km = self.prefix_km[self.size] + delta_km
+        empty_km = self.prefix_empty_km[self.size] + delta_empty
+        return {
+            "total_distance_km": total_km,
+            "total_drive_hours": self.prefix_hours[self.size] + delta_hours,
+            "empty_distance_km": empty_km,
+            "loaded_distance_km": total_km - empty_km,
+        }
+
+    def _shifted_empty_delta(self, first_leg, last_leg, shift):
+        """Change in empty km when legs ``first_leg..last_leg`` carry ``shift`` more cargo."""
+        if not shift or first_leg > last_leg:
+            return 0.0
+        if shift == 1:
+            return -(self.prefix_zero_cargo_km[last_leg] - self.prefix_zero_cargo_km[first_leg - 1])
+        delta = 0.0
+        for k in range(first_leg, last_leg + 1):
+            was_empty = self.cargo[k - 1] <= 0
+            is_empty = self.cargo[k - 1] + shift <= 0
+            if was_empty != is_empty:
+                delta += self.leg_km[k] if is_empty else -self.leg_km[k]
+        return delta
+
+    def evaluate(self, pickup, delivery, pickup_delta, delivery_delta, pickup_idx, delivery_idx):
+        """Totals of the run with ``pickup`` at final index ``pickup_idx`` and ``delivery`` at ``delivery_idx``.
+
+        Indices follow ``list.insert`` on the stop list: the pickup is inserted
+        first, then the delivery, so ``pickup_idx < delivery_idx <= n + 1``.
+        """
+        route, cargo = self.route, self.cargo
+        distances, durations = self.distances, self.durations
+        n = self.size
+        i, j = pickup_idx, delivery_idx
+        delta_km = delta_hours = delta_empty = 0.0
+
+        def add(a, b, load, sign=1.0):
+            nonlocal delta_km, delta_hours, delta_empty
+            km = distances[a][b]
+            delta_km += sign * km
+            delta_hours += sign * durations[a][b]
+            if load <= 0:
+                delta_empty += sign * km
+
+        pair_shift = pickup_delta + delivery_delta
+        add(route[i], pickup, cargo[i])
+        if j == i + 1:
+            add(pickup, delivery, cargo[i] + pickup_delta)
+            if i < n:
+                add(route[i], route[i + 1], cargo[i], -1.0)
+                add(delivery, route[i + 1], cargo[i] + pair_shift)
+                delta_empty += self._shifted_empty_delta(i + 2, n, pair_shift)
+        else:
+            add(route[i], route[i + 1], cargo[i], -1.0)
+            add(pickup, route[i + 1], cargo[i] + pickup_delta)
+            delta_empty += self._shifted_empty_delta(i + 2, j - 1, pickup_delta)
+            add(route[j - 1], delivery, cargo[j - 1] + pickup_delta)
+            if j <= n:
+                add(route[j - 1], route[j], cargo[j - 1], -1.0)
+                add(delivery, route[j], cargo[j - 1] + pair_shift)
+                delta_empty += self._shifted_empty_delta(j + 1, n, pair_shift)
+        return self._totals(delta_km, delta_hours, delta_empty)
+
+
+class InsertionFeasibility:
+    """Forward time-slack and capacity bounds for pruning pickup/delivery insertions.
+
+    Times are hours from the run start; ``window_starts``/``window_ends`` hold
+    ``None`` where a stop has no window. ``loads`` are per-stop signed
+    ``(pallets, weight)`` changes and ``capacity`` the matching vehicle limits
+    (0 = unlimited). Following Savelsbergh, ``slack[k]`` is how far service at
+    ``stop_k`` can be pushed back without breaking any later window:
+    ``slack[k] = min(end_k - begin_k, wait[k + 1] + slack[k + 1])``.
+    """
+
+    INF = float("inf")
+
+    def __init__(self, durations, route, service_hours, window_starts, window_ends, loads, capacity):
+        self.durations = durations
+        self.route = list(route)
+        self.size = len(self.route) - 1
+        n = self.size
+        self.earliest = [0.0] + [-self.INF if value is None else value for value in window_starts]
+        self.latest = [self.INF] + [self.INF if value is None else value for value in window_ends]
+        self.service = [0.0] + list(service_hours)
+        self.arrival = [0.0] * (n + 1)
+        self.begin = [0.0] * (n + 1)
+        self.wait = [0.0] * (n + 2)
+        for k in range(1, n + 1):
+            self.arrival[k] = self.begin[k - 1] + self.service[k - 1] + durations[self.route[k - 1]][self.route[k]]
+            self.begin[k] = max(self.arrival[k], self.earliest[k])
+            self.wait[k] = self.begin[k] - self.arrival[k]
+        self.slack = [self.INF] * (n + 2)
+        for k in range(n, 0, -1):
+            self.slack[k] = min(self.latest[k] - self.begin[k], self.wait[k + 1] + self.slack[k + 1])
+        self.capacity = tuple(capacity)
+        # on_board[k]: cumulative load after stop_k, per capacity dimension.
+        self.on_board = [tuple(0.0 for _ in self.capacity)]
+        for load in loads:
+            self.on_board.append(tuple(prev + value for prev, value in zip(self.on_board[-1], load)))
+
+    def _push_ok(self, k, new_arrival):
+        """Whether stop ``k`` (and everything after it) tolerates arriving at ``new_arrival``."""
+        if k > self.size:
+            return True
+        push = max(new_arrival, self.earliest[k]) - self.begin[k]
+        return push <= self.slack[k] + 1e-9
+
+    def _over_capacity(self, load):
+        return any(limit and value > limit + 1e-9 for value, limit in zip(load, self.capacity))
+
+    def feasible_pairs(self, pickup, delivery, pickup_spec, delivery_spec):
+        """Yield the ``(pickup_idx, delivery_idx)`` insertions that keep windows and capacity.
+
+        Each spec is ``(window_start, window_end, service_hours, load)``. Time
+        checks are exact as long as travel times obey the triangle inequality;
+        capacity uses the running maximum of the base load between the two
+        insertion points. Survivors still get a full ``simulate_run`` check.
+        """
+        n = self.size
+        durations, route = self.durations, self.route
+        pu_start, pu_end, pu_service, pu_load = pickup_spec
+        dl_start, dl_end, dl_service, _dl_load = delivery_spec
+        pu_start = -self.INF if pu_start is None else pu_start
+        dl_start = -self.INF if dl_start is None else dl_start
+        pu_end = self.INF if pu_end is None else pu_end
+        dl_end = self.INF if dl_end is None else dl_end
+        for i in range(0, n + 1):
+            pu_begin = max(self.begin[i] + self.service[i] + durations[route[i]][pickup], pu_start)
+            if pu_begin > pu_end + 1e-9:
+                continue
+            pu_depart = pu_begin + pu_service
+            max_on_board = self.on_board[i]
+            push = 0.0
+            if i < n:
+                next_begin = max(pu_depart + durations[pickup][route[i + 1]], self.earliest[i + 1])
+                push = max(next_begin - self.begin[i + 1], 0.0)
+            for j in range(i + 1, n + 2):
+                if j > i + 1:
+                    # Stop j - 1 now sits between pickup and delivery.
+                    if push > self.slack[j - 1] + 1e-9:
+                        break
+                    max_on_board = tuple(max(a, b) for a, b in zip(max_on_board, self.on_board[j - 1]))
+                    prev_depart = self.begin[j - 1] + push + self.service[j - 1]
+                    prev_node = route[j - 1]
+                else:
+                    prev_depart = pu_depart
+                    prev_node = pickup
+                if self._over_capacity(tuple(value + extra for value, extra in zip(max_on_board, pu_load))):
+                    break
+                dl_begin = max(prev_depart + durations[prev_node][delivery], dl_start)
+                if dl_begin <= dl_end + 1e-9 and (
+                    j > n or self._push_ok(j, dl_begin + dl_service + durations[delivery][route[j]])
+                ):
+                    yield i, j
+                if j > i + 1 and j <= n:
+                    # Carry the pickup's push-forward one stop further, absorbed by waiting time.
+                    push = max(push - self.wait[j], 0.0)
+
+
+class FleetSolver:
+    """Assign and sequence pickup/delivery requests over a whole fleet (VRP with time windows).
+
+    Everything is plain data over route-matrix node indices, so the solver never
+    touches the ORM or the network:
+
+    * vehicle: ``key``, ``home`` (node), ``start`` (hours from the plan origin),
+      ``capacity`` ``(pallets, weight)`` (0 = unlimited), ``drive_hours``,
+      ``cross_border_drive_hours``, ``on_duty_hours`` and ``route`` (initial stop keys);
+    * stop: ``node``, ``service_hours``, ``window_start``/``window_end`` (hours from
+      the plan origin or None), ``load`` ``(pallets, weight)`` and ``cargo_delta``;
+    * request: ``key``, ``stops`` (stop keys in visiting order), ``revenue``,
+      ``cross_border``, ``vehicles`` (allowed vehicle keys, None = any) and
+      ``pinned`` (stays on the vehicle whose initial route holds it).
+
+    Route feasibility and totals follow ``RunPlannerService.simulate_run``. Plans
+    compare on (requests served, score), the score being revenue minus
+    ``cost_per_km`` per km minus ``deadhead_weight`` per empty km, i.e. the terms
+    of ``RunPlannerService._score_option``. Construction is cheapest insertion
+    (pruned by ``InsertionFeasibility``, priced by ``InsertionEvaluator``); local
+    search then applies relocate, swap, 2-opt and or-opt moves, plus whole-route
+    and unserved-request exchanges, until none improves or ``time_budget``
+    seconds have passed.
+    """
+
+    EPSILON = EPSILON
+    OR_OPT_MAX_SEGMENT = 3
+
+    def __init__(self, distances, durations, vehicles, stops, requests, cost_per_km=1.65, deadhead_weight=0.35, time_budget=10.0):
+        self.distances = distances
+        self.durations = durations
+        self.vehicles = {vehicle["key"]: vehicle for vehicle in vehicles}
+        self.stops = stops
+        self.requests = {request["key"]: request for request in requests}
+        self.request_of = {stop_key: request["key"] for request in requests for stop_key in request["stops"]}
+        self.cost_per_km = cost_per_km
+        self.deadhead_weight = deadhead_weight
+        self.time_budget = time_budget
+        self.deadline = None
+        self.moves = 0
+        self._evaluated = {}
+
+    # -- route evaluation -------------------------------------------------
+
+    def _request_keys(self, route):
+        return list(dict.fromkeys(self.request_of[key] for key in route))
+
+    def evaluate(self, vehicle_key, route):
+        """Totals of ``route`` on ``vehicle_key``, or None when a window, capacity or HOS limit breaks."""
+        cache_key = (vehicle_key, tuple(route))
+        if cache_key not in self._evaluated:
+            self._evaluated[cache_key] = self._evaluate(vehicle_key, route)
+        return self._evaluated[cache_key]
+
+    def _evaluate(self, vehicle_key, route):
+        vehicle = self.vehicles[vehicle_key]
+        request_keys = self._request_keys(route)
+        drive_limit = vehicle.get("drive_hours") or 0.0
+        if vehicle.get("cross_border_drive_hours") and any(self.requests[key].get("cross_border") for key in request_keys):
+            drive_limit = vehicle["cross_border_drive_hours"]
+        totals = simulate_route(self.distances, self.durations, vehicle, [self.stops[key] for key in route], drive_hours=drive_limit)
+        if not totals["feasible"]:
+            return None
+        revenue = sum(float(self.requests[key].get("revenue") or 0.0) for key in request_keys)
+        totals["revenue"] = revenue
+        totals["score"] = revenue - totals["total_distance_km"] * self.cost_per_km - totals["empty_distance_km"] * self.deadhead_weight
+        return totals
+
+    def _precedence_ok(self, route):
+        seen = {}
+        for key in route:
+            request_key = self.request_of[key]
+            position = seen.get(request_key, 0)
+            if self.requests[request_key]["stops"][position] != key:
+                return False
+            seen[request_key] = position + 1
+        return True
+
+    def _allowed(self, request_key, vehicle_key):
+        allowed = self.requests[request_key].get("vehicles")
+        return allowed is None or vehicle_key in allowed
+
+    def _movable(self, request_key):
+        return not self.requests[request_key].get("pinned")
+
+    def _expired(self):
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    # -- insertion --------------------------------------------------------
+
+    def _pair_candidates(self, vehicle_key, route, pickup, delivery):
+        """Pickup/delivery insertions of ``route`` in ascending cost, pruned by windows and capacity."""
+        vehicle = self.vehicles[vehicle_key]
+        start = vehicle.get("start") or 0.0
+        capacity = tuple(vehicle.get("capacity") or ())
+
+        def spec(key):
+            stop = self.stops[key]
+            window_start, window_end = stop.get("window_start"), stop.get("window_end")
+            return (
+                None if window_start is None else window_start - start,
+                None if window_end is None else window_end - start,
+                stop.get("service_hours") or 0.0,
+                tuple((stop.get("load") or ())[: len(capacity)]),
+            )
+
+        nodes = [vehicle["home"]] + [self.stops[key]["node"] for key in route]
+        specs = [spec(key) for key in route]
+        feasibility = InsertionFeasibility(
+            self.durations,
+            nodes,
+            [item[2] for item in specs],
+            [item[0] for item in specs],
+            [item[1] for item in specs],
+            [item[3] for item in specs],
+            capacity,
+        )
+        evaluator = InsertionEvaluator(self.distances, self.durations, nodes, [self.stops[key].get("cargo_delta") or 0 for key in route])
+        pickup_stop, delivery_stop = self.stops[pickup], self.stops[delivery]
+        ranked = []
+        for i, j in feasibility.feasible_pairs(pickup_stop["node"], delivery_stop["node"], spec(pickup), spec(delivery)):
+            totals = evaluator.evaluate(
+                pickup_stop["node"],
+                delivery_stop["node"],
+                pickup_stop.get("cargo_delta") or 0,
+                delivery_stop.get("cargo_delta") or 0,
+                i,
+                j,
+            )
+            ranked.append((totals["total_distance_km"] * self.cost_per_km + totals["empty_distance_km"] * self.deadhead_weight, i, j))
+        ranked.sort()
+        for _cost, i, j in ranked:
+            candidate = list(route)
+            candidate.insert(i, pickup)
+            candidate.insert(j, delivery)
+            yield candidate
+
+    def best_insertion(self, vehicle_key, route, request_key):
+        """Return ``(totals, route)`` for the best feasible insertion of ``request_key``, or None."""
+        stop_keys = self.requests[request_key]["stops"]
+        if len(stop_keys) == 2:
+            # Candidates arrive cheapest first and share the same revenue: the first feasible one wins.
+            for candidate in self._pair_candidates(vehicle_key, route, *stop_keys):
+                totals = self.evaluate(vehicle_key, candidate)
+                if totals is not None:
+                    return totals, candidate
+            return None
+        best = None
+        for idx in range(len(route) + 1):
+            candidate = route[:idx] + list(stop_keys) + route[idx:]
+            totals = self.evaluate(vehicle_key, candidate)
+            if totals is not None and (best is None or totals["score"] > best[0]["score"]):
+                best = totals, candidate
+        return best
+
+    def _without(self, route, request_key):
+        return [key for key in route if self.request_of[key] != request_key]
+
+    # -- search -----------------------------------------------------------
+
+    def _initial_routes(self):
+        routes = {}
+        frozen = set()
+        placed = set()
+        for vehicle_key, vehicle in self.vehicles.items():
+            route = [key for key in vehicle.get("route") or [] if key in self.request_of]
+            if self.evaluate(vehicle_key, route) is None:
+                route = [key for key in route if not self._movable(self.request_of[key])]
+                if self.evaluate(vehicle_key, route) is None:
+                    frozen.add(vehicle_key)
+            routes[vehicle_key] = route
+            placed.update(self.request_of[key] for key in route)
+        unassigned = [key for key in self.requests if key not in placed]
+        return routes, frozen, unassigned
+
+    def _urgency(self, request_key):
+        ends = [self.stops[key].get("window_end") for key in self.requests[request_key]["stops"]]
+        ends = [value for value in ends if value is not None]
+        return (min(ends) if ends else float("inf"), -float(self.requests[request_key].get("revenue") or 0.0))
+
+    def _insert_unassigned(self, routes, frozen, unassigned):
+        """Cheapest-insertion construction; also retried during local search as routes change."""
+        inserted = False
+        for request_key in sorted(unassigned, key=self._urgency):
+            if not self._movable(request_key):
+                continue
+            best = None
+            for vehicle_key, route in routes.items():
+                if vehicle_key in frozen or not self._allowed(request_key, vehicle_key):
+                    continue
+                found = self.best_insertion(vehicle_key, route, request_key)
+                if found is None:
+                    continue
+                gain = found[0]["score"] - self.evaluate(vehicle_key, route)["score"]
+                if best is None or gain > best[0]:
+                    best = gain, vehicle_key, found[1]
+            if best is not None:
+                routes[best[1]] = best[2]
+                unassigned.remove(request_key)
+                self.moves += 1
+                inserted = True
+        return inserted
+
+    def _exchange_unassigned(self, routes, frozen, unassigned):
+        """Swap an unserved request for a served one, re-placing the evicted request when possible."""
+        for request_key in list(unassigned):
+            if not self._movable(request_key):
+                continue
+            for vehicle_key, route in routes.items():
+                if vehicle_key in frozen or not self._allowed(request_key, vehicle_key):
+                    continue
+                current = self.evaluate(vehicle_key, route)["score"]
+                for evicted_key in self._request_keys(route):
+                    if self._expired():
+                        return False
+                    if not self._movable(evicted_key):
+                        continue
+                    found = self.best_insertion(vehicle_key, self._without(route, evicted_key), request_key)
+                    if found is None:
+                        continue
+                    for other_key, other_route in routes.items():
+                        if other_key == vehicle_key or other_key in frozen or not self._allowed(evicted_key, other_key):
+                            continue
+                        replaced = self.best_insertion(other_key, other_route, evicted_key)
+                        if replaced is not None:
+                            routes[vehicle_key] = found[1]
+                            routes[other_key] = replaced[1]
+                            unassigned.remove(request_key)
+                            self.moves += 1
+                            return True
+                    if found[0]["score"] - current > self.EPSILON:
+                        routes[vehicle_key] = found[1]
+                        unassigned.remove(request_key)
+                        unassigned.append(evicted_key)
+                        self.moves += 1
+                        return True
+        return False
+
+    def _relocate(self, routes, frozen):
+        for source_key in list(routes):
+            if source_key in frozen:
+                continue
+            source_route = routes[source_key]
+            source_score = self.evaluate(source_key, source_route)["score"]
+            for request_key in self._request_keys(source_route):
+                if self._expired():
+                    return False
+                if not self._movable(request_key):
+                    continue
+                reduced = self._without(source_route, request_key)
+                reduced_totals = self.evaluate(source_key, reduced)
+                if reduced_totals is None:
+                    continue
+                for target_key, target_route in routes.items():
+                    if target_key in frozen or not self._allowed(request_key, target_key):
+                        continue
+                    if target_key == source_key:
+                        found = self.best_insertion(source_key, reduced, request_key)
+                        gain = found[0]["score"] - source_score if found else None
+                    else:
+                        found = self.best_insertion(target_key, target_route, request_key)
+                        gain = (
+                            found[0]["score"] + reduced_totals["score"] - source_score - self.evaluate(target_key, target_route)["score"]
+                            if found
+                            else None
+                        )
+                    if gain is not None and gain > self.EPSILON:
+                        if target_key == source_key:
+                            routes[source_key] = found[1]
+                        else:
+                            routes[source_key] = reduced
+                            routes[target_key] = found[1]
+                        self.moves += 1
+                        return True
+        return False
+
+    def _swap(self, routes, frozen):
+        keys = [key for key in routes if key not in frozen]
+        for pos, first_key in enumerate(keys):
+            for second_key in keys[pos + 1 :]:
+                first_route, second_route = routes[first_key], routes[second_key]
+                before = self.evaluate(first_key, first_route)["score"] + self.evaluate(second_key, second_route)["score"]
+                for first_request in self._request_keys(first_route):
+                    if not self._movable(first_request) or not self._allowed(first_request, second_key):
+                        continue
+                    first_reduced = self._without(first_route, first_request)
+                    for second_request in self._request_keys(second_route):
+                        if self._expired():
+                            return False
+                        if not self._movable(second_request) or not self._allowed(second_request, first_key):
+                            continue
+                        first_new = self.best_insertion(first_key, first_reduced, second_request)
+                        if first_new is None:
+                            continue
+                        second_new = self.best_insertion(second_key, self._without(second_route, second_request), first_request)
+                        if second_new is None:
+                            continue
+                        if first_new[0]["score"] + second_new[0]["score"] - before > self.EPSILON:
+                            routes[first_key] = first_new[1]
+                            routes[second_key] = second_new[1]
+                            self.moves += 1
+                            return True
+        return False
+
+    def _rebuild(self, vehicle_key, request_keys):
+        route = []
+        for request_key in request_keys:
+            found = self.best_insertion(vehicle_key, route, request_key)
+            if found is None:
+                return None
+            route = found[1]
+        return self.evaluate(vehicle_key, route), route
+
+    def _exchange_routes(self, routes, frozen):
+        """Hand two vehicles each other's loads, re-sequenced from their own home base."""
+        keys = [key for key in routes if key not in frozen]
+        for pos, first_key in enumerate(keys):
+            for second_key in keys[pos + 1 :]:
+                if self._expired():
+                    return False
+                first_requests = self._request_keys(routes[first_key])
+                second_requests = self._request_keys(routes[second_key])
+                if not first_requests and not second_requests:
+                    continue
+                if not all(self._movable(key) for key in first_requests + second_requests):
+                    continue
+                if not all(self._allowed(key, second_key) for key in first_requests) or not all(
+                    self._allowed(key, first_key) for key in second_requests
+                ):
+                    continue
+                first_new = self._rebuild(first_key, second_requests)
+                second_new = self._rebuild(second_key, first_requests)
+                if first_new is None or second_new is None:
+                    continue
+                before = self.evaluate(first_key, routes[first_key])["score"] + self.evaluate(second_key, routes[second_key])["score"]
+                if first_new[0]["score"] + second_new[0]["score"] - before > self.EPSILON:
+                    routes[first_key] = first_new[1]
+                    routes[second_key] = second_new[1]
+                    self.moves += 1
+                    return True
+        return False
+
+    def _improve_route(self, routes, vehicle_key, candidates):
+        current = self.evaluate(vehicle_key, routes[vehicle_key])["score"]
+        for candidate in candidates:
+            if self._expired():
+                return False
+            if not self._precedence_ok(candidate):
+                continue
+            totals = self.evaluate(vehicle_key, candidate)
+            if totals is not None and totals["score"] - current > self.EPSILON:
+                routes[vehicle_key] = candidate
+                self.moves += 1
+                return True
+        return False
+
+    @staticmethod
+    def _two_opt_candidates(route):
+        for i in range(len(route) - 1):
+            for j in range(i + 1, len(route)):
+                yield route[:i] + route[i : j + 1][::-1] + route[j + 1 :]
+
+    def _or_opt_candidates(self, route):
+        for length in range(1, self.OR_OPT_MAX_SEGMENT + 1):
+            for i in range(len(route) - length + 1):
+                segment = route[i : i + length]
+                rest = route[:i] + route[i + length :]
+                for k in range(len(rest) + 1):
+                    if k != i:
+                        yield rest[:k] + segment + rest[k:]
+
+    def _two_opt(self, routes, frozen):
+        return any(self._improve_route(routes, key, self._two_opt_candidates(routes[key])) for key in routes if key not in frozen)
+
+    def _or_opt(self, routes, frozen):
+        return any(self._improve_route(routes, key, self._or_opt_candidates(routes[key])) for key in routes if key not in frozen)
+
+    def solve(self):
+        """Return the plan: per-vehicle ``routes`` with totals, ``unassigned`` request keys and search stats."""
+        started = time.monotonic()
+        self.deadline = started + max(float(self.time_budget or 0.0), 0.0)
+        self.moves = 0
+        routes, frozen, unassigned = self._initial_routes()
+        self._insert_unassigned(routes, frozen, unassigned)
+        while not self._expired():
+            if not (
+                self._relocate(routes, frozen)
+                or self._swap(routes, frozen)
+                or self._exchange_routes(routes, frozen)
+                or self._two_opt(routes, frozen)
+                or self._or_opt(routes, frozen)
+                or (unassigned and self._insert_unassigned(routes, frozen, unassigned))
+                or (unassigned and self._exchange_unassigned(routes, frozen, unassigned))
+            ):
+                break
+        plan_routes = {key: {"stops": route, "totals": self.evaluate(key, route)} for key, route in routes.items()}
+        return {
+            "routes": plan_routes,
+            "unassigned": unassigned,
+            "served": len(self.requests) - len(unassigned),
+            "score": sum((item["totals"] or {}).get("score", 0.0) for item in plan_routes.values()),
+            "frozen": sorted(frozen, key=str),
+            "moves": self.moves,
+            "elapsed": time.monotonic() - started,
+            "timed_out": self._expired(),
+        }
+
+
+def rank_insertions(task):
+    """Rank pickup/delivery insertions of one lead into one vehicle's run snapshot.
+
+    ``task`` is plain data (picklable for a process pool): ``key``, a local
+    ``distances``/``durations`` matrix, ``vehicle`` (as for ``simulate_route``,
+    ``start`` = 0), base run ``stops``, ``pickup``/``delivery`` stop specs,
+    ``revenue``, ``cost_per_km``, ``deadhead_weight`` and ``top_k``. Returns the
+    ``top_k`` feasible insertions, best ``score_insertion`` score first.
+    """
+    distances, durations = task["distances"], task["durations"]
+    vehicle, base_stops = task["vehicle"], task["stops"]
+    pickup, delivery = task["pickup"], task["delivery"]
+    capacity = tuple(vehicle.get("capacity") or ())
+    base = simulate_route(distances, durations, vehicle, base_stops, stop_on_violation=False)
+    route = [vehicle["home"]] + [stop["node"] for stop in base_stops]
+
+    def spec(stop):
+        return stop.get("window_start"), stop.get("window_end"), stop.get("service_hours") or 0.0, tuple((stop.get("load") or ())[: len(capacity)])
+
+    evaluator = InsertionEvaluator(distances, durations, route, [stop.get("cargo_delta") or 0 for stop in base_stops])
+    feasibility = InsertionFeasibility(
+        durations,
+        route,
+        [stop.get("service_hours") or 0.0 for stop in base_stops],
+        [stop.get("window_start") for stop in base_stops],
+        [stop.get("window_end") for stop in base_stops],
+        [spec(stop)[3] for stop in base_stops],
+        capacity,
+    )
+    drive_limit = vehicle.get("drive_hours") or 0.0
+    ranked = []
+    for i, j in feasibility.feasible_pairs(pickup["node"], delivery["node"], spec(pickup), spec(delivery)):
+        totals = evaluator.evaluate(pickup["node"], delivery["node"], pickup.get("cargo_delta") or 0, delivery.get("cargo_delta") or 0, i, j)
+        if drive_limit and totals["total_drive_hours"] > drive_limit:
+            continue
+        ranked.append((score_insertion(base, totals, task["revenue"], task["cost_per_km"], task["deadhead_weight"])[0], i, j))
+    ranked.sort(key=lambda item: item[0], reverse=True)
+
+    options = []
+    for _score, i, j in ranked:
+        if len(options) >= task["top_k"]:
+            break
+        candidate = list(base_stops)
+        candidate.insert(i, pickup)
+        candidate.insert(j, delivery)
+        totals = simulate_route(distances, durations, vehicle, candidate)
+        if not totals["feasible"]:
+            continue
+        score, profit, deadhead = score_insertion(base, totals, task["revenue"], task["cost_per_km"], task["deadhead_weight"])
+        options.append({"pickup_idx": i, "delivery_idx": j, "score": score, "incremental_profit": profit, "deadhead_reduction": deadhead})
+    options.sort(key=lambda option: option["score"], reverse=True)
+    return {"key": task["key"], "options": options}
+
+
+def rank_insertions_many(tasks, executor=None):
+    """Run ``rank_insertions`` for every task, results in task order.
+
+    Tasks run on ``executor`` (a process pool, see ``process_pool.shared_pool``)
+    when one is given and there is more than one task; ranking falls back to
+    in-process when the pool fails (pickling or worker failure).
+    """
+    tasks = list(tasks)
+    if executor is not None and len(tasks) > 1:
+        try:
+            return list(executor.map(rank_insertions, tasks))
+        except Exception as exc:
+            _logger.warning("Insertion process pool unavailable (%s); ranking candidates in-process.", exc)
+    return [rank_insertions(task) for task in tasks]
@@ -0,0 +1,150 @@
+import logging
+from collections import Counter
+from datetime import datetime, time, timedelta, timezone
+
+from .mapbox_service import MapboxService
+
+_logger = logging.getLogger(__name__)
+
+
+class RouteWarmupService:
+    """Pre-fetch geocodes and routes of the busiest lanes so morning quotes hit warm caches.
+
+    Lanes are mined from consecutive geocoded dispatch stops and vehicle home bases
+    → first stop, by the same address strings the quote path routes, so they land
+    on the route-cache keys real quotes look up. (Pricing-history cities would
+    geocode to city centroids no address-level quote ever matches.) The top lanes are geocoded
+    and routed in batches through the pooled Mapbox client, for the departure
+    buckets quotes will use the next day, spending at most the configured number of
+    Mapbox requests per run. Budget left over refreshes route-cache rows past
+    ``premafirm.route_cache_ttl_days`` that lookups still use, most used first.
+    """
+
+    LANE_LIMIT = 200
+    LOOKBACK_DAYS = 90
+    # Mapbox requests (geocodes + routes) one warm-up run may spend.
+    API_BUDGET = 500
+    BATCH_SIZE = 25
+    # Local hours of tomorrow whose departure buckets are warmed.
+    DEPARTURE_HOURS = "8"
+
+    def __init__(self, env):
+        self.env = env
+        self.map_service = MapboxService(env)
+
+    def _int_param(self, key, default):
+        return int(self.map_service._get_float_param(key, default))
+
+    def top_lanes(self, limit=None, days=None):
+        """The ``limit`` most frequent ``(origin, destination)`` address lanes of the last ``days`` days."""
+        limit = limit or self._int_param("premafirm.route_warmup_lanes", self.LANE_LIMIT)
+        days = days or self._int_param("premafirm.route_warmup_days", self.LOOKBACK_DAYS)
+        since = datetime.utcnow() - timedelta(days=days)
+        counts = Counter()
+
+        stops = self.env["premafirm.dispatch.stop"].search([("create_date", ">=", since)], order="lead_id, sequence, id")
+        previous = None
+        for stop in stops:
+            address = stop.full_address or stop.address
+            # Stops that were never geocoded start or end no lane.
+            geocoded = bool(stop.latitude or stop.longitude)
+            if previous is not None and previous.lead_id == stop.lead_id:
+                if geocoded and (previous.latitude or previous.longitude):
+                    counts[(previous.full_address or previous.address, address)] += 1
+            elif geocoded and stop.lead_id.assigned_vehicle_id.home_location:
+                counts[(stop.lead_id.assigned_vehicle_id.home_location, address)] += 1
+            previous = stop
+
+        lanes = {}
+        for (origin, destination), _count in counts.most_common():
+            origin = self.map_service._normalize_address(origin)
+            destination = self.map_service._normalize_address(destination)
+            if origin and destination and origin != destination:
+                lanes.setdefault((origin, destination), True)
+            if len(lanes) >= limit:
+                break
+        return list(lanes)
+
+    def warmup_departures(self, now=None):
+        """Naive UTC departures at tomorrow's ``premafirm.route_warmup_departure_hours`` (local)."""
+        tz = self.map_service._departure_tz()
+        tomorrow = (now or datetime.now(timezone.utc)).astimezone(tz).date() + timedelta(days=1)
+        hours = str(self.map_service._get_param("premafirm.route_warmup_departure_hours", self.DEPARTURE_HOURS))
+        departures = []
+        for hour in hours.split(","):
+            try:
+                local = datetime.combine(tomorrow, time(int(hour.strip()) % 24), tzinfo=tz)
+            except ValueError:
+                continue
+            departures.append(local.astimezone(timezone.utc).replace(tzinfo=None))
+        return departures or [None]
+
+    def _geocode_is_fresh(self, address):
+        address_key = self.map_service._geocode_cache_key(address)
+        if not address_key:
+            return False
+        cached, fresh = self.map_service._geocode_cache_lookup(address_key)
+        return bool(cached) and fresh
+
+    def run(self):
+        """Warm the caches for the top lanes; returns counters of what was fetched."""
+        mapbox = self.map_service
+        budget = self._int_param("premafirm.route_warmup_api_budget", self.API_BUDGET)
+        lanes = self.top_lanes()
+        stats = {"lanes": len(lanes), "geocoded": 0, "routed": 0, "refreshed": 0, "skipped": 0}
+
+        addresses = list(dict.fromkeys(address for lane in lanes for address in lane))
+        uncached = [address for address in addresses if not self._geocode_is_fresh(address)]
+        to_geocode, over_budget = uncached[:budget], set(uncached[budget:])
+        geocoded = {}
+        for start in range(0, len(to_geocode), self.BATCH_SIZE):
+            batch = to_geocode[start:start + self.BATCH_SIZE]
+            geocoded.update(zip(batch, mapbox.geocode_many(batch)))
+        budget -= len(to_geocode)
+        stats["geocoded"] = len(to_geocode)
+
+        lanes = [lane for lane in lanes if not over_budget.intersection(lane)]
+        # Everything else is in the geocode cache already: no requests.
+        geocoded.update(mapbox._geocode_addresses([address for lane in lanes for address in lane if address not in geocoded]))
+        route_keys = mapbox._route_keys(geocoded)
+        missing = []
+        for departure in self.warmup_departures():
+            hour = mapbox.departure_hour(departure)
+            for origin, destination in lanes:
+                if mapbox._point_warning(geocoded[origin]) or mapbox._point_warning(geocoded[destination]):
+                    continue
+                if not mapbox._cache_lookup_leg(route_keys[origin], route_keys[destination], hour):
+                    missing.append((origin, destination, departure))
+        to_route = missing[:max(budget, 0)]
+        for start in range(0, len(to_route), self.BATCH_SIZE):
+            mapbox.get_travel_times(to_route[start:start + self.BATCH_SIZE])
+        stats["routed"] = len(to_route)
+        stats["skipped"] = len(missing) - len(to_route) + len(over_budget)
+        stats["refreshed"] = self.refresh_stale(budget - len(to_route))
+        _logger.info(
+            "Route warm-up: %s lanes, %s geocodes and %s routes fetched, %s stale rows refreshed, %s skipped over budget",
+            stats["lanes"], stats["geocoded"], stats["routed"], stats["refreshed"], stats["skipped"],
+        )
+        return stats
+
+    def refresh_stale(self, budget):
+        """Re-route up to ``budget`` stale route-cache rows that were looked up since they went stale."""
+        if budget <= 0:
+            return 0
+        ttl_days = self.map_service._get_float_param("premafirm.route_cache_ttl_days", self.map_service.ROUTE_CACHE_TTL_DAYS)
+        stale_before = datetime.utcnow() - timedelta(days=ttl_days)
+        rows = self.env["premafirm.mapbox.cache"].search(
+            [
+                ("cached_at", "<", stale_before),
+                ("last_hit_at", ">=", stale_before),
+                ("waypoint_hash", "=", ""),
+                ("origin", "=like", "gh:%"),
+                ("destination", "=like", "gh:%"),
+            ],
+            order="hit_count desc, id",
+            limit=budget,
+        )
+        refreshed = 0
+        for start in range(0, len(rows), self.BATCH_SIZE):
+            refreshed += self.map_service.refresh_cache_rows(rows[start:start + self.BATCH_SIZE])
+        return refreshed
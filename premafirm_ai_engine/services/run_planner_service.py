@@ -1,11 +1,32 @@
-
-from datetime import timedelta
+from datetime import datetime, time, timedelta
+from types import SimpleNamespace
+from zoneinfo import ZoneInfo
 
 from odoo import fields
 
+from .dispatch_rules_engine import DispatchRulesEngine
+from . import process_pool
 from .mapbox_service import MapboxService
+from .route_matrix import RouteMatrix
+from .route_optimizer import (
+    FleetSolver,
+    InsertionEvaluator,
+    InsertionFeasibility,
+    rank_insertions_many,
+    score_insertion,
+)
 
+COST_PER_KM = 1.65
 DEADHEAD_WEIGHT_PER_KM = 0.35
+# Insertion candidates that get a full simulation after delta-cost ranking.
+INSERTION_TOP_K = 3
+# Default search time for optimize_fleet; overridable with premafirm.fleet_optimizer_time_budget.
+FLEET_TIME_BUDGET_SECONDS = 10.0
+# Runs in these states are already committed to drivers and are left out of fleet re-planning.
+LOCKED_RUN_STATUSES = ("confirmed", "in_progress", "completed")
+# Process-pool settings for optimize_insertion_across_vehicles (see premafirm.insertion_pool_* params).
+INSERTION_POOL_WORKERS = 4
+INSERTION_POOL_START_METHOD = process_pool.DEFAULT_START_METHOD
 
 
 class RunPlannerService:
@@ -35,21 +56,81 @@ class RunPlannerService:
             next_seq += 1
         lead.dispatch_run_id = run.id
 
-    def simulate_run(self, run, stops):
+    def build_route_matrix(self, run, stops):
+        """Fetch one in-memory distance/duration matrix covering the run's home base and ``stops``."""
+        home = run.vehicle_id.home_location if run.vehicle_id else None
+        return RouteMatrix.for_stops(self.map_service, home, stops)
+
+    def _run_start(self, run):
+        return getattr(run, "start_datetime", False) or fields.Datetime.now()
+
+    @staticmethod
+    def _is_cross_border(stops):
+        return any((getattr(s, "country", "") or "").upper() in {"US", "USA", "UNITED STATES"} for s in stops)
+
+    def _run_limits(self, run, stops, cross_border=None):
+        """Vehicle capacity and HOS limits for a run; 0 means unlimited."""
+        vehicle = run.vehicle_id
+        hos_rules = DispatchRulesEngine(self.env).get("hos_rules")
+        if cross_border is None:
+            cross_border = self._is_cross_border(stops)
+        if cross_border:
+            max_drive_hours = float(hos_rules.get("cross_border_max_drive_hours", 11))
+        else:
+            max_drive_hours = float(hos_rules.get("canada_max_drive_hours", 13))
+        return {
+            "weight": float((getattr(vehicle, "max_weight", 0.0) or getattr(vehicle, "payload_capacity_lbs", 0.0) or 0.0)) if vehicle else 0.0,
+            "pallets": float(getattr(vehicle, "max_pallets", 0.0) or 0.0) if vehicle else 0.0,
+            "drive_hours": max_drive_hours,
+            "on_duty_hours": float(hos_rules.get("max_on_duty_hours", 14)),
+        }
+
+    def _stop_window(self, stop):
+        lead = getattr(stop, "lead_id", False)
+        if lead:
+            return lead._stop_window(stop)
+        is_pickup = getattr(stop, "stop_type", "pickup" if stop.cargo_delta > 0 else "delivery") == "pickup"
+        prefix = "pickup" if is_pickup else "delivery"
+        start = getattr(stop, "time_window_start", False) or getattr(stop, f"{prefix}_window_start", False)
+        end = getattr(stop, "time_window_end", False) or getattr(stop, f"{prefix}_window_end", False)
+        return start, end
+
+    @staticmethod
+    def _stop_load(stop):
+        sign = 1 if stop.cargo_delta > 0 else -1 if stop.cargo_delta < 0 else 0
+        return sign * float(getattr(stop, "pallets", 0) or 0), sign * float(getattr(stop, "weight_lbs", 0.0) or 0.0)
+
+    def simulate_run(self, run, stops, matrix=None, stop_on_violation=True):
+        """Simulate ``stops`` in order; ``feasible`` is False at the first broken window, capacity or HOS limit.
+
+        With ``stop_on_violation`` the simulation returns as soon as a constraint
+        fails; otherwise it keeps going so the totals cover the whole run.
+        ``etas`` are the times each stop is done (arrival, window wait and
+        service); ``arrivals`` are the times service can start there.
+        """
         ordered = list(stops)
         home = run.vehicle_id.home_location if run.vehicle_id else None
-        try:
-            segments = self.map_service.calculate_trip_segments(home, ordered, return_home=True)
-        except TypeError:
-            segments = self.map_service.calculate_trip_segments(ordered, origin_address=home)
+        start = self._run_start(run)
+        if matrix is not None:
+            segments = matrix.trip_segments(home, ordered, return_home=True)
+        else:
+            try:
+                segments = self.map_service.calculate_trip_segments(home, ordered, return_home=True, depart_at=start)
+            except TypeError:
+                segments = self.map_service.calculate_trip_segments(ordered, origin_address=home)
 
+        limits = self._run_limits(run, ordered)
         cargo_count = 0
+        pallets = 0.0
+        weight = 0.0
         empty_km = 0.0
         loaded_km = 0.0
         total_km = 0.0
         total_hours = 0.0
         etas = []
-        now = fields.Datetime.now()
+        arrivals = []
+        violation = False
+        now = start
         for idx, stop in enumerate(ordered):
             seg = segments[idx] if idx < len(segments) else {}
             seg_km = float(seg.get("distance_km") or 0.0)
@@ -60,14 +141,38 @@ class RunPlannerService:
                 empty_km += seg_km
             total_km += seg_km
             total_hours += seg_hr
-            now += timedelta(hours=seg_hr, minutes=stop.stop_service_mins or 0)
+            arrival = now + timedelta(hours=seg_hr)
+            window_start, window_end = self._stop_window(stop)
+            if window_start and arrival < window_start:
+                arrival = window_start
+            arrivals.append(arrival)
+            now = arrival + timedelta(minutes=stop.stop_service_mins or 0)
             etas.append(now)
             cargo_count += stop.cargo_delta
+            stop_pallets, stop_weight = self._stop_load(stop)
+            pallets += stop_pallets
+            weight += stop_weight
+
+            if not violation:
+                if window_end and arrival > window_end:
+                    violation = f"Stop {idx + 1} misses its time window."
+                elif limits["pallets"] and pallets > limits["pallets"]:
+                    violation = f"Vehicle capacity exceeded: pallets {pallets:.0f} exceeds limit {limits['pallets']:.0f}."
+                elif limits["weight"] and weight > limits["weight"]:
+                    violation = f"Vehicle capacity exceeded: weight {weight:.0f} lbs exceeds limit {limits['weight']:.0f} lbs."
+                elif limits["drive_hours"] and total_hours > limits["drive_hours"]:
+                    violation = f"HOS drive limit exceeded: {total_hours:.1f} h over {limits['drive_hours']:.1f} h."
+                elif limits["on_duty_hours"] and (now - start).total_seconds() / 3600.0 > limits["on_duty_hours"]:
+                    violation = f"HOS on-duty limit exceeded at stop {idx + 1}."
+                if violation and stop_on_violation:
+                    break
 
         return {
-            "feasible": True,
+            "feasible": not violation,
+            "violation": violation,
             "segments": segments,
             "etas": etas,
+            "arrivals": arrivals,
             "total_distance_km": total_km,
             "total_drive_hours": total_hours,
             "empty_distance_km": empty_km,
@@ -75,16 +180,12 @@ class RunPlannerService:
         }
 
     def _score_option(self, base_sim, option_sim, lead):
-        old_empty = float(base_sim.get("empty_distance_km") or 0.0)
-        new_empty = float(option_sim.get("empty_distance_km") or 0.0)
-        deadhead_reduction = old_empty - new_empty
-        incremental_cost = max((option_sim.get("total_distance_km", 0.0) - base_sim.get("total_distance_km", 0.0)) * 1.65, 0.0)
         revenue = lead.final_rate or lead.suggested_rate or 0.0
-        incremental_profit = revenue - incremental_cost
-        score = incremental_profit + deadhead_reduction * DEADHEAD_WEIGHT_PER_KM
-        return score, incremental_profit, deadhead_reduction
+        return score_insertion(base_sim, option_sim, revenue, COST_PER_KM, DEADHEAD_WEIGHT_PER_KM)
 
     def optimize_insertion_for_lead(self, lead):
+        # Queued schedule recomputes must land before leave-yard times and ETAs are compared.
+        self.env["crm.lead"]._flush_schedule_queue()
         if not lead.assigned_vehicle_id:
             return {"feasible": False, "text": "No assigned vehicle. Assign a vehicle before optimization.", "options": []}
         run_date = fields.Date.to_date((lead.leave_yard_at or fields.Datetime.now()).date())
@@ -100,27 +201,201 @@ class RunPlannerService:
         if len(new_stops) < 2:
             return {"feasible": False, "text": "Lead needs at least pickup and delivery stops for insertion.", "options": []}
 
-        base_sim = self.simulate_run(run, base_stops)
-        options = []
-        n = len(base_stops)
         pu = new_stops[0]
         dl = new_stops[1]
-        simulation_cache = {}
-        for i in range(0, n + 1):
-            for j in range(i + 1, n + 2):
+        # Every candidate order is priced from this one matrix, without further routing calls.
+        matrix = self.build_route_matrix(run, list(base_stops) + [pu, dl])
+        base_sim = self.simulate_run(run, base_stops, matrix=matrix, stop_on_violation=False)
+        home = run.vehicle_id.home_location if run.vehicle_id else None
+        route = [matrix.origin_node(home, base_stops)] + [matrix.node(stop) for stop in base_stops]
+        evaluator = InsertionEvaluator(
+            matrix.distances_km,
+            matrix.durations_hours,
+            route,
+            [stop.cargo_delta for stop in base_stops],
+        )
+        limits = self._run_limits(run, list(base_stops) + [pu, dl])
+        start = self._run_start(run)
+
+        def offset(value):
+            return (value - start).total_seconds() / 3600.0 if value else None
+
+        def spec(stop):
+            window_start, window_end = self._stop_window(stop)
+            return offset(window_start), offset(window_end), (stop.stop_service_mins or 0) / 60.0, self._stop_load(stop)
+
+        base_specs = [spec(stop) for stop in base_stops]
+        feasibility = InsertionFeasibility(
+            matrix.durations_hours,
+            route,
+            [item[2] for item in base_specs],
+            [item[0] for item in base_specs],
+            [item[1] for item in base_specs],
+            [item[3] for item in base_specs],
+            (limits["pallets"], limits["weight"]),
+        )
+        pu_node, dl_node = matrix.node(pu), matrix.node(dl)
+
+        ranked = []
+        for i, j in feasibility.feasible_pairs(pu_node, dl_node, spec(pu), spec(dl)):
+            totals = evaluator.evaluate(pu_node, dl_node, pu.cargo_delta, dl.cargo_delta, i, j)
+            if limits["drive_hours"] and totals["total_drive_hours"] > limits["drive_hours"]:
+                continue
+            score = self._score_option(base_sim, totals, lead)[0]
+            ranked.append((score, i, j))
+        ranked.sort(key=lambda item: item[0], reverse=True)
+
+        options = []
+        for _score, i, j in ranked:
+            if len(options) >= INSERTION_TOP_K:
+                break
+            candidate = list(base_stops)
+            candidate.insert(i, pu)
+            candidate.insert(j, dl)
+            sim = self.simulate_run(run, candidate, matrix=matrix)
+            if not sim["feasible"]:
+                continue
+            score, inc_profit, dh = self._score_option(base_sim, sim, lead)
+            options.append(
+                {
+                    "pickup_idx": i,
+                    "delivery_idx": j,
+                    "score": score,
+                    "incremental_profit": inc_profit,
+                    "deadhead_reduction": dh,
+                    "added_km": sim["total_distance_km"] - base_sim["total_distance_km"],
+                    "added_hours": sim["total_drive_hours"] - base_sim["total_drive_hours"],
+                    "simulation": sim,
+                    "order": candidate,
+                }
+            )
+        options = sorted(options, key=lambda o: o["score"], reverse=True)
+        if not options:
+            reason = base_sim.get("violation") or "no pickup/delivery position satisfies time windows, capacity and HOS limits"
+            return {"feasible": False, "text": f"No feasible insertion: {reason}", "options": [], "run_id": run.id}
+        text_lines = ["Top AI schedule options:"]
+        for idx, option in enumerate(options, 1):
+            text_lines.append(
+                f"Option {idx}: +{option['added_km']:.1f} km, +{option['added_hours']:.2f} h, "
+                f"deadhead Δ {option['deadhead_reduction']:.1f} km, incremental profit ${option['incremental_profit']:.2f}."
+            )
+        return {"feasible": bool(options), "text": "\n".join(text_lines), "options": options, "run_id": run.id}
+
+    def _insertion_pool(self, task_count):
+        """This worker's long-lived insertion pool, or None when ranking in-process is enough."""
+        workers = int(self.map_service._get_float_param("premafirm.insertion_pool_workers", INSERTION_POOL_WORKERS))
+        if workers <= 1 or task_count <= 1:
+            return None
+        start_method = self.map_service._get_param("premafirm.insertion_pool_start_method", INSERTION_POOL_START_METHOD)
+        return process_pool.shared_pool("insertion", workers, start_method)
+
+    def _insertion_task(self, vehicle, plan_run, base_stops, pickup, delivery, lead, matrix, top_k):
+        """Plain-data snapshot of one vehicle's run for ``rank_insertions``, on a local sub-matrix."""
+        home = plan_run.vehicle_id.home_location
+        nodes = list(dict.fromkeys([matrix.origin_node(home, base_stops)] + [matrix.node(stop) for stop in list(base_stops) + [pickup, delivery]]))
+        local = {node: idx for idx, node in enumerate(nodes)}
+        start = self._run_start(plan_run)
+        limits = self._run_limits(plan_run, list(base_stops) + [pickup, delivery])
+
+        def offset(value):
+            return (value - start).total_seconds() / 3600.0 if value else None
+
+        def spec(stop):
+            window_start, window_end = self._stop_window(stop)
+            return {
+                "node": local[matrix.node(stop)],
+                "service_hours": (stop.stop_service_mins or 0) / 60.0,
+                "window_start": offset(window_start),
+                "window_end": offset(window_end),
+                "load": self._stop_load(stop),
+                "cargo_delta": stop.cargo_delta,
+            }
+
+        return {
+            "key": vehicle.id,
+            "distances": [[matrix.distances_km[a][b] for b in nodes] for a in nodes],
+            "durations": [[matrix.durations_hours[a][b] for b in nodes] for a in nodes],
+            "vehicle": {
+                "home": 0,
+                "start": 0.0,
+                "capacity": (limits["pallets"], limits["weight"]),
+                "drive_hours": limits["drive_hours"],
+                "on_duty_hours": limits["on_duty_hours"],
+            },
+            "stops": [spec(stop) for stop in base_stops],
+            "pickup": spec(pickup),
+            "delivery": spec(delivery),
+            "revenue": lead.final_rate or lead.suggested_rate or 0.0,
+            "cost_per_km": COST_PER_KM,
+            "deadhead_weight": DEADHEAD_WEIGHT_PER_KM,
+            "top_k": top_k,
+        }
+
+    def optimize_insertion_across_vehicles(self, lead, vehicles=None, top_k=INSERTION_TOP_K):
+        """Rank insertions of ``lead`` into every candidate vehicle's run in one pass.
+
+        Each run is snapshotted into plain data and ranked on a process pool
+        (``rank_insertions_many``); the best candidates per vehicle are then
+        re-simulated here and merged into one list ordered by ``_score_option``.
+        """
+        self.env["crm.lead"]._flush_schedule_queue()
+        new_stops = lead.dispatch_stop_ids.sorted("sequence")
+        if len(new_stops) < 2:
+            return {"feasible": False, "text": "Lead needs at least pickup and delivery stops for insertion.", "options": []}
+        pu, dl = new_stops[0], new_stops[1]
+        run_date = fields.Date.to_date((lead.leave_yard_at or fields.Datetime.now()).date())
+        vehicles = self._available_vehicles() if vehicles is None else vehicles
+        runs = self.env["premafirm.dispatch.run"].search(
+            [("run_date", "=", run_date), ("vehicle_id", "in", vehicles.ids), ("status", "!=", "cancelled")]
+        )
+        locked_runs = runs.filtered(lambda run: run.status in LOCKED_RUN_STATUSES)
+        vehicles = vehicles - locked_runs.vehicle_id
+        run_by_vehicle = {}
+        for run in runs - locked_runs:
+            run_by_vehicle.setdefault(run.vehicle_id.id, run)
+
+        snapshots = {}
+        for vehicle in vehicles:
+            run = run_by_vehicle.get(vehicle.id)
+            base_stops = run.stop_ids.sorted("run_sequence").filtered(lambda stop: stop.lead_id != lead) if run else new_stops[:0]
+            plan_run = SimpleNamespace(
+                vehicle_id=vehicle,
+                start_datetime=(run.start_datetime if run else False) or self._vehicle_day_start(vehicle, run_date),
+            )
+            snapshots[vehicle.id] = (vehicle, run, plan_run, base_stops)
+        addresses = [pu, dl]
+        for _vehicle, _run, plan_run, base_stops in snapshots.values():
+            addresses.append(self.map_service._trip_origin(plan_run.vehicle_id.home_location, base_stops))
+            addresses.extend(base_stops)
+        # One matrix fetch for the whole fleet; workers only get their own slice of it.
+        matrix = RouteMatrix(self.map_service, [self.map_service._stop_address(item) for item in addresses])
+        tasks = [
+            self._insertion_task(vehicle, plan_run, base_stops, pu, dl, lead, matrix, top_k)
+            for vehicle, _run, plan_run, base_stops in snapshots.values()
+        ]
+        results = rank_insertions_many(tasks, executor=self._insertion_pool(len(tasks)))
+
+        options = []
+        for result in results:
+            vehicle, run, plan_run, base_stops = snapshots[result["key"]]
+            if not result["options"]:
+                continue
+            base_sim = self.simulate_run(plan_run, base_stops, matrix=matrix, stop_on_violation=False)
+            for ranked in result["options"]:
                 candidate = list(base_stops)
-                candidate.insert(i, pu)
-                candidate.insert(j, dl)
-                key = tuple(stop.id for stop in candidate)
-                sim = simulation_cache.get(key)
-                if sim is None:
-                    sim = self.simulate_run(run, candidate)
-                    simulation_cache[key] = sim
+                candidate.insert(ranked["pickup_idx"], pu)
+                candidate.insert(ranked["delivery_idx"], dl)
+                sim = self.simulate_run(plan_run, candidate, matrix=matrix)
+                if not sim["feasible"]:
+                    continue
                 score, inc_profit, dh = self._score_option(base_sim, sim, lead)
                 options.append(
                     {
-                        "pickup_idx": i,
-                        "delivery_idx": j,
+                        "vehicle_id": vehicle.id,
+                        "run_id": run.id if run else False,
+                        "run_date": run_date,
+                        "pickup_idx": ranked["pickup_idx"],
+                        "delivery_idx": ranked["delivery_idx"],
                         "score": score,
                         "incremental_profit": inc_profit,
                         "deadhead_reduction": dh,
@@ -130,17 +405,25 @@ class RunPlannerService:
                         "order": candidate,
                     }
                 )
-        options = sorted(options, key=lambda o: o["score"], reverse=True)[:3]
-        text_lines = ["Top AI schedule options:"]
-        for idx, option in enumerate(options, 1):
+        options.sort(key=lambda o: o["score"], reverse=True)
+        if not options:
+            return {"feasible": False, "text": f"No feasible insertion on any of {len(tasks)} vehicles.", "options": []}
+        text_lines = [f"Top AI schedule options across {len(tasks)} vehicles:"]
+        for idx, option in enumerate(options[: max(top_k, 1) * 2], 1):
             text_lines.append(
-                f"Option {idx}: +{option['added_km']:.1f} km, +{option['added_hours']:.2f} h, "
+                f"Option {idx} ({self.env['fleet.vehicle'].browse(option['vehicle_id']).display_name}): "
+                f"+{option['added_km']:.1f} km, +{option['added_hours']:.2f} h, "
                 f"deadhead Δ {option['deadhead_reduction']:.1f} km, incremental profit ${option['incremental_profit']:.2f}."
             )
-        return {"feasible": bool(options), "text": "\n".join(text_lines), "options": options, "run_id": run.id}
+        return {"feasible": True, "text": "\n".join(text_lines), "options": options}
 
     def apply_option(self, lead, option):
-        run = self.env["premafirm.dispatch.run"].browse(option.get("run_id"))
+        if option.get("run_id"):
+            run = self.env["premafirm.dispatch.run"].browse(option.get("run_id"))
+        else:
+            run = self.get_or_create_run(self.env["fleet.vehicle"].browse(option["vehicle_id"]), option["run_date"])
+        if lead and option.get("vehicle_id"):
+            lead.filtered(lambda rec: rec.assigned_vehicle_id.id != option["vehicle_id"]).write({"assigned_vehicle_id": option["vehicle_id"]})
         ordered = option.get("order") or []
         for seq, stop in enumerate(ordered, 1):
             stop.write({"run_id": run.id, "run_sequence": seq})
@@ -148,6 +431,178 @@ class RunPlannerService:
         sim = option.get("simulation") or self.simulate_run(run, run.stop_ids.sorted("run_sequence"))
         self._update_run(run, sim)
 
+    def _fleet_time_budget(self):
+        return self.map_service._get_float_param("premafirm.fleet_optimizer_time_budget", FLEET_TIME_BUDGET_SECONDS)
+
+    def _vehicle_day_start(self, vehicle, run_date):
+        """UTC datetime at which ``vehicle`` leaves its yard on ``run_date`` (its work start hour, company time)."""
+        tz = ZoneInfo(self.env.company.partner_id.tz or "America/Toronto")
+        hour_float = float(vehicle.work_start_hour or 8.0)
+        hh = int(hour_float)
+        mm = int(round((hour_float - hh) * 60))
+        local_start = datetime.combine(run_date, time(hh, mm), tzinfo=tz)
+        return local_start.astimezone(ZoneInfo("UTC")).replace(tzinfo=None)
+
+    def _open_fleet_leads(self, run_date):
+        return self.env["crm.lead"].search(
+            [("pickup_date", "=", run_date), ("dispatch_stop_ids", "!=", False), ("schedule_locked", "=", False)]
+        )
+
+    def _available_vehicles(self):
+        return self.env["fleet.vehicle"].search([("home_location", "!=", False)])
+
+    def optimize_fleet(self, run_date, leads=None, vehicles=None, time_budget=None):
+        """Assign and sequence every open lead of ``run_date`` over the available fleet.
+
+        Leads already on a draft/planned run start there and may move; stops of
+        other leads on those runs stay on their vehicle. Vehicles whose run for
+        the day is confirmed or later are left out. The returned plan holds one
+        ``apply_option``-style option per vehicle; write it with ``apply_fleet_plan``.
+        """
+        self.env["crm.lead"]._flush_schedule_queue()
+        run_date = fields.Date.to_date(run_date)
+        leads = self._open_fleet_leads(run_date) if leads is None else leads
+        vehicles = self._available_vehicles() if vehicles is None else vehicles
+        runs = self.env["premafirm.dispatch.run"].search(
+            [("run_date", "=", run_date), ("vehicle_id", "in", vehicles.ids), ("status", "!=", "cancelled")]
+        )
+        locked_runs = runs.filtered(lambda run: run.status in LOCKED_RUN_STATUSES)
+        vehicles = vehicles - locked_runs.vehicle_id
+        run_by_vehicle = {}
+        for run in runs - locked_runs:
+            if run.vehicle_id in vehicles:
+                run_by_vehicle.setdefault(run.vehicle_id.id, run)
+        leads = leads.filtered(lambda lead: lead.dispatch_run_id not in locked_runs)
+
+        stops_by_lead = {lead.id: list(lead.dispatch_stop_ids.sorted("sequence")) for lead in leads if lead.dispatch_stop_ids}
+        initial_routes = {}
+        pinned = {}
+        for vehicle_id, run in run_by_vehicle.items():
+            initial_routes[vehicle_id] = list(run.stop_ids.sorted("run_sequence"))
+            for stop in initial_routes[vehicle_id]:
+                if stop.lead_id not in leads:
+                    # Other leads' stops keep their vehicle; keyed per run in case a lead spans two.
+                    pinned.setdefault((stop.lead_id.id, vehicle_id), []).append(stop)
+        for key, stops in pinned.items():
+            stops_by_lead[key] = sorted(stops, key=lambda stop: stop.sequence)
+        all_stops = [stop for stops in stops_by_lead.values() for stop in stops]
+        stops_by_id = {stop.id: stop for stop in all_stops}
+
+        matrix = RouteMatrix(self.map_service, [vehicle.home_location for vehicle in vehicles] + [self.map_service._stop_address(stop) for stop in all_stops])
+        starts = {vehicle.id: self._vehicle_day_start(vehicle, run_date) for vehicle in vehicles}
+        origin = min(starts.values()) if starts else fields.Datetime.now()
+
+        def offset(value):
+            return (value - origin).total_seconds() / 3600.0 if value else None
+
+        vehicle_specs = []
+        for vehicle in vehicles:
+            plan_run = SimpleNamespace(vehicle_id=vehicle, start_datetime=starts[vehicle.id])
+            limits = self._run_limits(plan_run, [], cross_border=False)
+            vehicle_specs.append(
+                {
+                    "key": vehicle.id,
+                    "home": matrix.origin_node(vehicle.home_location, []),
+                    "start": offset(starts[vehicle.id]),
+                    "capacity": (limits["pallets"], limits["weight"]),
+                    "drive_hours": limits["drive_hours"],
+                    "cross_border_drive_hours": self._run_limits(plan_run, [], cross_border=True)["drive_hours"],
+                    "on_duty_hours": limits["on_duty_hours"],
+                    "route": [stop.id for stop in initial_routes.get(vehicle.id, []) if stop.id in stops_by_id],
+                }
+            )
+        stop_specs = {}
+        for stop in all_stops:
+            window_start, window_end = self._stop_window(stop)
+            stop_specs[stop.id] = {
+                "node": matrix.node(stop),
+                "service_hours": (stop.stop_service_mins or 0) / 60.0,
+                "window_start": offset(window_start),
+                "window_end": offset(window_end),
+                "load": self._stop_load(stop),
+                "cargo_delta": stop.cargo_delta,
+            }
+        request_specs = []
+        for key, stops in stops_by_lead.items():
+            lead = stops[0].lead_id
+            request_specs.append(
+                {
+                    "key": key,
+                    "stops": [stop.id for stop in stops],
+                    "revenue": lead.final_rate or lead.suggested_rate or 0.0,
+                    "cross_border": self._is_cross_border(stops),
+                    "vehicles": {key[1]} if key in pinned else None,
+                    "pinned": key in pinned,
+                }
+            )
+
+        solution = FleetSolver(
+            matrix.distances_km,
+            matrix.durations_hours,
+            vehicle_specs,
+            stop_specs,
+            request_specs,
+            cost_per_km=COST_PER_KM,
+            deadhead_weight=DEADHEAD_WEIGHT_PER_KM,
+            time_budget=self._fleet_time_budget() if time_budget is None else time_budget,
+        ).solve()
+
+        options = []
+        for vehicle in vehicles:
+            route = solution["routes"][vehicle.id]
+            run = run_by_vehicle.get(vehicle.id)
+            if not route["stops"] and not run:
+                continue
+            order = [stops_by_id[stop_id] for stop_id in route["stops"]]
+            plan_run = SimpleNamespace(vehicle_id=vehicle, start_datetime=starts[vehicle.id])
+            options.append(
+                {
+                    "vehicle_id": vehicle.id,
+                    "run_id": run.id if run else False,
+                    "run_date": run_date,
+                    "order": order,
+                    "lead_ids": list(dict.fromkeys(stop.lead_id.id for stop in order)),
+                    "score": (route["totals"] or {}).get("score", 0.0),
+                    "simulation": self.simulate_run(plan_run, order, matrix=matrix),
+                }
+            )
+        unassigned = self.env["crm.lead"].browse(solution["unassigned"])
+        text_lines = [f"Fleet plan for {run_date}: {solution['served']} of {len(request_specs)} loads on {sum(1 for o in options if o['order'])} vehicles."]
+        for option in options:
+            if option["order"]:
+                sim = option["simulation"]
+                text_lines.append(
+                    f"{self.env['fleet.vehicle'].browse(option['vehicle_id']).display_name}: {len(option['lead_ids'])} loads, "
+                    f"{sim['total_distance_km']:.1f} km, {sim['total_drive_hours']:.2f} h, empty {sim['empty_distance_km']:.1f} km."
+                )
+        if unassigned:
+            text_lines.append("Unassigned: " + ", ".join(unassigned.mapped("display_name")))
+        return {
+            "feasible": not unassigned,
+            "text": "\n".join(text_lines),
+            "options": options,
+            "unassigned_lead_ids": unassigned.ids,
+            "score": solution["score"],
+            "timed_out": solution["timed_out"],
+        }
+
+    def apply_fleet_plan(self, plan):
+        """Write an ``optimize_fleet`` plan: each vehicle's option goes through ``apply_option``."""
+        Stop = self.env["premafirm.dispatch.stop"]
+        for option in plan.get("options") or []:
+            vehicle = self.env["fleet.vehicle"].browse(option["vehicle_id"])
+            if option.get("run_id"):
+                run = self.env["premafirm.dispatch.run"].browse(option["run_id"])
+            else:
+                run = self.get_or_create_run(vehicle, option["run_date"])
+            order = option.get("order") or []
+            # Stops the plan moved to another vehicle or left unassigned.
+            dropped = run.stop_ids - Stop.concat(*order)
+            if dropped:
+                dropped.write({"run_id": False})
+                dropped.lead_id.filtered(lambda lead: lead.dispatch_run_id == run).write({"dispatch_run_id": False})
+            self.apply_option(Stop.concat(*order).lead_id, dict(option, run_id=run.id))
+
     def _get_driver_partner(self, vehicle):
         # Fleet standard: vehicle.driver_id is already a res.partner record.
         if not vehicle:
@@ -155,6 +610,7 @@ class RunPlannerService:
         return vehicle.driver_id or False
 
     def _update_run(self, run, simulation):
+        self.env["crm.lead"]._flush_schedule_queue()
         ordered_stops = run.stop_ids.sorted("run_sequence")
         start_candidates = [
             stop.lead_id.leave_yard_at
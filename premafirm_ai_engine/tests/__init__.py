@@ -2,3 +2,8 @@ from . import test_run_planner_service
 from . import test_crm_lead_product_assignment
 from . import test_crm_load_number_and_sales_order_lines
 from . import test_crm_lead_pricing_regression
+from . import test_schedule_queue
+from . import test_route_warmup
+from . import test_route_cache_eviction
+from . import test_cache_eviction_mixin
+from . import test_llm_cache
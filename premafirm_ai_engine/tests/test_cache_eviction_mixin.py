@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta
+
+from odoo.tests.common import TransactionCase
+
+
+class TestCacheEvictionMixin(TransactionCase):
+    """Eviction and hit counting of ``premafirm.cache.eviction.mixin``, through the LLM cache."""
+
+    def setUp(self):
+        super().setUp()
+        self.Cache = self.env["premafirm.llm.cache"]
+        self.Cache.search([]).unlink()
+        self.params = self.env["ir.config_parameter"].sudo()
+        self.params.set_param("premafirm.llm_cache_ttl_days", "30")
+        now = datetime.utcnow()
+        self.rows = {}
+        for name, cached_days, hit_days, hits in [
+            ("expired", 45, 1, 9),
+            ("cold", 5, 5, 0),
+            ("warm", 5, 3, 2),
+            ("hot", 5, 1, 7),
+        ]:
+            row = self.Cache.create(
+                {
+                    "key": name,
+                    "model_name": "gpt-4.1-mini",
+                    "prompt_version": "1",
+                    "response": '{"stops": []}',
+                    "cached_at": now - timedelta(days=cached_days),
+                }
+            )
+            row.write({"last_hit_at": now - timedelta(days=hit_days), "hit_count": hits})
+            self.rows[name] = row
+
+    def test_expired_rows_are_dropped_and_least_recently_used_rows_go_over_budget(self):
+        self.params.set_param("premafirm.llm_cache_max_rows", "2")
+
+        removed = self.Cache._cron_evict_llm_cache()
+
+        self.assertEqual(removed, 2)
+        self.assertEqual(set(self.Cache.search([]).mapped("key")), {"warm", "hot"})
+
+    def test_size_budget_evicts_least_recently_used_rows(self):
+        self.env.cr.execute(self.Cache._cache_size_query())
+        rows, size = self.env.cr.fetchone()
+        # Room for two of the three live rows; the expired row's bytes do not count.
+        self.params.set_param("premafirm.llm_cache_max_mb", str(size / rows * 2.5 / 1024 / 1024))
+
+        self.Cache._cron_evict_llm_cache()
+
+        self.assertEqual(set(self.Cache.search([]).mapped("key")), {"warm", "hot"})
+
+    def test_hits_are_counted_per_model_after_commit(self):
+        (self.rows["cold"] | self.rows["hot"])._record_hits()
+        self.rows["hot"]._record_hits()
+
+        self.assertEqual(
+            self.env.cr.postcommit.data["premafirm.llm.cache.hits"],
+            {self.rows["cold"].id: 1, self.rows["hot"].id: 2},
+        )
+        self.assertEqual(self.rows["hot"].hit_count, 7)
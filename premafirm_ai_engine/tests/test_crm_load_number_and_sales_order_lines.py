@@ -1,3 +1,6 @@
+from unittest.mock import patch
+
+from odoo.exceptions import AccessError
 from odoo.tests.common import TransactionCase
 
 from ..services.ai_extraction_service import AIExtractionService
@@ -77,6 +80,36 @@ class TestCrmLoadNumberAndSalesOrderLines(TransactionCase):
         self.assertEqual(stops[2].load_id, stops[3].load_id)
         self.assertNotEqual(stops[1].load_id, stops[2].load_id)
 
+    def test_create_multi_numbers_stops_after_existing_sequence(self):
+        lead = self._create_lead_with_two_loads()
+        new_stops = self.env["premafirm.dispatch.stop"].create(
+            [
+                {"lead_id": lead.id, "stop_type": "pickup", "address": "Barrie, ON, Canada", "pallets": 2},
+                {"lead_id": lead.id, "stop_type": "delivery", "address": "Oshawa, ON, Canada", "pallets": 2},
+            ]
+        )
+
+        self.assertEqual(new_stops.mapped("sequence"), [5, 6])
+        self.assertEqual(new_stops[0].load_id, new_stops[1].load_id)
+        self.assertNotIn(new_stops[0].load_id, lead.dispatch_stop_ids.sorted("sequence")[:4].mapped("load_id"))
+
+    def test_bulk_stop_creation_defers_loads_to_one_rebuild(self):
+        lead = self.env["crm.lead"].create({"name": "Bulk Lead", "partner_id": self.partner.id})
+        stop_vals = [
+            {"stop_type": "pickup", "address": "Barrie, ON, Canada", "pallets": 8, "load_key": "section_1", "extracted_load_name": "LOAD 1"},
+            {"stop_type": "delivery", "address": "Mississauga, ON, Canada", "pallets": 8, "load_key": "section_1", "extracted_load_name": "LOAD 1"},
+            {"stop_type": "pickup", "address": "Vaughan, ON, Canada", "pallets": 9, "load_key": "section_2", "extracted_load_name": "LOAD 2"},
+            {"stop_type": "delivery", "address": "Ottawa, ON, Canada", "pallets": 9, "load_key": "section_2", "extracted_load_name": "LOAD 2"},
+        ]
+
+        stops = CRMDispatchService(self.env)._create_stops_bulk(lead, stop_vals)
+
+        self.assertEqual(stops.mapped("sequence"), [1, 2, 3, 4])
+        self.assertFalse(stops.mapped("load_id"))
+        lead.action_rebuild_loads_from_ai()
+        self.assertEqual([stop.load_id.name for stop in stops], ["LOAD 1", "LOAD 1", "LOAD 2", "LOAD 2"])
+        self.assertEqual(len(stops.mapped("load_id")), 2)
+
     def test_load_id_manual_reassignment_logs_ai_correction(self):
         lead = self._create_lead_with_two_loads()
         stops = lead.dispatch_stop_ids.sorted("sequence")
@@ -156,6 +189,41 @@ Weight: 9115 lbs
         self.assertTrue(parsed["stops"][1]["address"].startswith("Mississauga"))
 
 
+    def test_attachment_text_cache_is_admin_only_but_filled_for_any_dispatcher(self):
+        dispatcher = self.env["res.users"].create(
+            {"name": "Dispatcher", "login": "attachment_text_dispatcher", "groups_id": [(6, 0, [self.env.ref("base.group_user").id])]}
+        )
+        attachment = self.env["ir.attachment"].create({"name": "rate_con.pdf", "raw": b"%PDF-1.4 dispatcher rate confirmation"})
+
+        with patch.object(AIExtractionService, "_parse_attachment_texts", autospec=True, return_value=["LOAD #1"]):
+            texts = AIExtractionService(self.env(user=dispatcher))._extract_attachment_texts(attachment)
+
+        self.assertEqual(texts, ["LOAD #1"])
+        self.assertEqual(self.env["premafirm.attachment.text"].search([("checksum", "=", attachment.checksum)]).text, "LOAD #1")
+        with self.assertRaises(AccessError):
+            self.env["premafirm.attachment.text"].with_user(dispatcher).search([])
+
+    def test_commercial_terms_read_the_full_pdf_text_not_the_load_scan(self):
+        attachment = self.env["ir.attachment"].create({"name": "rate_con.pdf", "raw": b"%PDF-1.4 rate confirmation"})
+        load = "LOAD #1\nPickup: Barrie, ON\nDelivery: Ottawa, ON"
+        parsed = []
+
+        def parse(ai_service, attachments, scan=None):
+            parsed.append(bool(scan))
+            # The scan stops before the appended terms page.
+            return [load if scan else f"{load}\nTerms and conditions\nLine haul 2450\nTONU applies after dispatch"]
+
+        service = CRMDispatchService(self.env)
+        with patch.object(AIExtractionService, "_parse_attachment_texts", autospec=True, side_effect=parse):
+            self.assertEqual(len(service.ai_service.extract_load("", attachments=attachment)["stops"]), 2)
+            terms = service._extract_commercial_terms("", attachments=attachment)
+            self.assertEqual(service._extract_commercial_terms("", attachments=attachment), terms)
+
+        self.assertEqual(terms["rate"], 2450.0)
+        self.assertTrue(terms["tonu"])
+        # One scan for the loads, one full read for the terms, the repeat served from cache.
+        self.assertEqual(parsed, [True, False])
+
     def test_normalize_stop_values_accepts_weight_alias(self):
         service = CRMDispatchService(self.env)
         stops = service._normalize_stop_values(
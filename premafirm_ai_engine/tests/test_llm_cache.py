@@ -0,0 +1,81 @@
+import json
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock, patch
+
+from odoo.exceptions import AccessError
+from odoo.tests.common import TransactionCase
+
+from ..services import ai_extraction_service
+from ..services.ai_extraction_service import LLM_CACHE_REFRESH_KEY, AIExtractionService
+
+
+class TestLlmCache(TransactionCase):
+    def setUp(self):
+        super().setUp()
+        self.env["premafirm.llm.cache"].search([]).unlink()
+        self.env["ir.config_parameter"].sudo().set_param("premafirm.llm_cache_ttl_days", "30")
+        self.answers = []
+
+        def post(url, **kwargs):
+            answer = {"stops": [{"stop_type": "pickup", "address": f"Barrie, ON #{len(self.answers) + 1}"}]}
+            self.answers.append(answer)
+            response = MagicMock()
+            response.json.return_value = {"output": [{"content": [{"type": "output_text", "text": json.dumps(answer)}]}]}
+            return response
+
+        patcher = patch.object(ai_extraction_service.requests, "post", side_effect=post)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        key_patcher = patch.object(AIExtractionService, "_get_openai_key", return_value="sk-test")
+        key_patcher.start()
+        self.addCleanup(key_patcher.stop)
+
+    def _extract(self, text, env=None):
+        return AIExtractionService(env or self.env)._openai_extract(text, "email")
+
+    def test_same_prompt_is_answered_from_the_cache_and_another_prompt_misses(self):
+        stats = AIExtractionService.llm_cache_stats()
+
+        first = self._extract("Pickup: Barrie, ON")
+        self.assertEqual(self._extract("Pickup: Barrie, ON"), first)
+        self._extract("Pickup: Ottawa, ON")
+
+        self.assertEqual(len(self.answers), 2)
+        self.assertEqual(len(self.env["premafirm.llm.cache"].search([])), 2)
+        after = AIExtractionService.llm_cache_stats()
+        self.assertEqual({key: after[key] - stats[key] for key in after}, {"hits": 1, "misses": 2, "refreshes": 0})
+
+    def test_refresh_context_calls_the_model_and_replaces_the_cached_answer(self):
+        self._extract("Pickup: Barrie, ON")
+
+        refreshed = self._extract("Pickup: Barrie, ON", env=self.env(context=dict(self.env.context, **{LLM_CACHE_REFRESH_KEY: True})))
+
+        self.assertEqual(len(self.answers), 2)
+        self.assertEqual(refreshed, self.answers[1])
+        self.assertEqual(self._extract("Pickup: Barrie, ON"), self.answers[1])
+        self.assertEqual(len(self.env["premafirm.llm.cache"].search([])), 1)
+
+    def test_answer_past_its_ttl_is_not_served(self):
+        self._extract("Pickup: Barrie, ON")
+        row = self.env["premafirm.llm.cache"].search([])
+        row.cached_at = datetime.utcnow() - timedelta(days=31)
+
+        self.assertEqual(self._extract("Pickup: Barrie, ON"), self.answers[1])
+
+        self.assertEqual(len(self.answers), 2)
+        self.assertEqual(json.loads(row.response), self.answers[1])
+
+    def test_cache_is_admin_only_but_serves_any_dispatcher(self):
+        dispatcher = self.env["res.users"].create(
+            {"name": "Dispatcher", "login": "llm_cache_dispatcher", "groups_id": [(6, 0, [self.env.ref("base.group_user").id])]}
+        )
+        dispatcher_env = self.env(user=dispatcher)
+
+        first = self._extract("Pickup: Barrie, ON", env=dispatcher_env)
+        self.assertEqual(self._extract("Pickup: Barrie, ON", env=dispatcher_env), first)
+
+        self.assertEqual(len(self.answers), 1)
+        with self.assertRaises(AccessError):
+            dispatcher_env["premafirm.llm.cache"].search([])
+        with self.assertRaises(AccessError):
+            dispatcher_env["premafirm.llm.cache"].create({"key": "forged", "model_name": "m", "prompt_version": "1", "response": "{}"})
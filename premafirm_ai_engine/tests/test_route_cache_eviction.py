@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta
+
+from odoo.tests.common import TransactionCase
+
+
+class TestRouteCacheEviction(TransactionCase):
+    def setUp(self):
+        super().setUp()
+        self.Cache = self.env["premafirm.mapbox.cache"]
+        self.Cache.search([]).unlink()
+        self.params = self.env["ir.config_parameter"].sudo()
+        self.params.set_param("premafirm.route_cache_ttl_days", "30")
+        now = datetime.utcnow()
+        self.rows = {}
+        for name, cached_days, hit_days, hits in [
+            ("expired", 60, 45, 9),
+            ("stale_in_use", 60, 1, 1),
+            ("cold", 5, 5, 0),
+            ("hot", 5, 1, 7),
+        ]:
+            row = self.Cache.create(
+                {
+                    "origin": f"gh:{name}",
+                    "destination": "gh:dest",
+                    "waypoint_hash": "",
+                    "distance_km": 10.0,
+                    "duration_minutes": 12.0,
+                    "cached_at": now - timedelta(days=cached_days),
+                }
+            )
+            row.write({"last_hit_at": now - timedelta(days=hit_days), "hit_count": hits})
+            self.rows[name] = row
+
+    def test_stale_rows_still_looked_up_are_kept(self):
+        removed = self.Cache._cron_evict_route_cache()
+
+        self.assertEqual(removed, 1)
+        self.assertEqual(set(self.Cache.search([]).mapped("origin")), {"gh:stale_in_use", "gh:cold", "gh:hot"})
+
+    def test_cache_size_counts_the_compressed_geometry(self):
+        self.env.cr.execute(self.Cache._cache_size_query())
+        rows, size = self.env.cr.fetchone()
+
+        self.rows["hot"].polyline = "_p~iF~ps|U_ulLnnqC_mqNvxq`@" * 50
+        self.env.flush_all()
+        self.env.cr.execute(self.Cache._cache_size_query())
+        geometry = self.env["premafirm.mapbox.cache.geometry"].search([("cache_id", "=", self.rows["hot"].id)])
+
+        self.assertEqual(self.env.cr.fetchone(), (rows, size + len(geometry.data)))
+
+    def test_polyline_round_trips_through_the_compressed_geometry(self):
+        row = self.rows["hot"]
+        row.polyline = "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+        row.invalidate_recordset(["polyline"])
+
+        geometry = self.env["premafirm.mapbox.cache.geometry"].search([("cache_id", "=", row.id)])
+        self.assertTrue(geometry.data)
+        self.assertEqual(row.polyline, "_p~iF~ps|U_ulLnnqC_mqNvxq`@")
+
+        row.unlink()
+        self.assertFalse(geometry.exists())
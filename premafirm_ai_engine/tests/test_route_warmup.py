@@ -0,0 +1,53 @@
+from odoo.tests.common import TransactionCase
+
+from ..services.route_warmup_service import RouteWarmupService
+
+TORONTO = "1 Yonge St, Toronto, ON"
+OTTAWA = "100 Queen St, Ottawa, ON"
+MONTREAL = "5 Rue Principale, Montreal, QC"
+
+
+class TestRouteWarmup(TransactionCase):
+    def setUp(self):
+        super().setUp()
+        Stop = self.env["premafirm.dispatch.stop"].with_context(skip_schedule_recompute=True)
+        for destination in (OTTAWA, OTTAWA, MONTREAL):
+            lead = self.env["crm.lead"].create({"name": "Warm-up Lead", "type": "opportunity"})
+            Stop.create(
+                [
+                    {"lead_id": lead.id, "sequence": 1, "stop_type": "pickup", "address": TORONTO, "latitude": 43.64, "longitude": -79.38},
+                    {"lead_id": lead.id, "sequence": 2, "stop_type": "delivery", "address": destination, "latitude": 45.4, "longitude": -75.7},
+                    # Not geocoded (e.g. the address lookup failed): no lane into it.
+                    {"lead_id": lead.id, "sequence": 3, "stop_type": "delivery", "address": "Somewhere, ON"},
+                ]
+            )
+            # City-level history geocodes to centroids no quote looks up.
+            self.env["premafirm.pricing.history"].create({"lead_id": lead.id, "pickup_city": "Toronto", "delivery_city": "Ottawa"})
+
+    def _warmup(self, budget):
+        self.env["ir.config_parameter"].sudo().set_param("premafirm.route_warmup_api_budget", str(budget))
+        warmup = RouteWarmupService(self.env)
+        mapbox = warmup.map_service
+        geocoded, routed = [], []
+
+        def geocode_many(addresses):
+            geocoded.extend(addresses)
+            return [{"latitude": 45.0, "longitude": -75.0 - len(address) / 10.0, "country_code": "CA"} for address in addresses]
+
+        warmup._geocode_is_fresh = lambda address: False
+        mapbox.geocode_many = geocode_many
+        mapbox._cache_lookup_leg = lambda *key: None
+        mapbox.get_travel_times = routed.extend
+        return warmup, geocoded, routed
+
+    def test_top_lanes_are_geocoded_stop_lanes_ranked_by_frequency(self):
+        lanes = RouteWarmupService(self.env).top_lanes()
+        self.assertEqual(lanes, [(TORONTO, OTTAWA), (TORONTO, MONTREAL)])
+
+    def test_run_spends_at_most_the_api_budget(self):
+        warmup, geocoded, routed = self._warmup(budget=4)
+        stats = warmup.run()
+
+        self.assertEqual(sorted(geocoded), sorted([TORONTO, OTTAWA, MONTREAL]))
+        self.assertEqual([pair[:2] for pair in routed], [(TORONTO, OTTAWA)])
+        self.assertEqual((stats["geocoded"], stats["routed"], stats["skipped"]), (3, 1, 1))
@@ -1,6 +1,10 @@
+from unittest.mock import patch
+
 from odoo import fields
 from odoo.tests.common import TransactionCase
 
+from ..services.crm_dispatch_service import CRMDispatchService
+from ..services.mapbox_service import MapboxService
 from ..services.run_planner_service import RunPlannerService
 
 
@@ -105,3 +109,47 @@ class TestRunPlannerService(TransactionCase):
         self.assertEqual(self.run.end_datetime, fields.Datetime.to_datetime("2026-02-25 12:17:00"))
         self.assertEqual(self.run.calendar_event_id.start, self.run.start_datetime)
         self.assertEqual(self.run.calendar_event_id.stop, self.run.end_datetime)
+
+    def test_new_multi_stop_lead_routes_every_leg_in_the_prefetch_batch(self):
+        self.vehicle.home_location = "Barrie, ON"
+        lead = self.env["crm.lead"].create({"name": "Three Drop Lead", "type": "opportunity", "assigned_vehicle_id": self.vehicle.id})
+        self.env["premafirm.dispatch.stop"].with_context(skip_schedule_recompute=True).create(
+            [
+                {"lead_id": lead.id, "sequence": 1, "stop_type": "pickup", "address": "Vaughan, ON", "pallets": 4, "weight_lbs": 4000.0},
+                {"lead_id": lead.id, "sequence": 2, "stop_type": "delivery", "address": "Oshawa, ON", "pallets": 2, "weight_lbs": 2000.0},
+                {"lead_id": lead.id, "sequence": 3, "stop_type": "delivery", "address": "Kingston, ON", "pallets": 2, "weight_lbs": 2000.0},
+            ]
+        )
+        points = {"Barrie, ON": (-79.69, 44.39), "Vaughan, ON": (-79.51, 43.84), "Oshawa, ON": (-78.86, 43.90), "Kingston, ON": (-76.49, 44.23)}
+        urls = []
+        prefetched = []
+
+        def geocode_many(service, addresses):
+            return [
+                {"latitude": points[address][1], "longitude": points[address][0], "country_code": "CA", "full_address": address}
+                for address in addresses
+            ]
+
+        def safe_get(service, url, timeout=20):
+            urls.append(url)
+            coords = url.split("driving-traffic/", 1)[1].split("?", 1)[0].split(";")
+            return {"routes": [{"legs": [{"distance": 50000.0, "duration": 2700.0} for _coord in coords[1:]]}]}
+
+        resolve_legs = MapboxService.resolve_legs
+
+        def counting_resolve_legs(service, pairs):
+            result = resolve_legs(service, pairs)
+            prefetched.append(len(urls))
+            return result
+
+        with patch.object(MapboxService, "geocode_many", geocode_many), patch.object(MapboxService, "_safe_get", safe_get), patch.object(
+            MapboxService, "resolve_legs", counting_resolve_legs
+        ):
+            CRMDispatchService(self.env)._apply_routes(lead)
+
+        self.assertTrue(lead.dispatch_run_id)
+        self.assertTrue(all(lead.dispatch_stop_ids.mapped("distance_km")))
+        # Scheduling and the run simulation read their legs from the prefetch: the
+        # departures the schedule gave the new stops are within the fallback hours.
+        self.assertEqual(prefetched, [len(urls)])
+        self.assertLessEqual(len(urls), 2)
@@ -0,0 +1,237 @@
+from datetime import datetime
+from unittest.mock import patch
+
+from odoo.exceptions import AccessError
+from odoo.tests.common import TransactionCase
+
+from ..services.mapbox_service import MapboxService
+from ..services.run_planner_service import RunPlannerService
+
+
+class TestScheduleQueue(TransactionCase):
+    def setUp(self):
+        super().setUp()
+        self.lead = self.env["crm.lead"].create({"name": "Queued Lead", "type": "opportunity"})
+        self.calls = []
+        self.incremental = []
+
+    def _counting(self):
+        calls = self.calls
+        incremental = self.incremental
+
+        def _compute_schedule(records, manual_stop=False, changed_stops=False, rerouted_stops=False):
+            if changed_stops:
+                incremental.append((tuple(records.ids), set(changed_stops.ids), set(rerouted_stops.ids)))
+                return
+            calls.append((tuple(records.ids), manual_stop.id if manual_stop else False))
+
+        return patch.object(type(self.env["crm.lead"]), "_compute_schedule", _compute_schedule)
+
+    def _stop_vals(self, stop_type, address):
+        return {"lead_id": self.lead.id, "stop_type": stop_type, "address": address, "pallets": 2, "weight_lbs": 1000.0}
+
+    def test_batch_runs_one_schedule_pass_per_lead(self):
+        with self._counting():
+            with self.lead._batch_schedule():
+                pickup = self.env["premafirm.dispatch.stop"].create(self._stop_vals("pickup", "Barrie, ON"))
+                self.env["premafirm.dispatch.stop"].create(self._stop_vals("delivery", "Toronto, ON"))
+                self.env["premafirm.dispatch.stop"].create(self._stop_vals("delivery", "Oshawa, ON"))
+                pickup.write({"service_duration": 45.0})
+                self.assertEqual(self.calls, [])
+        self.assertEqual(self.calls, [((self.lead.id,), False)])
+
+    def test_queue_flushes_before_stops_are_read(self):
+        with self._counting():
+            stop = self.env["premafirm.dispatch.stop"].create(self._stop_vals("pickup", "Barrie, ON"))
+            stop.write({"address": "Orillia, ON"})
+            self.assertEqual(self.calls, [])
+            stop.read(["estimated_arrival"])
+            self.assertEqual(self.calls, [((self.lead.id,), False)])
+            stop.read(["estimated_arrival"])
+        self.assertEqual(len(self.calls), 1)
+
+    def test_server_code_reading_schedules_flushes_the_queue_first(self):
+        seen = []
+
+        def optimize(planner, lead):
+            seen.append(list(self.calls))
+            return {"feasible": False, "text": "No option", "options": []}
+
+        with self._counting():
+            self.env["premafirm.dispatch.stop"].create(self._stop_vals("pickup", "Barrie, ON"))
+            RunPlannerService(self.env).optimize_insertion_for_lead(self.lead)
+            self.assertEqual(self.calls, [((self.lead.id,), False)])
+
+            self.calls.clear()
+            self.lead.dispatch_stop_ids.write({"sequence": 5})
+            with patch.object(RunPlannerService, "optimize_insertion_for_lead", optimize):
+                self.lead.action_ai_optimize_schedule()
+        self.assertEqual(seen, [[((self.lead.id,), False)]])
+
+    def test_manual_eta_edit_keeps_its_stop_when_flushed(self):
+        with self._counting():
+            stop = self.env["premafirm.dispatch.stop"].create(self._stop_vals("pickup", "Barrie, ON"))
+            stop.write({"estimated_arrival": "2030-01-07 14:00:00"})
+            self.lead._flush_schedule_queue()
+        self.assertEqual(self.calls, [((self.lead.id,), stop.id)])
+
+    def test_manual_eta_after_other_edits_queues_a_full_pass(self):
+        with self._counting():
+            stops = self.env["premafirm.dispatch.stop"].create(
+                [self._stop_vals("pickup", "Barrie, ON"), self._stop_vals("delivery", "Toronto, ON"), self._stop_vals("delivery", "Oshawa, ON")]
+            )
+            self.lead._flush_schedule_queue()
+            self.calls.clear()
+            stops[1].write({"address": "Whitby, ON"})
+            stops[2].write({"estimated_arrival": "2030-01-07 14:00:00"})
+            self.lead._flush_schedule_queue()
+        self.assertEqual(self.incremental, [])
+        self.assertEqual(self.calls, [((self.lead.id,), False)])
+
+    def test_reorder_then_manual_eta_reroutes_the_earlier_legs(self):
+        routed = []
+
+        def get_travel_times(service, pairs):
+            routed.append(list(pairs))
+            return [{"drive_minutes": 60.0, "distance_km": 80.0, "map_url": False} for _pair in pairs]
+
+        with patch.object(MapboxService, "get_travel_times", get_travel_times):
+            stops = self.env["premafirm.dispatch.stop"].create(
+                [
+                    self._stop_vals("pickup", "Barrie, ON"),
+                    self._stop_vals("delivery", "Toronto, ON"),
+                    self._stop_vals("delivery", "Oshawa, ON"),
+                    self._stop_vals("delivery", "Kingston, ON"),
+                ]
+            )
+            for sequence, stop in enumerate(stops, 1):
+                stop.write({"sequence": sequence})
+            self.lead._flush_schedule_queue()
+            routed.clear()
+
+            stops[1].write({"sequence": 3})
+            stops[2].write({"sequence": 2})
+            stops[3].write({"estimated_arrival": "2030-01-07 18:00:00"})
+            self.lead._flush_schedule_queue()
+        # A manual pass would only route never-routed legs, i.e. none here.
+        self.assertEqual(len(routed), 1)
+        self.assertEqual([pair[1] for pair in routed[0]], ["Barrie, ON", "Oshawa, ON", "Toronto, ON", "Kingston, ON"])
+
+
+    def test_incremental_pass_keeps_the_warnings_of_untouched_legs(self):
+        def get_travel_times(service, pairs):
+            return [
+                {"drive_minutes": 60.0, "distance_km": 80.0, "map_url": False, "warning": f"Could not geocode {pair[1]}" if pair[1] == "Oshawa, ON" else False}
+                for pair in pairs
+            ]
+
+        with patch.object(MapboxService, "get_travel_times", get_travel_times):
+            stops = self.env["premafirm.dispatch.stop"].create(
+                [self._stop_vals("pickup", "Barrie, ON"), self._stop_vals("delivery", "Toronto, ON"), self._stop_vals("delivery", "Oshawa, ON")]
+            )
+            for sequence, stop in enumerate(stops, 1):
+                stop.write({"sequence": sequence})
+            self.lead._flush_schedule_queue()
+            self.assertEqual(self.lead.schedule_api_warning, "Could not geocode Oshawa, ON")
+
+            # Re-times from the pickup without looking up any leg.
+            stops[0].write({"service_duration": 50.0})
+            self.lead._flush_schedule_queue()
+            self.assertEqual(self.lead.schedule_api_warning, "Could not geocode Oshawa, ON")
+
+            stops[2].write({"address": "Kingston, ON"})
+            stops[2].write({"sequence": 3})
+            self.lead._flush_schedule_queue()
+        self.assertFalse(self.lead.schedule_api_warning)
+
+    def test_schedule_values_are_stored_in_one_batch(self):
+        with self._counting():
+            stops = self.env["premafirm.dispatch.stop"].create(
+                [self._stop_vals("pickup", "Barrie, ON"), self._stop_vals("delivery", "Toronto, ON")]
+            )
+            self.lead._flush_schedule_queue()
+            self.calls.clear()
+            stops._write_schedule_values(
+                {
+                    stops[0].id: {"estimated_arrival": datetime(2030, 1, 7, 9, 0), "drive_minutes": 90.0, "distance_km": 95.0},
+                    stops[1].id: {"estimated_arrival": datetime(2030, 1, 7, 11, 0), "drive_minutes": 60.0, "distance_km": 70.0},
+                }
+            )
+            self.lead._flush_schedule_queue()
+        self.assertEqual(self.calls, [])
+        self.assertEqual(stops.mapped("estimated_arrival"), [datetime(2030, 1, 7, 9, 0), datetime(2030, 1, 7, 11, 0)])
+        self.assertEqual(stops.mapped("eta_datetime"), stops.mapped("estimated_arrival"))
+        self.assertEqual(stops.mapped("drive_hours"), [1.5, 1.0])
+
+    def test_schedule_values_check_write_access_and_stamp_the_writer(self):
+        stop = self.env["premafirm.dispatch.stop"].create(self._stop_vals("pickup", "Barrie, ON"))
+        portal = self.env["res.users"].create(
+            {"name": "Portal Viewer", "login": "portal_schedule_viewer", "groups_id": [(6, 0, [self.env.ref("base.group_portal").id])]}
+        )
+        with self.assertRaises(AccessError):
+            stop.with_user(portal)._write_schedule_values({stop.id: {"distance_km": 5.0}})
+
+        dispatcher = self.env["res.users"].create(
+            {"name": "Dispatcher", "login": "schedule_dispatcher", "groups_id": [(6, 0, [self.env.ref("base.group_user").id])]}
+        )
+        stop.with_user(dispatcher)._write_schedule_values({stop.id: {"distance_km": 5.0}})
+        self.assertEqual(stop.distance_km, 5.0)
+        self.assertEqual(stop.write_uid, dispatcher)
+
+    def test_stop_edits_queue_an_incremental_pass(self):
+        with self._counting():
+            stops = self.env["premafirm.dispatch.stop"].create(
+                [self._stop_vals("pickup", "Barrie, ON"), self._stop_vals("delivery", "Toronto, ON"), self._stop_vals("delivery", "Oshawa, ON")]
+            )
+            self.lead._flush_schedule_queue()
+            stops[1].write({"service_duration": 60.0})
+            stops[2].write({"address": "Whitby, ON"})
+            self.lead._flush_schedule_queue()
+            stops[0].write({"sequence": 9})
+            self.lead._flush_schedule_queue()
+        self.assertEqual(self.incremental, [((self.lead.id,), {stops[1].id, stops[2].id}, {stops[2].id})])
+        self.assertEqual(self.calls, [((self.lead.id,), False), ((self.lead.id,), False)])
+
+    def test_incremental_pass_reroutes_moved_legs_and_stops_at_stored_etas(self):
+        routed = []
+        written = []
+
+        def get_travel_times(service, pairs):
+            routed.append(list(pairs))
+            return [{"drive_minutes": 60.0, "distance_km": 80.0, "map_url": False} for _pair in pairs]
+
+        def write_schedule_values(stops, updates):
+            written.append(set(updates))
+            return write_orig(stops, updates)
+
+        stop_model = type(self.env["premafirm.dispatch.stop"])
+        write_orig = stop_model._write_schedule_values
+        with patch.object(MapboxService, "get_travel_times", get_travel_times), patch.object(stop_model, "_write_schedule_values", write_schedule_values):
+            stops = self.env["premafirm.dispatch.stop"].create(
+                [
+                    self._stop_vals("pickup", "Barrie, ON"),
+                    self._stop_vals("delivery", "Toronto, ON"),
+                    self._stop_vals("delivery", "Oshawa, ON"),
+                    self._stop_vals("delivery", "Kingston, ON"),
+                ]
+            )
+            self.lead._flush_schedule_queue()
+            self.assertEqual(len(routed[-1]), 4)
+            etas = stops.mapped("estimated_arrival")
+
+            stops[2].write({"address": "Whitby, ON"})
+            self.lead._flush_schedule_queue()
+            self.assertEqual([pair[1] for pair in routed[-1]], ["Whitby, ON", "Kingston, ON"])
+            self.assertEqual(stops.mapped("estimated_arrival"), etas)
+
+            stops[1].write({"service_duration": 90.0})
+            self.lead._flush_schedule_queue()
+            self.assertEqual(written[-1], {stops[1].id, stops[2].id, stops[3].id})
+            self.assertEqual(stops[0].estimated_arrival, etas[0])
+            self.assertGreater(stops[3].estimated_arrival, etas[3])
+
+            routes_before = len(routed)
+            stops[1].write({"service_duration": 90.0})
+            self.lead._flush_schedule_queue()
+        self.assertEqual(len(routed), routes_before)
+        self.assertEqual(written[-1], set())
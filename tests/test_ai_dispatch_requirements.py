@@ -1,5 +1,7 @@
 import importlib.util
+import multiprocessing
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from types import ModuleType, SimpleNamespace
 
@@ -70,11 +72,29 @@ def _install_base_fakes():
     sys.modules["pytz"] = pytz
 
 
+ADDON_PACKAGE = "premafirm_ai_engine"
+
+
+def _install_addon_packages():
+    # Bare addon packages: addon modules resolve their relative imports from disk
+    # without running the Odoo-dependent __init__ files. Modules of earlier loads
+    # are dropped so each load gets fresh siblings bound to the current fakes.
+    for name in [name for name in sys.modules if name.startswith(f"{ADDON_PACKAGE}.")]:
+        del sys.modules[name]
+    for name in (ADDON_PACKAGE, f"{ADDON_PACKAGE}.models", f"{ADDON_PACKAGE}.services"):
+        package = ModuleType(name)
+        package.__path__ = [str(ROOT.joinpath(*name.split(".")))]
+        sys.modules[name] = package
+
+
 def _load_module(name, rel_path):
     _install_base_fakes()
-    spec = importlib.util.spec_from_file_location(name, ROOT / rel_path)
+    _install_addon_packages()
+    path = ROOT / rel_path
+    qualified = f"{ADDON_PACKAGE}.{path.parent.name}.{path.stem}" if path.parent.parent.name == ADDON_PACKAGE else name
+    spec = importlib.util.spec_from_file_location(qualified, path)
     module = importlib.util.module_from_spec(spec)
-    sys.modules[name] = module
+    sys.modules[name] = sys.modules[qualified] = module
     spec.loader.exec_module(module)
     return module
 
@@ -293,6 +313,27 @@ def test_run_insertion_reduces_empty_km():
 
 
 
+def test_simulate_run_reports_finish_times_as_etas_and_window_starts_as_arrivals():
+    run_mod = _load_module("premafirm_ai_engine.services.run_planner_service", "premafirm_ai_engine/services/run_planner_service.py")
+    from datetime import datetime, timedelta
+
+    start = datetime(2026, 2, 18, 8, 0)
+    run = SimpleNamespace(vehicle_id=SimpleNamespace(home_location="Home"), start_datetime=start)
+    planner = run_mod.RunPlannerService(env=None)
+    planner.map_service.calculate_trip_segments = lambda home, stops, return_home=True, depart_at=None: [
+        {"sequence": idx, "distance_km": 60.0, "drive_hours": 1.0} for idx in range(1, len(stops) + 2)
+    ]
+    stops = [
+        SimpleNamespace(address="PU", stop_service_mins=30, cargo_delta=1, stop_type="pickup"),
+        SimpleNamespace(address="DEL", stop_service_mins=45, cargo_delta=-1, stop_type="delivery", time_window_start=start + timedelta(hours=4)),
+    ]
+
+    sim = planner.simulate_run(run, stops)
+
+    assert sim["arrivals"] == [start + timedelta(hours=1), start + timedelta(hours=4)]
+    assert sim["etas"] == [start + timedelta(hours=1, minutes=30), start + timedelta(hours=4, minutes=45)]
+
+
 def test_classification_engine_marks_multistop_as_ltl():
     mod = _load_module("crm_lead_extension_test", "premafirm_ai_engine/models/crm_lead_extension.py")
     lead = mod.CrmLead()
@@ -408,6 +449,253 @@ Total Weight: 9115 lbs
     assert parsed["stops"][0]["load_name"] is None
 
 
+def test_attachment_text_is_parsed_once_per_checksum_and_parser_version(monkeypatch):
+    mod = _load_module("ai_extraction_attachment_cache_test", "premafirm_ai_engine/services/ai_extraction_service.py")
+    from contextlib import contextmanager
+
+    rows = []
+
+    class FakeTextCache:
+        def sudo(self):
+            return self
+
+        def search(self, domain, limit=None):
+            def match(row, field, op, value):
+                return getattr(row, field) in value if op == "in" else getattr(row, field) == value
+
+            return [row for row in rows if all(match(row, *condition) for condition in domain)]
+
+        def create(self, vals):
+            rows.append(SimpleNamespace(**vals))
+
+    class FakeCursor:
+        @contextmanager
+        def savepoint(self):
+            yield
+
+    class FakeEnv(dict):
+        cr = FakeCursor()
+
+    env = FakeEnv({"premafirm.attachment.text": FakeTextCache()})
+    parsed = []
+
+    def service():
+        svc = mod.AIExtractionService(env)
+        svc._parse_attachment_texts = lambda attachments, scan=None: [parsed.append(att.name) or f"text of {att.name}" for att in attachments]
+        return svc
+
+    rate_con = SimpleNamespace(name="RateCon.PDF", checksum="abc123")
+    same_bytes = SimpleNamespace(name="copy.pdf", checksum="abc123")
+    first = service()
+    assert first._extract_attachment_text(rate_con) == "text of RateCon.PDF"
+    assert first._extract_attachment_text(rate_con) == "text of RateCon.PDF"
+    # A second run (new service) and a renamed copy of the same file parse nothing.
+    assert service()._extract_attachment_text(same_bytes) == "text of RateCon.PDF"
+    assert parsed == ["RateCon.PDF"] and len(rows) == 1
+
+    mod.AIExtractionService.ATTACHMENT_PARSER_VERSION = "2"
+    service()._extract_attachment_text(rate_con)
+    assert parsed == ["RateCon.PDF", "RateCon.PDF"] and len(rows) == 2
+
+    # Load scans are cached apart from the full text, per page cap and trailing pages.
+    scans = []
+
+    load_con = SimpleNamespace(name="load.pdf", checksum="def456")
+
+    def scanned(max_pages, trailing_pages, attachment=load_con):
+        svc = service()
+        svc._load_scan = lambda: ("marker", [], max_pages, trailing_pages)
+        svc._parse_attachment_texts = lambda attachments, scan=None: [scans.append(scan[2:]) or "scan" for att in attachments]
+        return svc._extract_attachment_texts([attachment], scan=True)
+
+    assert scanned(40, 2) == scanned(40, 2) == scanned(10, 2) == ["scan"]
+    assert scans == [(40, 2), (10, 2)]
+    assert sorted(row.file_type for row in rows) == ["pdf", "pdf", "pdf:load:10:2", "pdf:load:40:2"]
+    # A PDF whose full text is cached is not scanned: the full text stands in.
+    assert scanned(40, 2, attachment=rate_con) == ["text of RateCon.PDF"]
+    assert scans == [(40, 2), (10, 2)] and len(rows) == 4
+
+    # A full read of a PDF this service scanned only extracts the pages after the scan.
+    reads = []
+
+    def extract_documents(documents, scan=None, resume=None, **kwargs):
+        reads.append((bool(scan), resume))
+        return [("p1\np2", 2)] if scan else ["p1\np2\np3"]
+
+    monkeypatch.setattr(mod.document_text_extractor, "extract_documents", extract_documents)
+    svc = mod.AIExtractionService(env)
+    svc._load_scan = lambda: ("marker", [], 40, 2)
+    svc._extraction_pool_settings = lambda: (1, "spawn", 60.0, 8)
+    terms_con = SimpleNamespace(name="terms.pdf", checksum="fed789", datas=None)
+    assert svc._extract_attachment_texts([terms_con], scan=True) == ["p1\np2"]
+    assert svc._extract_attachment_texts([terms_con]) == ["p1\np2\np3"]
+    assert reads == [(True, [None]), (False, [("p1\np2", 2)])]
+
+
+def test_openai_answers_are_cached_by_prompt_with_forced_refresh(monkeypatch):
+    mod = _load_module("ai_extraction_llm_cache_test", "premafirm_ai_engine/services/ai_extraction_service.py")
+    from contextlib import contextmanager
+
+    class FakeRow(SimpleNamespace):
+        def _record_hits(self):
+            self.hit_count += 1
+
+        def write(self, vals):
+            self.__dict__.update(vals)
+
+    rows = []
+
+    class FakeLlmCache:
+        def sudo(self):
+            return self
+
+        def search(self, domain, limit=None):
+            def match(row, field, op, value):
+                return getattr(row, field) >= value if op == ">=" else getattr(row, field) == value
+
+            return next((row for row in rows if all(match(row, *condition) for condition in domain)), None)
+
+        def create(self, vals):
+            rows.append(FakeRow(hit_count=0, **vals))
+
+    class FakeCursor:
+        @contextmanager
+        def savepoint(self):
+            yield
+
+    class FakeEnv(dict):
+        cr = FakeCursor()
+        context = {}
+
+    params = SimpleNamespace(sudo=lambda: params, get_param=lambda key, default=None: default)
+    env = FakeEnv({"premafirm.llm.cache": FakeLlmCache(), "ir.config_parameter": params})
+    posted = []
+
+    def post(url, headers=None, json=None, timeout=None):
+        posted.append(json["input"][1]["content"])
+        answer = '{"stops": [{"stop_type": "pickup", "address": "Barrie, ON"}]}'
+        return SimpleNamespace(raise_for_status=lambda: None, json=lambda: {"output": [{"content": [{"type": "output_text", "text": answer}]}]})
+
+    monkeypatch.setattr(mod.requests, "post", post)
+    svc = mod.AIExtractionService(env)
+    svc._get_openai_key = lambda: "sk-test"
+    stats = mod.AIExtractionService.llm_cache_stats()
+
+    first = svc._openai_extract("Pickup: Barrie, ON", "email")
+    first["stops"].append("mutated by the caller")
+    assert svc._openai_extract("Pickup: Barrie, ON", "email") == {"stops": [{"stop_type": "pickup", "address": "Barrie, ON"}]}
+    assert len(posted) == 1 and rows[0].hit_count == 1 and len(rows[0].key) == 64
+    svc._openai_extract("Pickup: Barrie, ON", "attachment text")
+    assert len(posted) == 2 and len(rows) == 2
+
+    FakeEnv.context = {mod.LLM_CACHE_REFRESH_KEY: True}
+    svc._openai_extract("Pickup: Barrie, ON", "email")
+    assert len(posted) == 3 and len(rows) == 2
+    FakeEnv.context = {}
+
+    monkeypatch.setattr(mod.AIExtractionService, "OPENAI_PROMPT_VERSION", "2")
+    svc._openai_extract("Pickup: Barrie, ON", "email")
+    assert len(posted) == 4 and len(rows) == 3
+    after = mod.AIExtractionService.llm_cache_stats()
+    assert {key: after[key] - stats[key] for key in after} == {"hits": 1, "misses": 3, "refreshes": 1}
+
+
+def test_attachments_are_extracted_together_with_pdf_page_ranges_in_order(monkeypatch):
+    mod = _load_module("document_text_extractor", "premafirm_ai_engine/services/document_text_extractor.py")
+
+    class FakeReader:
+        def __init__(self, stream):
+            self.pages = [None] * int(stream.getvalue().split(b":")[1])
+
+    class FakePdf:
+        def __init__(self, stream, pages=None):
+            name, count = stream.getvalue().decode().split(":")
+            numbers = pages or range(1, int(count) + 1)
+            self.pages = [SimpleNamespace(extract_text=lambda n=n: f"{name} p{n}") for n in numbers]
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+    monkeypatch.setattr(mod, "PdfReader", FakeReader)
+    monkeypatch.setattr(mod, "pdfplumber", SimpleNamespace(open=FakePdf))
+
+    documents = [("pdf", b"long:20"), ("pdf", b"short:2"), ("doc", b"legacy")]
+    assert [task[2:] for task in mod.split_tasks("pdf", b"long:20", pages_per_task=8)] == [(0, 8), (8, 16), (16, 20)]
+    expected = ["\n".join(f"long p{n}" for n in range(1, 21)), "short p1\nshort p2", ""]
+    assert mod.extract_documents(documents, pages_per_task=8) == expected
+    # Resuming after a 5-page load scan extracts pages 6-20 only; a scan that read every page extracts nothing.
+    scanned = ("\n".join(f"long p{n}" for n in range(1, 6)), 5)
+    assert [task[2:] for task in mod.split_tasks("pdf", b"long:20", pages_per_task=8, first_page=5)] == [(5, 13), (13, 20)]
+    assert mod.extract_documents(documents, pages_per_task=8, resume=[scanned, None, None]) == expected
+    assert mod.extract_documents([("pdf", b"short:2")], resume=[("short p1\nshort p2", 2)]) == ["short p1\nshort p2"]
+    # fork here only so the workers inherit the fake readers; the addon's own pool is forkserver.
+    with ProcessPoolExecutor(max_workers=3, mp_context=multiprocessing.get_context("fork")) as executor:
+        assert mod.extract_documents(documents, executor=executor, pages_per_task=8) == expected
+        assert mod.extract_documents(documents, executor=executor, pages_per_task=8) == expected
+        assert not executor._broken
+
+
+def test_load_scan_stops_reading_pdf_pages_after_the_last_complete_load(monkeypatch):
+    extractor = _load_module("document_text_extractor", "premafirm_ai_engine/services/document_text_extractor.py")
+    svc = _load_module("ai_extraction_scan_test", "premafirm_ai_engine/services/ai_extraction_service.py").AIExtractionService(None)
+    terms = "Terms and conditions apply to every shipment. " * 10
+    page_texts = [
+        "LOAD #1\nPickup Address: 55 Commerce Park Dr, Barrie, ON\nDelivery Address: 6350 Tomken Rd, Mississauga, ON\n" + terms,
+        "LOAD #2\nPickup Address: 1 Yonge St, Toronto, ON\n" + terms,
+        "",
+    ] + [terms] * 30
+    read = []
+
+    class FakePage:
+        def __init__(self, number):
+            self.number = number
+
+        def extract_text(self):
+            read.append(self.number)
+            return page_texts[self.number]
+
+    class FakePlumberPage:
+        def extract_text(self):
+            return "Delivery Address: 200 Bay St, Toronto, ON"
+
+        def close(self):
+            pass
+
+    plumber = SimpleNamespace(pages=[FakePlumberPage() for _ in page_texts], close=lambda: None)
+    monkeypatch.setattr(extractor, "PdfReader", lambda stream: SimpleNamespace(pages=[FakePage(n) for n in range(len(page_texts))]))
+    monkeypatch.setattr(extractor, "pdfplumber", SimpleNamespace(open=lambda stream: plumber))
+
+    grammar = _load_module("load_grammar", "premafirm_ai_engine/services/load_grammar.py")
+    required = [grammar.labeled_value_patterns(grammar.PICKUP_LABELS), grammar.labeled_value_patterns(grammar.DELIVERY_LABELS)]
+    text = extractor.scan_text(("pdf", b"%PDF", (grammar.LOAD_MARKER_PATTERN, required, 40, 2)))
+    # Load #2 is completed by the sparse third page (re-read with pdfplumber), then two pages of terms.
+    assert read == [0, 1, 2, 3, 4]
+    parsed = svc._parse_load_sections(text)
+    assert [stop["address"] for stop in parsed["stops"]][-1] == "200 Bay St, Toronto, ON"
+
+    read.clear()
+    page_texts[0] = "LOAD #1\nPickup Address: 55 Commerce Park Dr, Barrie, ON\n" + terms
+    extractor.scan_text(("pdf", b"%PDF", (grammar.LOAD_MARKER_PATTERN, required[:1] + [[r"Missing\s*Label"]], 10, 2)))
+    assert read == list(range(10))
+
+
+def test_load_grammar_matches_the_per_call_regexes_on_sample_broker_texts():
+    bench = _load_module("benchmark_load_grammar", "tools/benchmark_load_grammar.py")
+    grammar = bench.load_grammar()
+    assert bench.mismatches(grammar, bench.SAMPLES + bench.fuzz_samples(300)) == []
+
+    sections, terms = bench.grammar_parse(grammar, bench.SAMPLES[2])
+    assert [label for label, _fields in sections] == ["LOAD #1", "LOAD #2"]
+    assert sections[1][1]["pickup"] == "88 Bay St, Hamilton, ON"
+    assert sections[1][1]["delivery"] == "9 Rue Principale, Montreal, QC"
+    # Last matches win, as before: the TONU "$" amount and the "LOAD #2" marker.
+    assert (terms["rate"], terms["load_number"], terms["customer_po"]) == ("250", "2", "4500123")
+    assert terms["tonu"] and terms["pump_truck"] and terms["detention"]
+
+
 def test_crm_load_info_grid_keeps_single_load_column_editable():
     view_text = (ROOT / "premafirm_ai_engine/views/crm_view.xml").read_text()
     assert 'name="load_id" string="Load #"' in view_text
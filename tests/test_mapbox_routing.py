@@ -0,0 +1,722 @@
+import importlib.util
+import sys
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from types import ModuleType, SimpleNamespace
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def _install_base_fakes():
+    req = ModuleType("requests")
+    req.get = lambda *a, **k: SimpleNamespace(raise_for_status=lambda: None, json=lambda: {})
+    req.exceptions = SimpleNamespace(HTTPError=Exception)
+    sys.modules["requests"] = req
+
+    psycopg2 = ModuleType("psycopg2")
+    psycopg2.IntegrityError = Exception
+    sys.modules["psycopg2"] = psycopg2
+
+
+ADDON_PACKAGE = "premafirm_ai_engine"
+
+
+def _install_addon_packages():
+    # Bare addon packages: addon modules resolve their relative imports from disk
+    # without running the Odoo-dependent __init__ files. Modules of earlier loads
+    # are dropped so each load gets fresh siblings bound to the current fakes.
+    for name in [name for name in sys.modules if name.startswith(f"{ADDON_PACKAGE}.")]:
+        del sys.modules[name]
+    for name in (ADDON_PACKAGE, f"{ADDON_PACKAGE}.models", f"{ADDON_PACKAGE}.services"):
+        package = ModuleType(name)
+        package.__path__ = [str(ROOT.joinpath(*name.split(".")))]
+        sys.modules[name] = package
+
+
+def _load_module(name, rel_path):
+    _install_base_fakes()
+    _install_addon_packages()
+    path = ROOT / rel_path
+    qualified = f"{ADDON_PACKAGE}.{path.parent.name}.{path.stem}" if path.parent.parent.name == ADDON_PACKAGE else name
+    spec = importlib.util.spec_from_file_location(qualified, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = sys.modules[qualified] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+class FakeConfig:
+    def __init__(self, values=None):
+        self.values = values or {}
+
+    def sudo(self):
+        return self
+
+    def get_param(self, key, default=None):
+        return self.values.get(key, "k" if key == "mapbox.access_token" else default)
+
+
+COORDS = {
+    "Home": (-79.70, 43.60),
+    "A": (-79.40, 43.70),
+    "B": (-79.60, 44.30),
+    "C": (-75.70, 45.40),
+}
+
+
+def _fake_geocode(address):
+    lon, lat = COORDS[address]
+    return {"latitude": lat, "longitude": lon, "country_code": "CA", "full_address": address}
+
+
+def test_trip_segments_chain_mode_uses_one_directions_call():
+    mod = _load_module("mapbox_service_chain_test", "premafirm_ai_engine/services/mapbox_service.py")
+    svc = mod.MapboxService({"ir.config_parameter": FakeConfig()})
+    geocoded = []
+    urls = []
+
+    def fake_geocode(address):
+        geocoded.append(address)
+        return _fake_geocode(address)
+
+    def fake_safe_get(url, timeout=20):
+        urls.append(url)
+        coords = url.split("driving-traffic/", 1)[1].split("?", 1)[0].split(";")
+        legs = [{"distance": 1000.0 * (idx + 1), "duration": 600.0 * (idx + 1)} for idx in range(len(coords) - 1)]
+        return {"routes": [{"legs": legs}]}
+
+    svc.geocode_many = lambda addresses: [fake_geocode(address) for address in addresses]
+    svc._safe_get = fake_safe_get
+    stops = [SimpleNamespace(address="A"), SimpleNamespace(address="B"), SimpleNamespace(address="C")]
+
+    segments = svc.calculate_trip_segments("Home", stops, return_home=True)
+
+    assert len(urls) == 1
+    assert sorted(geocoded) == ["A", "B", "C", "Home"]
+    assert [seg["distance_km"] for seg in segments] == [1.0, 2.0, 3.0, 4.0]
+    assert segments[1]["drive_hours"] == 20.0 / 60.0
+    assert segments[-1]["from"] == "C" and segments[-1]["to"] == "Home"
+
+
+def test_leg_resolver_shares_resolved_legs_across_services_of_a_transaction():
+    mod = _load_module("mapbox_service_leg_resolver_test", "premafirm_ai_engine/services/mapbox_service.py")
+
+    class FakeCursor:
+        dbname = "leg_resolver_test_db"
+        precommit = SimpleNamespace(data={})
+
+    class FakeEnv(dict):
+        cr = FakeCursor()
+        uid = 2
+
+    env = FakeEnv({"ir.config_parameter": FakeConfig()})
+    urls = []
+    lookups = []
+
+    def fake_safe_get(url, timeout=20):
+        urls.append(url)
+        coords = url.split("driving-traffic/", 1)[1].split("?", 1)[0].split(";")
+        return {"routes": [{"legs": [{"distance": 1000.0, "duration": 60.0} for _ in coords[1:]]}]}
+
+    def service():
+        svc = mod.MapboxService(env)
+        svc.geocode_many = lambda addresses: [_fake_geocode(address) for address in addresses]
+        svc._safe_get = fake_safe_get
+        lookup = svc._cache_lookup
+        svc._cache_lookup = lambda *key: lookups.append(key) or lookup(*key)
+        return svc
+
+    travels = service().resolve_legs([("Home", "A"), ("A", "B"), ("C", "Home")])
+    assert len(urls) == 2 and len(lookups) == 3
+    assert [travel["distance_km"] for travel in travels] == [1.0, 1.0, 1.0]
+
+    stops = [SimpleNamespace(address="A"), SimpleNamespace(address="B")]
+    scheduler, planner = service(), service()
+    scheduler.get_travel_times([("Home", "A"), ("A", "B")])
+    segments = planner.calculate_trip_segments("Home", stops + [SimpleNamespace(address="C")], return_home=True)
+
+    # Only B->C is new to the transaction.
+    keys = planner._route_keys({address: _fake_geocode(address) for address in ("B", "C")})
+    assert len(urls) == 3 and [key[:2] for key in lookups[3:]] == [(keys["B"], keys["C"])]
+    assert [seg["to"] for seg in segments] == ["A", "B", "C", "Home"]
+    assert scheduler.leg_resolver() is planner.leg_resolver()
+
+
+def test_leg_resolver_answers_later_departures_from_legs_prefetched_at_leave_yard():
+    mod = _load_module("mapbox_service_leg_bucket_test", "premafirm_ai_engine/services/mapbox_service.py")
+
+    class FakeCursor:
+        dbname = "leg_bucket_test_db"
+        precommit = SimpleNamespace(data={})
+
+    class FakeEnv(dict):
+        cr = FakeCursor()
+        uid = 2
+
+    svc = mod.MapboxService(FakeEnv({"ir.config_parameter": FakeConfig()}))
+    urls = []
+
+    def fake_safe_get(url, timeout=20):
+        urls.append(url)
+        coords = url.split("driving-traffic/", 1)[1].split("?", 1)[0].split(";")
+        return {"routes": [{"legs": [{"distance": 1000.0, "duration": 60.0} for _ in coords[1:]]}]}
+
+    svc.geocode_many = lambda addresses: [_fake_geocode(address) for address in addresses]
+    svc._safe_get = fake_safe_get
+    leave_yard = datetime(2030, 1, 7, 12, 0)
+    stops = [SimpleNamespace(address=name) for name in ("A", "B", "C")]
+
+    # New stops have no schedule yet: every prefetched leg departs at leave-yard time.
+    prefetch = list(zip(["Home", "A", "B"], ["A", "B", "C"], svc.leg_departures(leave_yard, stops)))
+    assert len({svc.departure_hour(pair[2]) for pair in prefetch}) == 1
+    svc.resolve_legs(prefetch)
+    requests = len(urls)
+
+    # The schedule then asks for the same legs at the departures it computed.
+    scheduled = [(origin, destination, leave_yard + mod.timedelta(hours=idx)) for idx, (origin, destination, _dep) in enumerate(prefetch)]
+    travels = svc.get_travel_times(scheduled)
+    segments = svc.calculate_trip_segments("Home", stops, return_home=False, depart_at=leave_yard + mod.timedelta(hours=1))
+
+    assert len(urls) == requests == 1
+    assert [travel["distance_km"] for travel in travels] == [1.0, 1.0, 1.0]
+    assert [seg["distance_km"] for seg in segments] == [1.0, 1.0, 1.0]
+
+    # Past premafirm.route_departure_fallback_hours (3) a held leg is a miss, as in the route cache.
+    svc.get_travel_times([("Home", "A", leave_yard + mod.timedelta(hours=5))])
+    assert len(urls) == 2
+
+
+def test_timed_legs_use_departure_buckets_and_fall_back_to_the_nearest_one():
+    mod = _load_module("mapbox_service_departure_bucket_test", "premafirm_ai_engine/services/mapbox_service.py")
+    searches = []
+
+    class FakeRouteCacheModel:
+        def search(self, domain, limit=None):
+            searches.append(domain)
+            if any(term[0] == "departure_hour" for term in domain):
+                return None
+            return [
+                SimpleNamespace(departure_hour=0, distance_km=50.0, duration_minutes=40.0, polyline=""),
+                SimpleNamespace(departure_hour=10, distance_km=55.0, duration_minutes=70.0, polyline=""),
+                SimpleNamespace(departure_hour=100, distance_km=52.0, duration_minutes=45.0, polyline=""),
+            ]
+
+    config = FakeConfig({"premafirm.route_departure_bucket_hours": "3", "premafirm.route_departure_fallback_hours": "0"})
+    env = {"ir.config_parameter": config, "premafirm.mapbox.cache": FakeRouteCacheModel()}
+    svc = mod.MapboxService(env)
+    urls = []
+    svc.geocode_many = lambda addresses: [_fake_geocode(address) for address in addresses]
+    svc._safe_get = lambda url, timeout=20: urls.append(url) or {}
+    # Monday 12:00 UTC is 07:00 in Toronto: hour 7 of the week, in the 3-hour bucket starting at hour 6.
+    monday_morning = datetime(2030, 1, 7, 12, 0)
+
+    assert svc.departure_hour(monday_morning) == 7
+    assert svc.departure_hour(None) == 0
+
+    segments = svc.calculate_trip_segments("Home", [SimpleNamespace(address="A")], return_home=False, depart_at=monday_morning)
+
+    assert urls and all("depart_at=" in url and "T12:00:00Z" in url for url in urls)
+    assert ("departure_hour", "=", 7) in searches[0]
+    # Mapbox returned nothing for this bucket, so the closest populated one (hour 10) is used.
+    assert segments[0]["distance_km"] == 55.0 and segments[0]["duration_minutes"] == 70.0
+
+
+def test_cached_lane_answers_a_lookup_an_hour_later_without_http():
+    mod = _load_module("mapbox_service_nearest_bucket_test", "premafirm_ai_engine/services/mapbox_service.py")
+
+    class FakeRouteCacheModel:
+        def search(self, domain, limit=None):
+            if ("departure_hour", "=", 9) in domain:
+                return [SimpleNamespace(departure_hour=9, distance_km=95.0, duration_minutes=80.0)]
+            if any(term[0] == "departure_hour" for term in domain):
+                return []
+            return [SimpleNamespace(departure_hour=9, distance_km=95.0, duration_minutes=80.0)]
+
+    svc = mod.MapboxService({"ir.config_parameter": FakeConfig(), "premafirm.mapbox.cache": FakeRouteCacheModel()})
+    urls = []
+    svc.geocode_many = lambda addresses: [_fake_geocode(address) for address in addresses]
+    svc._safe_get = lambda url, timeout=20: urls.append(url) or {}
+    # Monday 13:00 / 14:00 UTC are 08:00 / 09:00 in Toronto.
+    assert svc.departure_hour(datetime(2030, 1, 7, 13, 0)) == 9
+
+    travels = svc.get_travel_times([("Home", "A", datetime(2030, 1, 7, 14, 0))])
+
+    assert urls == []
+    assert travels[0]["distance_km"] == 95.0 and travels[0]["drive_minutes"] == 80.0
+
+
+def test_trip_segments_chain_mode_chunks_long_runs():
+    mod = _load_module("mapbox_service_chunk_test", "premafirm_ai_engine/services/mapbox_service.py")
+    svc = mod.MapboxService({"ir.config_parameter": FakeConfig()})
+    svc.MAX_DIRECTIONS_WAYPOINTS = 3
+    requested = []
+
+    def fake_safe_get(url, timeout=20):
+        coords = url.split("driving-traffic/", 1)[1].split("?", 1)[0].split(";")
+        requested.append(len(coords))
+        return {"routes": [{"legs": [{"distance": 1000.0, "duration": 60.0} for _ in coords[1:]]}]}
+
+    svc.geocode_many = lambda addresses: [_fake_geocode(address) for address in addresses]
+    svc._safe_get = fake_safe_get
+    stops = [SimpleNamespace(address=name) for name in ("A", "B", "C", "A")]
+
+    segments = svc.calculate_trip_segments("Home", stops, return_home=False)
+
+    assert requested == [3, 3]
+    assert len(segments) == 4
+    assert all(seg["distance_km"] == 1.0 for seg in segments)
+
+
+def test_trip_segments_chain_mode_flags_unroutable_stop_without_dropping_others():
+    mod = _load_module("mapbox_service_chain_warning_test", "premafirm_ai_engine/services/mapbox_service.py")
+    svc = mod.MapboxService({"ir.config_parameter": FakeConfig()})
+
+    def fake_geocode(address):
+        if address == "Paris":
+            return {"latitude": 48.85, "longitude": 2.35, "country_code": "FR", "full_address": address}
+        return _fake_geocode(address)
+
+    def fake_safe_get(url, timeout=20):
+        coords = url.split("driving-traffic/", 1)[1].split("?", 1)[0].split(";")
+        return {"routes": [{"legs": [{"distance": 5000.0, "duration": 300.0} for _ in coords[1:]]}]}
+
+    svc.geocode_many = lambda addresses: [fake_geocode(address) for address in addresses]
+    svc._safe_get = fake_safe_get
+    stops = [SimpleNamespace(address="A"), SimpleNamespace(address="Paris"), SimpleNamespace(address="B")]
+
+    segments = svc.calculate_trip_segments("Home", stops, return_home=False)
+
+    assert segments[0]["distance_km"] == 5.0
+    assert segments[1]["distance_km"] == 0.0 and "USA/Canada" in segments[1]["warning"]
+    assert segments[2]["distance_km"] == 0.0 and "USA/Canada" in segments[2]["warning"]
+
+
+def test_geocode_address_is_served_from_memory_cache_on_repeat():
+    mod = _load_module("mapbox_service_geocode_cache_test", "premafirm_ai_engine/services/mapbox_service.py")
+    svc = mod.MapboxService({"ir.config_parameter": FakeConfig()})
+    calls = []
+
+    def fake_safe_get(url, timeout=20):
+        calls.append(url)
+        return {
+            "features": [
+                {
+                    "place_name": "5585 McAdam Rd, Mississauga, Ontario L4Z 1N4, Canada",
+                    "center": [-79.66, 43.61],
+                    "text": "McAdam Rd",
+                    "place_type": ["address"],
+                    "context": [
+                        {"id": "place.1", "text": "Mississauga"},
+                        {"id": "region.1", "short_code": "ca-on", "text": "Ontario"},
+                        {"id": "country.1", "short_code": "ca", "text": "Canada"},
+                    ],
+                }
+            ]
+        }
+
+    svc._safe_get = fake_safe_get
+    first = svc.geocode_address("5585 McAdam Rd, Mississauga, ON")
+    second = mod.MapboxService({"ir.config_parameter": FakeConfig()})
+    second._safe_get = fake_safe_get
+    repeat = second.geocode_address("  5585 mcadam rd,  Mississauga, ON ")
+
+    assert len(calls) == 1
+    assert repeat["short_address"] == first["short_address"] == "Mississauga, ON"
+    assert repeat["place_categories"] == ["address"]
+
+
+def test_lru_cache_evicts_least_recently_used_and_counts_hits():
+    mod = _load_module("lru_cache_test", "premafirm_ai_engine/services/lru_cache.py")
+    cache = mod.LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["size"]) == (2, 1, 2)
+
+
+def test_route_cache_lookup_is_served_from_lru_until_invalidated():
+    mod = _load_module("mapbox_service_route_lru_test", "premafirm_ai_engine/services/mapbox_service.py")
+    searches = []
+
+    class FakeRouteCacheModel:
+        def search(self, domain, limit=None):
+            searches.append(domain)
+            return SimpleNamespace(distance_km=12.5, duration_minutes=15.0, polyline="")
+
+    env = {"ir.config_parameter": FakeConfig(), "premafirm.mapbox.cache": FakeRouteCacheModel()}
+    first = mod.MapboxService(env)._cache_lookup("a", "b")
+    second = mod.MapboxService(env)._cache_lookup("a", "b")
+
+    assert first == second and second["distance_km"] == 12.5
+    assert len(searches) == 1
+    assert mod.MapboxService.route_cache_stats()["hits"] == 1
+
+    mod.MapboxService.invalidate_route_cache("", [("a", "b", "", 0)])
+    mod.MapboxService(env)._cache_lookup("a", "b")
+    assert len(searches) == 2
+
+
+def test_trip_segments_store_every_new_leg_in_one_upsert():
+    mod = _load_module("mapbox_service_upsert_test", "premafirm_ai_engine/services/mapbox_service.py")
+    executed = []
+
+    class FakeCursor:
+        dbname = "upsert_test_db"
+
+        @contextmanager
+        def savepoint(self):
+            yield
+
+        def execute(self, query, params=None):
+            executed.append((query, list(params or [])))
+
+    class FakeRouteCacheModel:
+        _table = "premafirm_mapbox_cache"
+
+        def search(self, domain, limit=None):
+            return None
+
+        def flush_model(self):
+            pass
+
+        def invalidate_model(self):
+            pass
+
+    class FakeEnv(dict):
+        cr = FakeCursor()
+        uid = 2
+
+    env = FakeEnv({"ir.config_parameter": FakeConfig(), "premafirm.mapbox.cache": FakeRouteCacheModel()})
+    svc = mod.MapboxService(env)
+
+    def fake_safe_get(url, timeout=20):
+        coords = url.split("driving-traffic/", 1)[1].split("?", 1)[0].split(";")
+        return {"routes": [{"legs": [{"distance": 1000.0, "duration": 60.0} for _ in coords[1:]]}]}
+
+    svc.geocode_many = lambda addresses: [_fake_geocode(address) for address in addresses]
+    svc._safe_get = fake_safe_get
+    stops = [SimpleNamespace(address="A"), SimpleNamespace(address="B"), SimpleNamespace(address="A")]
+
+    svc.calculate_trip_segments("Home", stops, return_home=True)
+
+    assert len(executed) == 1
+    query, params = executed[0]
+    assert "ON CONFLICT (origin, destination, waypoint_hash, departure_hour) DO UPDATE" in query
+    # Home->A, A->B, B->A and A->Home are four distinct lanes, each written once with no waypoint hash.
+    assert len(params) == 4 * 12
+    assert params[2::12] == ["", "", "", ""]
+
+
+def test_route_cache_keys_snap_nearby_points_to_one_geohash_cell():
+    geo = _load_module("geo_utils_test", "premafirm_ai_engine/services/geo_utils.py")
+    assert geo.geohash_encode(57.64911, 10.40744, 11) == "u4pruydqqvj"
+    assert geo.canonical_address("5585 McAdam Road Mississauga Ontario, Canada") == geo.canonical_address("5585 McAdam Rd, Mississauga, ON")
+
+    mod = _load_module("mapbox_service_geohash_test", "premafirm_ai_engine/services/mapbox_service.py")
+    svc = mod.MapboxService({"ir.config_parameter": FakeConfig()})
+    point = {"latitude": 43.6505, "longitude": -79.7003, "country_code": "CA"}
+    keys = svc._route_keys(
+        {
+            "Dock 1": point,
+            "Dock 2": dict(point, latitude=43.6508),
+            "Across town": dict(point, latitude=43.7500),
+            "Nowhere Rd": {"warning": "Could not geocode"},
+        }
+    )
+    assert keys["Dock 1"] == keys["Dock 2"] != keys["Across town"]
+    assert keys["Dock 1"].startswith("gh:") and len(keys["Dock 1"]) == 3 + 7
+    assert keys["Nowhere Rd"] == "nowhere rd"
+
+    coarse = mod.MapboxService({"ir.config_parameter": FakeConfig({"premafirm.route_cache_geohash_precision": "0"})})
+    assert coarse._route_keys({"Dock 1": point}) == {"Dock 1": "dock 1"}
+
+
+def test_estimate_mode_answers_legs_offline_from_the_fitted_route_cache():
+    geo = _load_module("geo_utils_estimator_test", "premafirm_ai_engine/services/geo_utils.py")
+    mod = _load_module("mapbox_service_estimate_test", "premafirm_ai_engine/services/mapbox_service.py")
+    points = [geo.geohash_encode(43.55 + 0.1 * idx, -79.75 + 0.08 * idx, 7) for idx in range(6)]
+    rows = []
+    for origin in points:
+        for destination in points:
+            if origin != destination:
+                road_km = 1.5 * geo.haversine_km(*geo.geohash_decode(origin), *geo.geohash_decode(destination))
+                rows.append(("gh:" + origin, "gh:" + destination, road_km, road_km / 90.0 * 60.0))
+    executed = []
+
+    class FakeCursor:
+        dbname = "estimate_test_db"
+
+        @contextmanager
+        def savepoint(self):
+            yield
+
+        def execute(self, query, params=None):
+            executed.append(query)
+
+        def fetchall(self):
+            return rows
+
+    class FakeRouteCacheModel:
+        _table = "premafirm_mapbox_cache"
+
+        def search(self, domain, limit=None):
+            return None
+
+        def flush_model(self):
+            pass
+
+        def invalidate_model(self):
+            pass
+
+    class FakeEnv(dict):
+        cr = FakeCursor()
+        uid = 2
+        context = {"route_estimate_mode": True}
+
+    def no_network(url, timeout=20):
+        raise AssertionError("estimate mode must not call Mapbox")
+
+    svc = mod.MapboxService(FakeEnv({"ir.config_parameter": FakeConfig(), "premafirm.mapbox.cache": FakeRouteCacheModel()}))
+    svc.geocode_many = lambda addresses: [_fake_geocode(address) for address in addresses]
+    svc._safe_get = no_network
+    stops = [SimpleNamespace(address="A"), SimpleNamespace(address="C")]
+
+    segments = svc.calculate_trip_segments("Home", stops, return_home=False)
+
+    crow_km = svc._haversine_km(43.60, -79.70, 43.70, -79.40)
+    assert round(segments[0]["distance_km"], 6) == round(1.5 * crow_km, 6)
+    assert round(segments[0]["drive_hours"], 6) == round(1.5 * crow_km / 90.0, 6)
+    assert segments[0]["warning"] is False and segments[1]["distance_km"] > 0.0
+    assert svc.estimate_route(_fake_geocode("Home"), _fake_geocode("A"))["confidence"] == "high"
+    assert svc.estimate_route(_fake_geocode("A"), _fake_geocode("C"))["confidence"] == "medium"
+    # One fit query, and estimates are never written to the route cache.
+    assert len(executed) == 1 and executed[0].startswith("SELECT")
+
+
+def test_unavailable_routing_falls_back_to_an_uncached_offline_estimate():
+    mod = _load_module("mapbox_service_estimate_fallback_test", "premafirm_ai_engine/services/mapbox_service.py")
+    svc = mod.MapboxService({"ir.config_parameter": FakeConfig()})
+    stored = []
+    svc.geocode_many = lambda addresses: [_fake_geocode(address) for address in addresses]
+    svc._safe_get = lambda url, timeout=20: None
+    svc.cache_store_many = stored.extend
+
+    travel = svc.get_travel_time("Home", "A")
+
+    crow_km = svc._haversine_km(43.60, -79.70, 43.70, -79.40)
+    assert round(travel["distance_km"], 6) == round(1.3 * crow_km, 6)
+    assert travel["confidence"] == "low" and travel["warning"].startswith("Routing unavailable; used offline estimate")
+    assert stored == []
+
+
+def test_polylines_are_stored_compressed_apart_from_the_scalar_row():
+    geo = _load_module("geo_utils_polyline_test", "premafirm_ai_engine/services/geo_utils.py")
+    polyline = "_p~iF~ps|U_ulLnnqC_mqNvxq`@" * 40
+    packed = geo.pack_polyline(polyline)
+    assert geo.unpack_polyline(packed) == polyline and len(packed) < len(polyline)
+
+    mod = _load_module("mapbox_service_geometry_test", "premafirm_ai_engine/services/mapbox_service.py")
+    executed = []
+
+    class FakeCursor:
+        dbname = "geometry_test_db"
+
+        @contextmanager
+        def savepoint(self):
+            yield
+
+        def execute(self, query, params=None):
+            executed.append((query, list(params or [])))
+
+    class FakeModel:
+        def __init__(self, table):
+            self._table = table
+
+        def flush_model(self):
+            pass
+
+        def invalidate_model(self):
+            pass
+
+    class FakeEnv(dict):
+        cr = FakeCursor()
+        uid = 2
+
+    svc = mod.MapboxService(
+        FakeEnv(
+            {
+                "ir.config_parameter": FakeConfig(),
+                "premafirm.mapbox.cache": FakeModel("premafirm_mapbox_cache"),
+                "premafirm.mapbox.cache.geometry": FakeModel("premafirm_mapbox_cache_geometry"),
+            }
+        )
+    )
+
+    svc.cache_store_many([svc._cache_entry("gh:a", "gh:b", 10.0, 12.0), svc._cache_entry("gh:b", "gh:c", 5.0, 6.0, polyline=polyline)])
+
+    (row_query, row_params), (geometry_query, geometry_params) = executed
+    assert "polyline" not in row_query and polyline not in row_params
+    assert 'INSERT INTO "premafirm_mapbox_cache_geometry"' in geometry_query
+    assert geometry_params[4:8] == ["gh:b", "gh:c", "", 0] and geo.unpack_polyline(geometry_params[8]) == polyline
+
+
+def test_bucket_departure_lands_in_the_requested_bucket():
+    mod = _load_module("mapbox_service_bucket_departure_test", "premafirm_ai_engine/services/mapbox_service.py")
+    svc = mod.MapboxService({"ir.config_parameter": FakeConfig()})
+    now = datetime(2030, 1, 9, 15, 30, tzinfo=mod.timezone.utc)
+
+    for departure_hour in (1, 9, 100, 168):
+        departure = svc.bucket_departure(departure_hour, now=now)
+        assert svc.departure_hour(departure) == departure_hour
+        assert now.replace(tzinfo=None) <= departure <= now.replace(tzinfo=None) + mod.timedelta(weeks=1)
+    assert svc.bucket_departure(0) is None
+
+
+def test_http_client_single_flights_identical_requests_and_keeps_order():
+    mod = _load_module("http_client_test", "premafirm_ai_engine/services/http_client.py")
+    release = threading.Event()
+    requested = []
+
+    class FakeSession:
+        def get(self, url, timeout=20):
+            requested.append(url)
+            release.wait(2)
+            return SimpleNamespace(status_code=200, raise_for_status=lambda: None, json=lambda: {"url": url})
+
+    client = mod.HttpClient(max_workers=4)
+    client._session = FakeSession()
+    threading.Timer(0.1, release.set).start()
+
+    results = client.fetch_many(["u1", "u2", "u1", "u3"])
+
+    assert [r["url"] for r in results] == ["u1", "u2", "u1", "u3"]
+    assert sorted(requested) == ["u1", "u2", "u3"]
+
+    same = []
+    release.clear()
+    workers = [threading.Thread(target=lambda: same.append(client.get_json("u4"))) for _ in range(3)]
+    for worker in workers:
+        worker.start()
+    threading.Timer(0.1, release.set).start()
+    for worker in workers:
+        worker.join()
+    assert requested.count("u4") == 1 and len(same) == 3
+
+
+def test_http_client_retries_only_throttling_server_and_connection_errors(monkeypatch):
+    mod = _load_module("http_client_retry_test", "premafirm_ai_engine/services/http_client.py")
+    sleeps = []
+    monkeypatch.setattr(mod.time, "sleep", sleeps.append)
+
+    class FakeSession:
+        def __init__(self, answers):
+            self.answers = list(answers)
+            self.calls = 0
+
+        def get(self, url, timeout=20):
+            self.calls += 1
+            answer = self.answers.pop(0)
+            if isinstance(answer, Exception):
+                raise answer
+            return SimpleNamespace(status_code=answer, headers={"Retry-After": "3"}, json=lambda: {"status": answer})
+
+    client = mod.HttpClient(retries=3, backoff=0.5)
+    for status in (400, 401, 404, 422):
+        client._session = FakeSession([status, 200])
+        assert client.get_json("u") is None
+        assert client._session.calls == 1
+    assert sleeps == []
+
+    client._session = FakeSession([429, 503, 200])
+    assert client.get_json("u") == {"status": 200}
+    assert sleeps == [3.0, 6.0]
+
+    sleeps.clear()
+    client._session = FakeSession([ConnectionError("reset"), 502, 500])
+    assert client.get_json("u") is None
+    assert client._session.calls == 3 and sleeps == [0.5, 1.0]
+
+
+def test_token_bucket_blocks_once_burst_is_spent():
+    mod = _load_module("http_client_bucket_test", "premafirm_ai_engine/services/http_client.py")
+    bucket = mod.TokenBucket(60, capacity=2)
+
+    assert bucket.acquire(timeout=0) and bucket.acquire(timeout=0)
+    assert not bucket.acquire(timeout=0)
+
+
+def _fake_matrix_get(requested):
+    def fake_safe_get(url, timeout=20):
+        path, query = url.split("mapbox/driving-traffic/", 1)[1].split("?", 1)
+        coords = [tuple(float(v) for v in pair.split(",")) for pair in path.split(";")]
+        params = dict(part.split("=", 1) for part in query.split("&"))
+        sources = [int(v) for v in params["sources"].split(";")] if "sources" in params else list(range(len(coords)))
+        destinations = [int(v) for v in params["destinations"].split(";")] if "destinations" in params else list(range(len(coords)))
+        requested.append(len(coords))
+        return {
+            "distances": [[abs(coords[s][0] - coords[d][0]) * 100000.0 for d in destinations] for s in sources],
+            "durations": [[abs(coords[s][0] - coords[d][0]) * 3600.0 for d in destinations] for s in sources],
+        }
+
+    return fake_safe_get
+
+
+def test_route_matrix_serves_trip_segments_from_one_matrix_call():
+    mod = _load_module("mapbox_service_matrix_test", "premafirm_ai_engine/services/mapbox_service.py")
+    matrix_mod = _load_module("route_matrix_test", "premafirm_ai_engine/services/route_matrix.py")
+    svc = mod.MapboxService({"ir.config_parameter": FakeConfig()})
+    requested = []
+    svc.geocode_many = lambda addresses: [_fake_geocode(address) for address in addresses]
+    svc._safe_get = _fake_matrix_get(requested)
+    stops = [SimpleNamespace(address="A"), SimpleNamespace(address="B"), SimpleNamespace(address="C")]
+
+    matrix = matrix_mod.RouteMatrix.for_stops(svc, "Home", stops)
+    segments = matrix.trip_segments("Home", list(reversed(stops)), return_home=True)
+
+    assert requested == [4]
+    assert [seg["to"] for seg in segments] == ["C", "B", "A", "Home"]
+    assert round(segments[0]["distance_km"], 3) == round(abs(-79.70 - -75.70) * 100.0, 3)
+    assert round(segments[1]["drive_hours"], 6) == round(abs(-75.70 - -79.60), 6)
+
+
+def test_route_matrix_uses_traffic_profile_within_its_coordinate_limit():
+    mod = _load_module("mapbox_service_matrix_traffic_test", "premafirm_ai_engine/services/mapbox_service.py")
+    matrix_mod = _load_module("route_matrix_traffic_test", "premafirm_ai_engine/services/route_matrix.py")
+    svc = mod.MapboxService({"ir.config_parameter": FakeConfig()})
+    requested = []
+    fetch = _fake_matrix_get(requested)
+    urls = []
+    svc.geocode_many = lambda addresses: [
+        {"latitude": 43.0, "longitude": -80.0 + idx * 0.1, "country_code": "CA", "full_address": address}
+        for idx, address in enumerate(addresses)
+    ]
+    svc._safe_get = lambda url, timeout=20: urls.append(url) or fetch(url, timeout=timeout)
+
+    matrix = matrix_mod.RouteMatrix(svc, [f"Stop {idx}" for idx in range(12)])
+
+    assert all("/mapbox/driving-traffic/" in url for url in urls)
+    assert requested and all(size <= 10 for size in requested)
+    assert round(matrix.leg("Stop 0", "Stop 11")[0], 3) == round(1.1 * 100.0, 3)
+
+
+def test_route_matrix_chunks_large_coordinate_sets_into_blocks():
+    mod = _load_module("mapbox_service_matrix_chunk_test", "premafirm_ai_engine/services/mapbox_service.py")
+    matrix_mod = _load_module("route_matrix_chunk_test", "premafirm_ai_engine/services/route_matrix.py")
+    svc = mod.MapboxService({"ir.config_parameter": FakeConfig()})
+    requested = []
+    svc.geocode_many = lambda addresses: [_fake_geocode(address) for address in addresses]
+    svc._safe_get = _fake_matrix_get(requested)
+    matrix_mod.RouteMatrix.MAX_COORDINATES = 3
+
+    matrix = matrix_mod.RouteMatrix(svc, ["Home", "A", "B", "C"])
+
+    assert all(size <= 3 for size in requested) and len(requested) == 16
+    assert not any(warning for row in matrix.warnings for warning in row)
+    assert round(matrix.leg("A", "C")[0], 3) == round(abs(-79.40 - -75.70) * 100.0, 3)
@@ -0,0 +1,261 @@
+import importlib.util
+import itertools
+import random
+import sys
+from pathlib import Path
+from types import ModuleType
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+ADDON_PACKAGE = "premafirm_ai_engine"
+
+
+def _install_addon_packages():
+    # Bare addon packages: addon modules resolve their relative imports from disk
+    # without running the Odoo-dependent __init__ files. Modules of earlier loads
+    # are dropped so each load gets fresh siblings bound to the current fakes.
+    for name in [name for name in sys.modules if name.startswith(f"{ADDON_PACKAGE}.")]:
+        del sys.modules[name]
+    for name in (ADDON_PACKAGE, f"{ADDON_PACKAGE}.models", f"{ADDON_PACKAGE}.services"):
+        package = ModuleType(name)
+        package.__path__ = [str(ROOT.joinpath(*name.split(".")))]
+        sys.modules[name] = package
+
+
+def _load_module(name, rel_path):
+    _install_addon_packages()
+    path = ROOT / rel_path
+    qualified = f"{ADDON_PACKAGE}.{path.parent.name}.{path.stem}"
+    spec = importlib.util.spec_from_file_location(qualified, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = sys.modules[qualified] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def _simulate(distances, durations, route, cargo_deltas):
+    # Mirrors RunPlannerService.simulate_run totals: no return leg, empty when nothing on board.
+    cargo = 0
+    total_km = total_hours = empty_km = 0.0
+    for k in range(1, len(route)):
+        km = distances[route[k - 1]][route[k]]
+        total_km += km
+        total_hours += durations[route[k - 1]][route[k]]
+        if cargo <= 0:
+            empty_km += km
+        cargo += cargo_deltas[k - 1]
+    return total_km, total_hours, empty_km
+
+
+def test_insertion_evaluator_matches_full_simulation_for_every_candidate():
+    mod = _load_module("route_optimizer_delta_test", "premafirm_ai_engine/services/route_optimizer.py")
+    rng = random.Random(7)
+    size = 12
+    distances = [[0.0 if a == b else rng.uniform(5, 300) for b in range(size)] for a in range(size)]
+    durations = [[distances[a][b] / rng.uniform(50, 90) for b in range(size)] for a in range(size)]
+    base = [0, 1, 2, 3, 4, 5, 6, 7, 8, 9]
+    base_deltas = [1, -1, 1, 1, -1, -1, -1, 1, -1]
+    pickup, delivery = 10, 11
+
+    evaluator = mod.InsertionEvaluator(distances, durations, base, base_deltas)
+    for i in range(0, len(base)):
+        for j in range(i + 1, len(base) + 1):
+            stops = list(zip(base[1:], base_deltas))
+            stops.insert(i, (pickup, 1))
+            stops.insert(j, (delivery, -1))
+            expected = _simulate(distances, durations, [0] + [node for node, _d in stops], [d for _node, d in stops])
+            got = evaluator.evaluate(pickup, delivery, 1, -1, i, j)
+            assert abs(got["total_distance_km"] - expected[0]) < 1e-6
+            assert abs(got["total_drive_hours"] - expected[1]) < 1e-6
+            assert abs(got["empty_distance_km"] - expected[2]) < 1e-6
+
+
+def _schedule_ok(durations, route, specs, capacity):
+    # Brute-force check of windows and capacity for one stop order (specs aligned with route[1:]).
+    clock = 0.0
+    on_board = [0.0] * len(capacity)
+    for k in range(1, len(route)):
+        start, end, service, load = specs[k - 1]
+        clock = max(clock + durations[route[k - 1]][route[k]], start if start is not None else clock)
+        if end is not None and clock > end + 1e-9:
+            return False
+        clock += service
+        on_board = [value + extra for value, extra in zip(on_board, load)]
+        if any(limit and value > limit + 1e-9 for value, limit in zip(on_board, capacity)):
+            return False
+    return True
+
+
+def test_insertion_feasibility_yields_exactly_the_feasible_pairs():
+    mod = _load_module("route_optimizer_feasibility_test", "premafirm_ai_engine/services/route_optimizer.py")
+    rng = random.Random(11)
+    checked = 0
+    for _round in range(40):
+        size = 9
+        points = [(rng.uniform(0, 6), rng.uniform(0, 6)) for _ in range(size)]
+        durations = [[((ax - bx) ** 2 + (ay - by) ** 2) ** 0.5 for bx, by in points] for ax, ay in points]
+        route = list(range(7))
+        specs = []
+        clock = 0.0
+        for k in range(1, len(route)):
+            # Windows are drawn around a feasible base schedule so the base run itself is valid.
+            clock += durations[route[k - 1]][route[k]]
+            start = rng.choice([None, clock + rng.uniform(-2, 1)])
+            end = rng.choice([None, max(clock, start or 0.0) + rng.uniform(0, 3)])
+            clock = max(clock, start or clock) + 0.5
+            specs.append((start, end, 0.5, (rng.choice([1, -1]) * rng.randint(0, 2), 0.0)))
+        capacity = (6.0, 0.0)
+        pickup_start = rng.choice([None, rng.uniform(0, 8)])
+        pickup_spec = (pickup_start, (pickup_start or 0.0) + rng.uniform(2, 14), 0.5, (2.0, 0.0))
+        delivery_spec = (None, rng.choice([None, rng.uniform(8, 30)]), 0.5, (-2.0, 0.0))
+        if not _schedule_ok(durations, route, specs, capacity):
+            continue
+
+        feasibility = mod.InsertionFeasibility(
+            durations, route, [s[2] for s in specs], [s[0] for s in specs], [s[1] for s in specs], [s[3] for s in specs], capacity
+        )
+        got = set(feasibility.feasible_pairs(7, 8, pickup_spec, delivery_spec))
+
+        expected = set()
+        for i in range(0, len(route)):
+            for j in range(i + 1, len(route) + 1):
+                nodes = list(zip(route[1:], specs))
+                nodes.insert(i, (7, pickup_spec))
+                nodes.insert(j, (8, delivery_spec))
+                if _schedule_ok(durations, [0] + [n for n, _s in nodes], [s for _n, s in nodes], capacity):
+                    expected.add((i, j))
+        assert got == expected
+        checked += bool(expected) and len(expected) < (len(route) * (len(route) + 1)) // 2
+    assert checked >= 5
+
+
+def _best_fleet_plan(solver, vehicle_keys, request_keys):
+    # Exhaustive (served, score) optimum: every request -> vehicle or unassigned, every stop order.
+    best = (-1, float("-inf"))
+    for assignment in itertools.product([None] + vehicle_keys, repeat=len(request_keys)):
+        served, score = 0, 0.0
+        for vehicle_key in vehicle_keys:
+            mine = [key for key, owner in zip(request_keys, assignment) if owner == vehicle_key]
+            stop_keys = [stop for key in mine for stop in solver.requests[key]["stops"]]
+            route_best = None
+            for order in itertools.permutations(stop_keys):
+                if not solver._precedence_ok(order):
+                    continue
+                totals = solver._evaluate(vehicle_key, list(order))
+                if totals is not None and (route_best is None or totals["score"] > route_best):
+                    route_best = totals["score"]
+            if route_best is None:
+                break
+            served += len(mine)
+            score += route_best
+        else:
+            best = max(best, (served, score))
+    return best
+
+
+def test_fleet_solver_plans_are_feasible_and_mostly_optimal():
+    mod = _load_module("route_optimizer_fleet_test", "premafirm_ai_engine/services/route_optimizer.py")
+    optimal = 0
+    rounds = 40
+    for seed in range(rounds):
+        rng = random.Random(seed)
+        points = [(rng.uniform(0, 300), rng.uniform(0, 300)) for _ in range(8)]
+        distances = [[((ax - bx) ** 2 + (ay - by) ** 2) ** 0.5 for bx, by in points] for ax, ay in points]
+        durations = [[value / 70.0 for value in row] for row in distances]
+        vehicles = [
+            {"key": "truck-a", "home": 0, "start": 0.0, "capacity": (6, 0), "drive_hours": 9.0, "on_duty_hours": 14.0},
+            {"key": "truck-b", "home": 1, "start": 1.0, "capacity": (10, 0), "drive_hours": 9.0, "on_duty_hours": 14.0},
+        ]
+        stops, requests = {}, []
+        for idx in range(3):
+            pallets = rng.choice([2, 4, 6])
+            ready = rng.uniform(0, 4)
+            stops[f"p{idx}"] = {"node": 2 + 2 * idx, "service_hours": 0.5, "window_start": ready, "window_end": ready + rng.uniform(1, 6), "load": (pallets, 0), "cargo_delta": 1}
+            stops[f"d{idx}"] = {"node": 3 + 2 * idx, "service_hours": 0.5, "window_start": None, "window_end": ready + rng.uniform(4, 12), "load": (-pallets, 0), "cargo_delta": -1}
+            requests.append({"key": idx, "stops": [f"p{idx}", f"d{idx}"], "revenue": rng.uniform(200, 900)})
+
+        construction = mod.FleetSolver(distances, durations, vehicles, stops, requests, time_budget=0).solve()
+        solver = mod.FleetSolver(distances, durations, vehicles, stops, requests, time_budget=5.0)
+        plan = solver.solve()
+
+        for route in plan["routes"].values():
+            assert route["totals"] is not None
+            assert solver._precedence_ok(route["stops"])
+        placed = [solver.request_of[stop] for route in plan["routes"].values() for stop in route["stops"]]
+        assert len(placed) == 2 * plan["served"]
+        assert sorted(set(placed) | set(plan["unassigned"])) == [0, 1, 2]
+        assert not plan["timed_out"]
+        # Local search never gives up a served load or profit.
+        assert (plan["served"], plan["score"]) >= (construction["served"], construction["score"] - 1e-6)
+        best_served, best_score = _best_fleet_plan(solver, ["truck-a", "truck-b"], [0, 1, 2])
+        assert plan["served"] <= best_served
+        if plan["served"] == best_served and abs(plan["score"] - best_score) < 1e-6:
+            optimal += 1
+    assert optimal >= rounds * 0.9
+
+
+def _insertion_task(rng, key):
+    size = 9
+    points = [(rng.uniform(0, 150), rng.uniform(0, 150)) for _ in range(size)]
+    distances = [[((ax - bx) ** 2 + (ay - by) ** 2) ** 0.5 for bx, by in points] for ax, ay in points]
+    durations = [[value / 70.0 for value in row] for row in distances]
+
+    def stop(node, delta, window_start=None, window_end=None):
+        return {"node": node, "service_hours": 0.5, "window_start": window_start, "window_end": window_end, "load": (2 * delta, 500.0 * delta), "cargo_delta": delta}
+
+    stops = [stop(1, 1), stop(2, -1, None, rng.uniform(8, 14)), stop(3, 1, rng.uniform(2, 5)), stop(4, 1), stop(5, -1), stop(6, -1, None, rng.uniform(12, 18))]
+    return {
+        "key": key,
+        "distances": distances,
+        "durations": durations,
+        "vehicle": {"home": 0, "start": 0.0, "capacity": (rng.choice([6, 8]), 0), "drive_hours": 13.0, "on_duty_hours": 16.0},
+        "stops": stops,
+        "pickup": stop(7, 1, None, rng.uniform(6, 14)),
+        "delivery": stop(8, -1),
+        "revenue": 750.0,
+        "cost_per_km": 1.65,
+        "deadhead_weight": 0.35,
+        "top_k": 3,
+    }
+
+
+def test_rank_insertions_returns_best_feasible_candidates_in_and_out_of_process():
+    pool_mod = _load_module("process_pool_test", "premafirm_ai_engine/services/process_pool.py")
+    mod = _load_module("route_optimizer_pool_test", "premafirm_ai_engine/services/route_optimizer.py")
+    rng = random.Random(11)
+    tasks = [_insertion_task(rng, key) for key in range(12)]
+
+    sequential = [mod.rank_insertions(task) for task in tasks]
+    pool = pool_mod.shared_pool("insertion", 3, "fork")
+    try:
+        assert pool._mp_context.get_start_method() == "forkserver"
+        # Fails loudly (no in-process fallback) if a fresh worker cannot import the module.
+        assert pool.submit(mod.rank_insertions, tasks[0]).result(timeout=60) == sequential[0]
+        assert mod.rank_insertions_many(tasks, executor=pool) == sequential
+        assert pool_mod.shared_pool("insertion", 3) is pool
+    finally:
+        pool_mod.terminate_pool(pool)
+    assert pool_mod.shared_pool("insertion", 3) is not pool
+    pool_mod.shutdown_pools()
+    assert mod.rank_insertions_many(tasks) == sequential
+
+    for task, result in zip(tasks, sequential):
+        assert result["key"] == task["key"]
+        base = mod.simulate_route(task["distances"], task["durations"], task["vehicle"], task["stops"], stop_on_violation=False)
+        expected = []
+        n = len(task["stops"])
+        for i in range(n + 1):
+            for j in range(i + 1, n + 2):
+                candidate = list(task["stops"])
+                candidate.insert(i, task["pickup"])
+                candidate.insert(j, task["delivery"])
+                totals = mod.simulate_route(task["distances"], task["durations"], task["vehicle"], candidate)
+                if totals["feasible"]:
+                    expected.append(mod.score_insertion(base, totals, 750.0, 1.65, 0.35)[0])
+        expected.sort(reverse=True)
+        got = [option["score"] for option in result["options"]]
+        assert got == sorted(got, reverse=True)
+        assert [round(value, 6) for value in got] == [round(value, 6) for value in expected[: len(got)]]
+        assert len(got) == min(3, len(expected))
+    assert sum(1 for result in sequential if result["options"]) >= 4
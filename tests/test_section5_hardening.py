@@ -18,11 +18,29 @@ def _install_base_fakes():
     sys.modules["psycopg2"] = psycopg2
 
 
+ADDON_PACKAGE = "premafirm_ai_engine"
+
+
+def _install_addon_packages():
+    # Bare addon packages: addon modules resolve their relative imports from disk
+    # without running the Odoo-dependent __init__ files. Modules of earlier loads
+    # are dropped so each load gets fresh siblings bound to the current fakes.
+    for name in [name for name in sys.modules if name.startswith(f"{ADDON_PACKAGE}.")]:
+        del sys.modules[name]
+    for name in (ADDON_PACKAGE, f"{ADDON_PACKAGE}.models", f"{ADDON_PACKAGE}.services"):
+        package = ModuleType(name)
+        package.__path__ = [str(ROOT.joinpath(*name.split(".")))]
+        sys.modules[name] = package
+
+
 def _load_module(name, rel_path):
     _install_base_fakes()
-    spec = importlib.util.spec_from_file_location(name, ROOT / rel_path)
+    _install_addon_packages()
+    path = ROOT / rel_path
+    qualified = f"{ADDON_PACKAGE}.{path.parent.name}.{path.stem}" if path.parent.parent.name == ADDON_PACKAGE else name
+    spec = importlib.util.spec_from_file_location(qualified, path)
     module = importlib.util.module_from_spec(spec)
-    sys.modules[name] = module
+    sys.modules[name] = sys.modules[qualified] = module
     spec.loader.exec_module(module)
     return module
 
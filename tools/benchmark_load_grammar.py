@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""Micro-benchmark of the compiled load grammar against the per-call regex parsing it replaced.
+
+    python tools/benchmark_load_grammar.py [--repeat N] [--fuzz N]
+
+Every sample broker text (hand-written samples plus seeded random ones) is first
+parsed both ways and must give the same sections and commercial terms; then both
+are timed.
+"""
+import argparse
+import random
+import re
+import sys
+import timeit
+from importlib.util import module_from_spec, spec_from_file_location
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+GRAMMAR_FILE = ROOT / "premafirm_ai_engine" / "services" / "load_grammar.py"
+
+TERMS_AND_CONDITIONS = "\n".join(
+    f"{idx}. Carrier shall not broker, re-broker or subcontract this shipment. Detention is billed after two hours "
+    f"and requires signed in/out times. Claims are settled at the declared value per pound."
+    for idx in range(1, 41)
+)
+
+SAMPLES = [
+    """Purchase Order
+Pickup Address: 55 Commerce Park Dr, Barrie, ON
+Delivery Address: 6350 Tomken Rd, Mississauga, ON
+Pallets: 8
+Total Weight: 9115 lbs
+""",
+    """
+LOAD #1
+Pickup Information
+Barrie, ON
+
+Delivery Information
+Mississauga, ON
+
+Pallets: 8
+Weight: 9115 lbs
+""",
+    """RATE CONFIRMATION
+Load #: PF-20931   Customer PO #: 4500123
+LOAD #1
+Ship From: Acme Foods, 12 King St W, Toronto, ON
+Pickup Date: 2026-02-18
+Ship To: Metro DC, 400 Industrial Pkwy, Ottawa, ON
+Delivery Date: 2026/02/19
+# of Pallets: 12
+Pallet Size: 48x40
+Total Weight: 14,200
+Reefer: -18
+LOAD #2
+Shipper (Plant 2): 88 Bay St, Hamilton, ON
+Consignee - 9 Rue Principale, Montreal, QC
+Due Date: 2026-02-20
+Pallets - 4
+Weight: 3,100
+Line haul: $2,450.00  Fuel $310
+TONU $250 if cancelled after dispatch. Pallet jack required at delivery.
+"""
+    + TERMS_AND_CONDITIONS,
+    """Hi team,
+Can you quote this? Pickup: Barrie, ON  Delivery: Ottawa, ON
+All in $1,900, temp 4, 10 pallets, 9000 lbs.
+PO number: A-778
+Thanks
+""",
+    """LOAD NO. 3
+Origin
+   Brampton, ON
+Destination:
+Kingston, ON
+Drop Date: 03/04/2026
+Temporary road closure on Hwy 401, see notes. Rate: 2200 rate $2,350
+Receiver
+""",
+    """  LOAD 7
+Delivery Date - 2026-05-01
+Pickup Location (dock 4): 1 Dock Rd, Vaughan, ON
+Delivery Location: 2 Port Rd, Oshawa, ON
+Weight (lbs): 2,000
+Pump truck needed, detention applies. Customer PO 99-A
+""",
+]
+
+_FUZZ_LINES = [
+    "LOAD #{n}",
+    "Load {n}",
+    "load no. {n}",
+    "Pickup: {city}",
+    "Pickup Address:\n{city}",
+    "Pickup Information\n\n{city}",
+    "Shipper - {city}",
+    "Ship From: {city}",
+    "Origin {city}",
+    "Delivery: {city}",
+    "Delivery Address: {city}",
+    "Delivery Date: 2026-0{n}-1{n}",
+    "Drop: {city}",
+    "Drop Date: 2026-01-0{n}",
+    "Consignee\n{city}",
+    "Ship To: {city}",
+    "Receiver (main dock): {city}",
+    "Pallets: {n}",
+    "# of Pallets: {n}",
+    "Pallet Size: 48x40",
+    "Total Weight: {n},500 lbs",
+    "Weight - {n}000",
+    "Rate: ${n},200",
+    "All in {n}900",
+    "line haul: {n}00 plus $1{n}5 fuel",
+    "TONU applies, detention after 2h",
+    "Reefer temp: -{n}",
+    "Temperature = {n}.5",
+    "Customer PO #: PO-{n}",
+    "PO no. {n}-X",
+    "Pallet jack and pump truck on site",
+    "Please call dispatch on arrival.",
+    "",
+]
+_FUZZ_CITIES = ["Barrie, ON", "Mississauga, ON", "Ottawa, ON", "Montreal, QC", "55 Commerce Park Dr, Barrie, ON"]
+
+
+def fuzz_samples(count, seed=7):
+    """``count`` random broker-like texts built from label, term and filler lines."""
+    rng = random.Random(seed)
+    samples = []
+    for _ in range(count):
+        lines = [
+            rng.choice(_FUZZ_LINES).format(n=rng.randint(1, 9), city=rng.choice(_FUZZ_CITIES))
+            for _ in range(rng.randint(3, 25))
+        ]
+        samples.append(rng.choice(["\n", "\n\n", "\r\n", "  \n"]).join(lines))
+    return samples
+
+
+def load_grammar():
+    spec = spec_from_file_location("load_grammar", GRAMMAR_FILE)
+    module = module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# The parsing the grammar replaced: every field searches its section with freshly
+# joined label patterns, and every term re-scans the whole text.
+_LEGACY_FIELDS = ["pickup", "delivery", "delivery_date", "pallets", "pallet_size", "weight"]
+_LEGACY_TERMS = {
+    "rate": [r"(?:rate|line\s*haul|all\s*in)\s*[:$]?\s*(\d+(?:,\d{3})*(?:\.\d+)?)", r"\$(\d+(?:,\d{3})*(?:\.\d+)?)"],
+    "tonu": [r"\btonu\b"],
+    "detention": [r"\bdetention\b"],
+    "pump_truck": [r"pump\s*truck|pallet\s*jack"],
+    "reefer_temp": [r"(?:reefer|temp(?:erature)?)\s*[:=-]?\s*([-+]?\d+(?:\.\d+)?)"],
+    "pallets": [r"(?:#\s*of\s*pallets|pallets?)\s*[:=-]?\s*(\d+(?:\.\d+)?)"],
+    "weight": [r"(?:weight|lbs?)\s*[:=-]?\s*(\d+(?:,\d{3})*(?:\.\d+)?)"],
+    "load_number": [r"load\s*(?:#|number|no\.?)\s*[:=-]?\s*([A-Za-z0-9-]+)"],
+    "customer_po": [r"(?:customer\s*)?po\s*(?:#|number|no\.?)\s*[:=-]?\s*([A-Za-z0-9-]+)"],
+}
+
+
+def legacy_sections(grammar, text):
+    labels = {
+        "pickup": grammar.PICKUP_LABELS,
+        "delivery": grammar.DELIVERY_LABELS,
+        "delivery_date": grammar.DELIVERY_DATE_LABELS,
+        "pallets": grammar.PALLET_LABELS,
+        "pallet_size": grammar.PALLET_SIZE_LABELS,
+        "weight": grammar.WEIGHT_LABELS,
+    }
+    markers = list(re.finditer(grammar.LOAD_MARKER_PATTERN, text))
+    blocks = [
+        (marker.group(1), text[marker.start():markers[idx + 1].start() if idx + 1 < len(markers) else len(text)].strip())
+        for idx, marker in enumerate(markers)
+    ]
+    if not blocks and text.strip():
+        blocks = [(None, text.strip())]
+    sections = []
+    for label, block in blocks:
+        fields = {}
+        for name in _LEGACY_FIELDS:
+            fields[name] = None
+            for pattern in grammar.labeled_value_patterns(labels[name]):
+                match = re.search(pattern, block, re.I)
+                if match:
+                    fields[name] = (match.group(1) or "").strip()
+                    break
+        sections.append((label, fields))
+    return sections
+
+
+def legacy_terms(text):
+    terms = {}
+    for name, patterns in _LEGACY_TERMS.items():
+        matches = []
+        for pattern in patterns:
+            matches.extend(re.finditer(pattern, text, re.I))
+        if name in ("tonu", "detention", "pump_truck"):
+            terms[name] = bool(matches)
+        else:
+            terms[name] = matches[-1].group(1).strip() if matches else None
+    return terms
+
+
+def grammar_parse(grammar, text):
+    positions = grammar.scan(text)
+    sections = [(section["label"], section["fields"]) for section in grammar.load_sections(text, positions)]
+    return sections, grammar.commercial_terms(text, positions)
+
+
+def legacy_parse(grammar, text):
+    return legacy_sections(grammar, text), legacy_terms(text)
+
+
+def mismatches(grammar, texts):
+    """Texts the grammar parses differently from the legacy regexes."""
+    return [text for text in texts if grammar_parse(grammar, text) != legacy_parse(grammar, text)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=200, help="timed passes over the corpus")
+    parser.add_argument("--fuzz", type=int, default=200, help="random sample texts added to the corpus")
+    args = parser.parse_args()
+
+    grammar = load_grammar()
+    corpus = SAMPLES + fuzz_samples(args.fuzz)
+    different = mismatches(grammar, corpus)
+    if different:
+        print(f"{len(different)} of {len(corpus)} texts parse differently, first one:\n{different[0]!r}")
+        return 1
+
+    chars = sum(len(text) for text in corpus)
+    print(f"corpus: {len(corpus)} texts, {chars} characters; results identical")
+    timings = {}
+    for name, parse in (("legacy regexes", legacy_parse), ("compiled grammar", grammar_parse)):
+        seconds = min(timeit.repeat(lambda: [parse(grammar, text) for text in corpus], number=args.repeat, repeat=3))
+        timings[name] = seconds / args.repeat / len(corpus)
+        print(f"{name:>17}: {timings[name] * 1e6:9.1f} µs per text")
+    print(f"{'speed-up':>17}: {timings['legacy regexes'] / timings['compiled grammar']:9.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())